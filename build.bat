@@ -9,7 +9,7 @@ for /f %%i in ('git describe --tags --exact-match 2^>nul') do set VERSION=%%i
 if "%VERSION%"=="" (
     for /f %%i in ('git rev-parse --short HEAD') do set VERSION=%%i
 )
-echo VERSION = "%VERSION%" > src\version.py
+echo VERSION = "%VERSION%" > ssmports\version.py
 
 echo Building executable...
 pyinstaller ssmports.spec
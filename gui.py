@@ -8,14 +8,18 @@ import webbrowser
 import os
 import re
 import subprocess
+from datetime import datetime, timezone
 
-from src.aws_sessions import AWSSessions
-from src.forwarder import SSMPortForwarder
-from src.config_loader import ConfigLoader
-from src.checker import ConfigChecker
+from ssmports.config_loader import ConfigLoader
+from ssmports.config_watcher import ConfigWatcher
+from ssmports.controller import TunnelController
+from ssmports.daemon import DaemonClient, RemoteForwarder
+from ssmports.http_api import HttpApiServer
+from ssmports.checker import ConfigChecker
+from ssmports import tracing
 
 try:
-    from src.version import VERSION
+    from ssmports.version import VERSION
 except ImportError:
     VERSION = ""
 
@@ -60,26 +64,82 @@ class SSMPortForwarderGUI:
         self.root.geometry("800x600")
         self.root.iconbitmap(resource_path("ssmports.ico"))
         self.checker = ConfigChecker()
-        self.aws_sessions: AWSSessions | None = None
-        self.forwarder = SSMPortForwarder(logger)
-        self.connections = {}
-        self.active_session_ids = {}  # label -> session_id
+        self.log_queue = queue.Queue()
+        self.logger = logging.getLogger()
+        handler = TextWidgetHandler(self.log_queue)
+        self.logger.addHandler(handler)
+        # Kept for the lifetime of the app, so reloads reuse validated sessions and resolved IDs
+        self.config_loader = ConfigLoader("sessions.json")
+        # With a running 'ssmports daemon' the GUI only shows and controls its tunnels
+        self.daemon_client = DaemonClient() if DaemonClient.available() else None
+        self.controller = TunnelController(
+            config_loader=self.config_loader,
+            logger=self.logger,
+            forwarder=(
+                RemoteForwarder(self.daemon_client) if self.daemon_client else None
+            ),
+        )
+        self.config_watcher: ConfigWatcher | None = None
+        self.metrics_server: HttpApiServer | None = None
         self.buttons = {}  # label -> {start_btn, stop_btn}
+        self.rows = {}  # label -> row frame
+        self.connection_errors = (
+            {}
+        )  # label -> error found while resolving in the background
+        self.credential_errors = (
+            {}
+        )  # profile -> error of the background credential check
         self.group_frames = (
             {}
         )  # group_label -> {'frame': sub_frame, 'label': toggle_label, 'connections': [labels]}
-        self.ssm_clients = {}
         self._autostart_triggered = False
-        self.log_queue = queue.Queue()
-        self.logger = logging.getLogger()
-        handler = TextWidgetHandler(self.log_queue)
-        self.logger.addHandler(handler)
         self._setup_ui()
-        self._load_config()
+        self.controller.add_listener(
+            lambda label, state: self.root.after(
+                0, self._on_session_state, label, state
+            )
+        )
+        self.controller.add_credential_listener(
+            lambda profile, state, expiry: self.root.after(
+                0, self._on_credentials_changed, profile, state, expiry
+            )
+        )
+        self.config_loader.aws_sessions.add_listener(
+            lambda profile, error: self.root.after(
+                0, self._show_credential_error, profile, error
+            )
+        )
+        if self._load_config():
+            self._start_metrics_server()
         self._render_connections()
         self.root.after(0, self._autostart_sessions)
         self.root.after(100, self._process_logs)
 
+    @property
+    def connections(self):
+        return self.controller.connections
+
+    @property
+    def app_config(self):
+        return self.controller.app_config
+
+    @property
+    def active_session_ids(self):
+        return self.controller.active_session_ids
+
+    def _on_credentials_changed(self, profile, state, expiry):
+        """The controller logs credential changes and restarts the tunnels, expiring ones are also shown"""
+        if state != "expiring":
+            return
+        minutes = max(
+            0, int((expiry - datetime.now(timezone.utc)).total_seconds() // 60)
+        )
+        messagebox.showwarning(
+            "AWS credentials expiring",
+            f"The AWS credentials of profile '{profile}' expire in {minutes} minutes. "
+            "Refresh them to keep your tunnels running, they are picked up automatically.",
+        )
+
     def _setup_ui(self):
         # Top Controls Frame
         controls_frame = tk.Frame(self.root, padx=10, pady=5)
@@ -160,42 +220,219 @@ class SSMPortForwarderGUI:
 
     def _load_config(self):
         try:
-            config_path = "sessions.json"
-            loader = ConfigLoader(config_path)
-            config, self.aws_sessions = loader.load_config()
-            self.connections = config.get("connections", {})
-            abs_path = os.path.abspath(config_path)
-            self.logger.info(f"Got a successful configuration from: {abs_path}")
+            self.controller.load()
         except Exception as e:
-            self.logger.error(f"Error loading config: {e}")
-            if "(ExpiredToken)" in str(e):
-                messagebox.showerror(
-                    "Expired AWS token",
-                    "Your AWS credentials have expired. Please refresh your credentials, then reload the config",
-                )
-            else:
-                messagebox.showerror(
-                    "Configuration error", f"Failed to load configuration: {e}"
-                )
+            self._show_load_error(e)
+            return False
+        self._loaded()
+        if self.controller.remote:
+            self.logger.info(
+                f"Attached to the ssmports daemon, {len(self.active_session_ids)} tunnels running."
+            )
+        return True
+
+    def _loaded(self):
+        if self.controller.remote:
+            # The connections come from the daemon, resolving and credentials are up to it
+            return
+        abs_path = os.path.abspath(self.config_loader.config_path)
+        self.logger.info(f"Got a successful configuration from: {abs_path}")
+        self._update_config_watcher()
+        # Build the SSM clients now, so a Start click only pays for the API calls
+        self.controller.aws_sessions.prewarm(
+            {(c.get("profile"), c.get("region")) for c in self.connections.values()}
+        )
+        if self.app_config.get("lazy_load"):
+            self.config_loader.resolve_in_background(
+                {"connections": self.connections, "app_config": self.app_config},
+                on_done=lambda errors: self.root.after(
+                    0, self._show_connection_errors, errors
+                ),
+            )
+
+    def _start_metrics_server(self):
+        """Serve /metrics on http_api_port, read at startup only. An attached daemon serves its own."""
+        port = self.app_config.get("http_api_port")
+        if not port or self.controller.remote:
+            return
+        try:
+            self.metrics_server = HttpApiServer(
+                self.controller, port, metrics_only=True
+            )
+        except OSError as e:
+            self.logger.warning(f"Could not serve metrics on port {port}: {e}")
+            return
+        self.metrics_server.start()
+
+    def _show_load_error(self, e):
+        self.logger.error(f"Error loading config: {e}")
+        if "(ExpiredToken)" in str(e):
+            messagebox.showerror(
+                "Expired AWS token",
+                "Your AWS credentials have expired. Please refresh your credentials, then reload the config",
+            )
+        else:
+            messagebox.showerror(
+                "Configuration error", f"Failed to load configuration: {e}"
+            )
+
+    def _show_connection_errors(self, errors):
+        """Mark the connections that failed to resolve in the background, the others stay usable"""
+        for label, error in errors.items():
+            self.logger.error(f"[{label}] {error}")
+        marked = set(self.connection_errors) | set(errors)
+        self.connection_errors = errors
+        for label in marked:
+            if label in self.rows:
+                self._replace_connection_row(label)
+
+    def _show_credential_error(self, profile, error):
+        """Mark the connections of a profile whose credentials failed to validate, like connection_errors"""
+        if error:
+            self.credential_errors[profile] = error
+        elif not self.credential_errors.pop(profile, None):
+            return
+        for label, connection in self.connections.items():
+            if connection.get("profile") == profile and label in self.rows:
+                self._replace_connection_row(label)
+
+    def _update_config_watcher(self):
+        """Start or stop watching sessions.json, following the watch_config app setting"""
+        if self.app_config.get("watch_config") and not self.config_watcher:
+            self.config_watcher = ConfigWatcher(
+                self.config_loader.config_path,
+                on_change=lambda: self.root.after(0, self._on_config_file_changed),
+            )
+            self.config_watcher.start()
+            self.logger.info("Watching the configuration file for changes.")
+        elif not self.app_config.get("watch_config") and self.config_watcher:
+            self.config_watcher.stop()
+            self.config_watcher = None
+
+    def _on_config_file_changed(self):
+        self.logger.info("Configuration file changed, reloading...")
+        self._reload_config()
 
     def _reload_config(self):
-        # Stop all sessions before reloading if necessary, or just update the list
-        # For now, let's just reload the list. If a session is active, it stays active.
-        self._load_config()
-        # Sync active sessions from forwarder
-        self.active_session_ids = {
-            session.label: sid
-            for sid, session in self.forwarder.active_sessions.items()
-            if hasattr(session, "label")
+        # The controller stops and restarts tunnels, which blocks, so it reloads on a worker thread
+        threading.Thread(target=self._run_reload, daemon=True).start()
+
+    def _run_reload(self):
+        old_connections = self.connections
+        try:
+            diff = self.controller.reload()
+        except Exception as e:
+            self.root.after(0, self._show_load_error, e)
+            return
+        self.root.after(0, self._show_reload, old_connections, diff)
+
+    def _show_reload(self, old_connections, diff):
+        """Only the affected rows are redrawn, sessions of unchanged connections keep running"""
+        self._loaded()
+        if not diff.has_changes:
+            self.logger.info("Configuration reloaded, no changes.")
+            return
+        regroup = any(
+            old_connections[label].get("group") != self.connections[label].get("group")
+            for label in [*diff.changed, *diff.cosmetic]
+        )
+        if diff.added or diff.removed or regroup or self.controller.remote:
+            self._render_connections()
+        else:
+            for label in [*diff.changed, *diff.cosmetic]:
+                self._replace_connection_row(label)
+        self.logger.info(
+            f"Configuration reloaded: {len(diff.added)} added, {len(diff.removed)} removed, "
+            f"{len(diff.changed)} changed, {len(diff.cosmetic)} cosmetic changes."
+        )
+
+    def _create_connection_row(self, parent, conn_label, before=None):
+        config = self.connections[conn_label]
+        frame = tk.Frame(parent)
+        if before is not None:
+            frame.pack(fill="x", pady=2, before=before)
+        else:
+            frame.pack(fill="x", pady=2)
+
+        lbl = tk.Label(frame, text=conn_label, width=40, anchor="w")
+        if (
+            conn_label in self.connection_errors
+            or config.get("profile") in self.credential_errors
+        ):
+            lbl.config(fg="red")
+        lbl.pack(side="left")
+
+        port_lbl = tk.Label(
+            frame, text=f"Port {config['local_port']}", width=10, anchor="w"
+        )
+        port_lbl.pack(side="left")
+
+        start_btn = tk.Button(
+            frame,
+            text="Start",
+            width=10,
+            command=lambda l=conn_label: self._start_session(l),
+        )
+        start_btn.pack(side="left", padx=5)
+
+        stop_btn = tk.Button(
+            frame,
+            text="Stop",
+            width=10,
+            state="disabled",
+            command=lambda l=conn_label: self._stop_session(l),
+        )
+        stop_btn.pack(side="left", padx=5)
+
+        self.buttons[conn_label] = {
+            "start": start_btn,
+            "stop": stop_btn,
         }
-        self._render_connections()
-        self.logger.info("Configuration reloaded.")
+        self.rows[conn_label] = frame
+
+        # Link
+        if "link" in config:
+            link_template = config["link"]
+            actual_link = link_template.format(
+                local_port=config["local_port"], remote_port=config["remote_port"]
+            )
+            link_btn = tk.Label(
+                frame, text="Open Link", fg="blue", cursor="hand2", padx=5
+            )
+            link_btn.pack(side="left")
+            link_btn.bind("<Button-1>", lambda e, url=actual_link: webbrowser.open(url))
+
+            self.buttons[conn_label]["link"] = link_btn
+
+        # Command button if 'command' in config
+        if "command" in config:
+            cmd_template = config["command"]
+            actual_cmd = cmd_template.format(
+                local_port=config["local_port"], remote_port=config["remote_port"]
+            )
+            cmd_btn = tk.Button(
+                frame,
+                text="Run Command",
+                command=lambda c=actual_cmd: subprocess.Popen(c, shell=True),
+            )
+            cmd_btn.pack(side="left", padx=5)
+            self.buttons[conn_label]["command"] = cmd_btn
+
+        # If already active, starting or queued (on reload), update UI
+        self._update_ui_to_status(conn_label)
+        return frame
+
+    def _replace_connection_row(self, conn_label):
+        old_frame = self.rows[conn_label]
+        self._create_connection_row(old_frame.master, conn_label, before=old_frame)
+        old_frame.destroy()
 
     def _render_connections(self):
         # Clear existing connections
         for widget in self.connections_container.winfo_children():
             widget.destroy()
         self.buttons = {}
+        self.rows = {}
         self.group_frames = {}
 
         from collections import defaultdict
@@ -210,73 +447,7 @@ class SSMPortForwarderGUI:
 
         # Draw singles
         for conn_label in sorted(singles):
-            config = self.connections[conn_label]
-            frame = tk.Frame(self.connections_container)
-            frame.pack(fill="x", pady=2)
-
-            lbl = tk.Label(frame, text=conn_label, width=40, anchor="w")
-            lbl.pack(side="left")
-
-            port_lbl = tk.Label(
-                frame, text=f"Port {config['local_port']}", width=10, anchor="w"
-            )
-            port_lbl.pack(side="left")
-
-            start_btn = tk.Button(
-                frame,
-                text="Start",
-                width=10,
-                command=lambda l=conn_label: self._start_session(l),
-            )
-            start_btn.pack(side="left", padx=5)
-
-            stop_btn = tk.Button(
-                frame,
-                text="Stop",
-                width=10,
-                state="disabled",
-                command=lambda l=conn_label: self._stop_session(l),
-            )
-            stop_btn.pack(side="left", padx=5)
-
-            self.buttons[conn_label] = {
-                "start": start_btn,
-                "stop": stop_btn,
-            }
-
-            # Link
-            if "link" in config:
-                link_template = config["link"]
-                actual_link = link_template.format(
-                    local_port=config["local_port"], remote_port=config["remote_port"]
-                )
-                link_btn = tk.Label(
-                    frame, text="Open Link", fg="blue", cursor="hand2", padx=5
-                )
-                link_btn.pack(side="left")
-                link_btn.bind(
-                    "<Button-1>", lambda e, url=actual_link: webbrowser.open(url)
-                )
-
-                self.buttons[conn_label]["link"] = link_btn
-
-            # Command button if 'command' in config
-            if "command" in config:
-                cmd_template = config["command"]
-                actual_cmd = cmd_template.format(
-                    local_port=config["local_port"], remote_port=config["remote_port"]
-                )
-                cmd_btn = tk.Button(
-                    frame,
-                    text="Run Command",
-                    command=lambda c=actual_cmd: subprocess.Popen(c, shell=True),
-                )
-                cmd_btn.pack(side="left", padx=5)
-                self.buttons[conn_label]["command"] = cmd_btn
-
-            # If already active (on reload), update UI
-            if conn_label in self.active_session_ids:
-                self._update_ui_to_active(conn_label)
+            self._create_connection_row(self.connections_container, conn_label)
 
         # Draw groups
         for group_label in sorted(groups.keys()):
@@ -288,20 +459,34 @@ class SSMPortForwarderGUI:
             group_frame = tk.Frame(self.connections_container)
             group_frame.pack(fill="x", pady=2)
 
+            header_frame = tk.Frame(group_frame)
+            header_frame.pack(side="top", fill="x")
+
             arrow = "▼" if has_autostart else "▶"
             toggle_label = tk.Label(
-                group_frame,
+                header_frame,
                 text=f"{arrow} {group_label} ({len(conn_labels)})",
                 fg="blue",
                 cursor="hand2",
                 anchor="w",
                 font=("TkDefaultFont", 10, "underline"),
             )
-            toggle_label.pack(side="top", anchor="w")
+            toggle_label.pack(side="left", anchor="w")
             toggle_label.bind(
                 "<Button-1>", lambda e, gl=group_label: self._toggle_group(gl)
             )
 
+            tk.Button(
+                header_frame,
+                text="Stop group",
+                command=lambda gl=group_label: self._stop_group(gl),
+            ).pack(side="right", padx=5)
+            tk.Button(
+                header_frame,
+                text="Start group",
+                command=lambda gl=group_label: self._start_group(gl),
+            ).pack(side="right", padx=5)
+
             sub_frame = tk.Frame(group_frame)
             self.group_frames[group_label] = {
                 "frame": sub_frame,
@@ -310,79 +495,9 @@ class SSMPortForwarderGUI:
                 "expanded": has_autostart,
             }
 
-            # Draw connections in sub_frame
+            # Draw connections in sub_frame, left-aligned like non-grouped connections
             for cl in sorted(conn_labels):
-                config = self.connections[cl]
-                frame = tk.Frame(sub_frame)
-                frame.pack(
-                    fill="x", pady=2
-                )  # Left-aligned like non-grouped connections
-
-                lbl = tk.Label(frame, text=cl, width=40, anchor="w")
-                lbl.pack(side="left")
-
-                port_lbl = tk.Label(
-                    frame, text=f"Port {config['local_port']}", width=10, anchor="w"
-                )
-                port_lbl.pack(side="left")
-
-                start_btn = tk.Button(
-                    frame,
-                    text="Start",
-                    width=10,
-                    command=lambda l=cl: self._start_session(l),
-                )
-                start_btn.pack(side="left", padx=5)
-
-                stop_btn = tk.Button(
-                    frame,
-                    text="Stop",
-                    width=10,
-                    state="disabled",
-                    command=lambda l=cl: self._stop_session(l),
-                )
-                stop_btn.pack(side="left", padx=5)
-
-                self.buttons[cl] = {
-                    "start": start_btn,
-                    "stop": stop_btn,
-                }
-
-                # Link
-                if "link" in config:
-                    link_template = config["link"]
-                    actual_link = link_template.format(
-                        local_port=config["local_port"],
-                        remote_port=config["remote_port"],
-                    )
-                    link_btn = tk.Label(
-                        frame, text="Open Link", fg="blue", cursor="hand2", padx=5
-                    )
-                    link_btn.pack(side="left")
-                    link_btn.bind(
-                        "<Button-1>", lambda e, url=actual_link: webbrowser.open(url)
-                    )
-
-                    self.buttons[cl]["link"] = link_btn
-
-                # Command button if 'command' is in config
-                if "command" in config:
-                    cmd_template = config["command"]
-                    actual_cmd = cmd_template.format(
-                        local_port=config["local_port"],
-                        remote_port=config["remote_port"],
-                    )
-                    cmd_btn = tk.Button(
-                        frame,
-                        text="Run Command",
-                        command=lambda c=actual_cmd: subprocess.Popen(c, shell=True),
-                    )
-                    cmd_btn.pack(side="left", padx=5)
-                    self.buttons[cl]["command"] = cmd_btn
-
-                # If already active (on reload), update UI
-                if cl in self.active_session_ids:
-                    self._update_ui_to_active(cl)
+                self._create_connection_row(sub_frame, cl)
 
             if has_autostart:
                 sub_frame.pack(side="top", fill="x")
@@ -414,81 +529,102 @@ class SSMPortForwarderGUI:
 
         for label, config in self.connections.items():
             if config.get("autostart") and label not in self.active_session_ids:
-                self._start_session(label)
+                self._start_session(label, scheduled=True)
+
+    def _start_group(self, group_label):
+        for label in sorted(self.group_frames[group_label]["connections"]):
+            if label not in self.active_session_ids:
+                self._start_session(label, scheduled=True)
+
+    def _stop_group(self, group_label):
+        for label in sorted(self.group_frames[group_label]["connections"]):
+            if label in self.active_session_ids:
+                self._stop_session(label)
+            elif label not in self.controller.starting:
+                # Drops a queued start, the scheduler may not exist after a failed load
+                self.controller.stop(label)
+                self.buttons[label]["start"].config(state="normal", text="Start")
 
     def _update_ui_to_active(self, label):
         self.buttons[label]["start"].config(state="disabled", text="Start")
         self.buttons[label]["stop"].config(state="normal", text="Stop")
 
-    def _is_local_port_in_use(self, label):
-        local_port = self.connections[label]["local_port"]
-        for active_label in self.active_session_ids:
-            if label != active_label:
-                active_local_port = self.connections[active_label]["local_port"]
-                if local_port == active_local_port:
-                    return active_label
-        return None
-
-    def _start_session(self, label):
-        connection = self.connections[label]
-        if active_label := self._is_local_port_in_use(label):
+    def _update_ui_to_status(self, label):
+        state = self.controller.status()[label]["state"]
+        if state in ("running", "reconnecting"):
+            self._update_ui_to_active(label)
+        elif state == "starting":
+            self.buttons[label]["start"].config(state="disabled", text="Starting...")
+        elif state == "queued":
+            self.buttons[label]["start"].config(state="disabled", text="Queued...")
+
+    def _on_session_state(self, label, state):
+        """Called on the Tk thread for every state change the controller reports"""
+        if label not in self.buttons:
+            return
+        if state == "queued":
+            self.buttons[label]["start"].config(state="disabled", text="Queued...")
+        elif state == "starting":
+            self.buttons[label]["start"].config(state="disabled", text="Starting...")
+        elif state == "reconnecting":
+            self.buttons[label]["start"].config(
+                state="disabled", text="Reconnecting..."
+            )
+        elif state == "running" and label in self.active_session_ids:
+            if self.connection_errors.pop(label, None):
+                self._replace_connection_row(label)
+            else:
+                self._update_ui_to_active(label)
+        elif state in ("failed", "stopped"):
+            self.buttons[label]["stop"].config(state="disabled", text="Stop")
+            self.buttons[label]["start"].config(state="normal", text="Start")
+
+    def _start_session(self, label, scheduled=False):
+        """
+        Start a session in the background. Scheduled starts are queued in the start scheduler, which
+        limits how many start at once: autostart connections first, then by group.
+        """
+        if active_label := self.controller.port_in_use_by(label):
             messagebox.showwarning(
                 "Port Conflict",
-                f"Local port {connection['local_port']} is already in use by connection '{active_label}'.",
+                f"Local port {self.connections[label]['local_port']} is already in use by connection '{active_label}'.",
             )
             return
-        session = self.aws_sessions.get_session(
-            profile_name=connection["profile"], region_name=connection.get("region")
-        )
-        ssm_client = session.client("ssm")
 
-        self.buttons[label]["start"].config(state="disabled", text="Starting...")
-
-        def run():
-            if connection["profile"]:
-                self.logger.info(
-                    f"Starting session for {label} using profile '{connection.get('profile')}'..."
-                )
-            else:
-                self.logger.info(
-                    f"Starting session for {label} using AWS default role..."
-                )
-            try:
-                sid = self.forwarder.start_session(
-                    ssm_client=ssm_client, label=label, **connection
-                )
-                self.active_session_ids[label] = sid
-                self.logger.info(f"Session started: {sid} for {label}")
-
-                def update_ui():
-                    self._update_ui_to_active(label)
-
-                self.root.after(0, update_ui)
-            except Exception as e:
-                self.logger.warning(f"Failed to start {label}: {e}")
-
-                def reset_ui():
-                    self.buttons[label]["start"].config(state="normal", text="Start")
-
-                self.root.after(0, reset_ui)
+        if scheduled:
+            self.controller.start_many([label], wait=False)
+        else:
+            self.buttons[label]["start"].config(state="disabled", text="Starting...")
+            threading.Thread(
+                target=self._run_start_session, args=(label,), daemon=True
+            ).start()
 
-        threading.Thread(target=run, daemon=True).start()
+    def _run_start_session(self, label):
+        """Blocking part of starting a session, runs on a worker thread"""
+        try:
+            self.controller.start(label)
+        except Exception:
+            # Logged by the controller, which also reports the failed state to reset the buttons
+            pass
 
     def _stop_session(self, label):
-        connection = self.connections[label]
         sid = self.active_session_ids.get(label)
         if sid:
-            self.logger.info(f"Stopping session {sid} for {label}...")
             self.buttons[label]["stop"].config(state="disabled", text="Stopping...")
 
             def run_stop():
-                if self.forwarder.stop_session(sid):
-                    self.active_session_ids.pop(label, None)
+                # Wait for the teardown, a relayed tunnel releases local_port only at the end
+                if self.controller.stop(label, wait=True):
                     self.logger.info(f"Session {sid} stopped.")
 
                 def update_ui():
-                    self.buttons[label]["stop"].config(state="disabled", text="Stop")
-                    self.buttons[label]["start"].config(state="normal", text="Start")
+                    if label in self.buttons:
+                        self.buttons[label]["stop"].config(
+                            state="disabled", text="Stop"
+                        )
+                        self.buttons[label]["start"].config(
+                            state="normal", text="Start"
+                        )
 
                 self.root.after(0, update_ui)
 
@@ -513,8 +649,23 @@ class SSMPortForwarderGUI:
         self.root.after(100, self._process_logs)
 
     def on_closing(self):
-        if self.forwarder:
-            self.forwarder.stop_all()
+        if self.config_watcher:
+            self.config_watcher.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.controller.close()
+        if self.controller.remote:
+            # The tunnels belong to the daemon and keep running
+            self.controller.forwarder.close()
+        elif self.controller.forwarder:
+            # Only signal the tunnel threads, joining them would hang the window on close
+            self.controller.stop_all(wait=False)
+            self.controller.forwarder.stop_all()
+        if trace_file := self.app_config.get("trace_file"):
+            try:
+                tracing.TRACER.export(trace_file)
+            except OSError as e:
+                self.logger.warning(f"Could not write trace to {trace_file}: {e}")
         self.root.destroy()
 
     def _open_help(self):
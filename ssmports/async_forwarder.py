@@ -0,0 +1,382 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+from . import metrics, tracing
+from .exceptions import SSMPortForwardError
+from .forwarder import SSMPortForwarder
+from .relay import TunnelRelay, free_port
+from .session import PluginSession
+
+
+class AsyncSSMSession(PluginSession):
+    """asyncio counterpart of SSMSession, boto3 calls run in the loop's executor."""
+
+    # Output is read in chunks and split into lines, StreamReader.readline fails on lines over 64 KiB
+    READ_SIZE = 65536
+    MAX_LINE = 1024 * 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ready = None
+        self._reader = None
+
+    async def _call(self, method, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: method(**kwargs))
+
+    async def start(self):
+        self._log(f"Starting SSM session for target: {self.kwargs.get('Target')}")
+        t0 = time.monotonic()
+        try:
+            with tracing.span(
+                "ssm.start_session",
+                label=self.label,
+                target=self.kwargs.get("Target"),
+                region=self.ssm.meta.region_name,
+            ):
+                self.session = await self._call(self.ssm.start_session, **self.kwargs)
+        except Exception:
+            metrics.START_FAILURES.inc(label=self.label or "")
+            raise
+        metrics.START_SESSION_SECONDS.observe(
+            time.monotonic() - t0, label=self.label or ""
+        )
+        try:
+            await self._launch_plugin()
+            await self._wait_until_ready()
+        except BaseException:
+            metrics.START_FAILURES.inc(label=self.label or "")
+            await self.close()
+            raise
+
+    async def resume(self):
+        """Resume the session with a fresh token and stream URL, see SSMSession.resume"""
+        session_id = self.session["SessionId"]
+        self._log(f"Resuming SSM session {session_id}...")
+        await self._stop_plugin()
+        with tracing.span(
+            "ssm.resume_session", label=self.label, session_id=session_id
+        ):
+            response = await self._call(self.ssm.resume_session, SessionId=session_id)
+        self._resumed(response)
+        await self._launch_plugin()
+        await self._wait_until_ready()
+
+    async def _launch_plugin(self):
+        self._log("Launching session-manager-plugin...")
+        t0 = time.monotonic()
+        try:
+            with tracing.span("plugin.exec", label=self.label) as span:
+                self.proc = await asyncio.create_subprocess_exec(
+                    *self._plugin_args(),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                    stdin=asyncio.subprocess.DEVNULL,
+                )
+                span.set(pid=self.proc.pid)
+        except FileNotFoundError:
+            raise SSMPortForwardError("The AWS session-manager-plugin is required.")
+        metrics.PLUGIN_SPAWN_SECONDS.observe(
+            time.monotonic() - t0, label=self.label or ""
+        )
+        metrics.track_plugin(self.proc.pid, self.label)
+        self.output_pump = self._new_output_pump()
+        self._ready = asyncio.get_running_loop().create_future()
+        self._reader = asyncio.create_task(self._read_output())
+
+    async def _read_output(self):
+        """Drain the plugin output for the lifetime of the process into the output pump"""
+        pending = b""
+        while chunk := await self.proc.stdout.read(self.READ_SIZE):
+            *raw_lines, pending = (pending + chunk).split(b"\n")
+            if len(pending) > self.MAX_LINE:
+                # A line without an end, pass it on in pieces rather than buffering it all
+                raw_lines.append(pending)
+                pending = b""
+            for raw_line in raw_lines:
+                self._feed(raw_line)
+        if pending:
+            self._feed(pending)
+        self.output_pump.close()
+        if not self._ready.done():
+            self._ready.set_result(None)
+
+    def _feed(self, raw_line):
+        marker_line = self.output_pump.feed(raw_line)
+        if marker_line is not None and not self._ready.done():
+            self._ready.set_result(marker_line)
+
+    async def _wait_until_ready(self):
+        if not self.check_connection:
+            return
+        with tracing.span("plugin.ready", label=self.label, readiness=self.readiness):
+            t0 = time.perf_counter()
+            if self.readiness == "output":
+                try:
+                    line = await asyncio.wait_for(
+                        asyncio.shield(self._ready), self.timeout
+                    )
+                except TimeoutError:
+                    line = None
+                if line is None and self.output_pump.closed:
+                    await self.proc.wait()
+                    raise SSMPortForwardError(self._exit_message())
+                self._check_marker_line(line)
+            elif (port_number := self._local_port()) is not None:
+                await self._wait_for_port_ready(port_number)
+            self.ready_time = time.perf_counter() - t0
+            metrics.READINESS_SECONDS.observe(self.ready_time, label=self.label or "")
+            self._log(f"Tunnel ready after {self.ready_time * 1000:.0f} ms.")
+
+    async def _wait_for_port_ready(self, port_number):
+        deadline = time.perf_counter() + self.timeout
+        while time.perf_counter() < deadline:
+            if self.proc.returncode is not None:
+                raise SSMPortForwardError(self._exit_message())
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port_number)
+            except OSError:
+                await asyncio.sleep(0.25)
+                continue
+            writer.close()
+            return
+        raise self._probe_failed(port_number)
+
+    async def _stop_plugin(self):
+        if self.proc and self.proc.returncode is None:
+            self._log("Terminating session-manager-plugin...")
+            self.proc.terminate()
+            try:
+                await asyncio.wait_for(self.proc.wait(), 5)
+            except TimeoutError:
+                self._log("Force killing session-manager-plugin...")
+                self.proc.kill()
+                await self.proc.wait()
+        if self.proc:
+            metrics.untrack_plugin(self.proc.pid)
+        if self._reader:
+            await self._reader
+
+    async def close(self):
+        await self._stop_plugin()
+        if self.session:
+            session_id = self.session["SessionId"]
+            self.session = None
+            try:
+                await self._call(self.ssm.terminate_session, SessionId=session_id)
+            except Exception:
+                metrics.TERMINATE_FAILURES.inc(label=self.label or "")
+                raise
+
+
+class AsyncSSMPortForwarder(SSMPortForwarder):
+    """
+    Runs every tunnel as a task on a single asyncio event loop instead of a thread per tunnel, so the
+    number of threads does not grow with the number of tunnels. Offers the same start_session,
+    stop_session and stop_all API as SSMPortForwarder, callable from any thread.
+    """
+
+    # Seconds start_session waits for a tunnel, a start that takes longer is cancelled
+    START_TIMEOUT = 30
+
+    def __init__(self, logger=None, **kwargs):
+        super().__init__(logger, **kwargs)
+        # The loop only keeps weak references to tasks, the tunnels are kept here while they run
+        self.tasks = set()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(
+            target=self.loop.run_forever, daemon=True, name="ssm-forwarder-loop"
+        )
+        self.loop_thread.start()
+
+    def _get_relay(self):
+        # Relayed connections share the event loop of the tunnels
+        if self.relay is None:
+            self.relay = TunnelRelay(loop=self.loop, logger=self.logger)
+        return self.relay
+
+    def start_session(self, ssm_client, label, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(
+            self.start_session_async(ssm_client, label, **kwargs), self.loop
+        )
+        try:
+            return future.result(timeout=self.START_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            # Also cancels the tunnel task, so a late session is closed instead of left running
+            future.cancel()
+            raise SSMPortForwardError("Failed to start SSM session within timeout")
+
+    async def start_session_async(self, ssm_client, label, **kwargs):
+        """Start a tunnel, returns its session ID once it is ready. The tunnel keeps running as a task."""
+        started = self.loop.create_future()
+        task = asyncio.create_task(
+            self._run_tunnel(ssm_client, label, started, **kwargs)
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        try:
+            return await started
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+    async def _supervise(self, sess, label, stop_event, reconnect=True):
+        """Same contract as SSMPortForwarder._supervise, but waits on the process instead of polling"""
+        attempt = 0
+        up_since = time.monotonic()
+        while True:
+            stopped = asyncio.create_task(stop_event.wait())
+            exited = asyncio.create_task(sess.proc.wait())
+            await asyncio.wait({stopped, exited}, return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            exited.cancel()
+            if stop_event.is_set():
+                return True
+            output = "\n".join(sess.recent_output(5))
+            self.logger.warning(
+                f"[{label}] session-manager-plugin exited unexpectedly: {output}"
+            )
+            if not reconnect:
+                return False
+            self._set_state(label, "reconnecting")
+            delay, attempt = self._resume_delay(attempt, up_since)
+            if delay:
+                self.logger.info(f"[{label}] Resuming in {delay:.1f} seconds...")
+                try:
+                    await asyncio.wait_for(stop_event.wait(), delay)
+                    return True
+                except TimeoutError:
+                    pass
+            try:
+                await sess.resume()
+            except Exception as e:
+                self.logger.warning(
+                    f"[{label}] Could not resume session, starting a new one: {e}"
+                )
+                return False
+            self.stats[label]["reconnects"] += 1
+            self.stats[label]["resumes"] += 1
+            metrics.RECONNECTS.inc(label=label, kind="resume")
+            up_since = time.monotonic()
+            self._set_state(label, "running")
+            self.logger.info(f"[{label}] Resumed session {sess.session['SessionId']}.")
+
+    async def _run_tunnel(self, ssm_client, label, started, **kwargs):
+        local_port = kwargs.get("local_port")
+        reconnect = kwargs.get("reconnect", True)
+        relay = self._get_relay() if kwargs.get("relay", False) else None
+        plugin_port = local_port
+        stop_event = asyncio.Event()
+        done = threading.Event()
+        sid = None
+        attempt = 0
+        try:
+            if relay:
+                # The relay owns local_port and the plugin listens on an internal port
+                plugin_port = free_port()
+                try:
+                    await relay.add_async(label, local_port, plugin_port)
+                except Exception as e:
+                    relay = None
+                    started.set_exception(e)
+                    return
+            while not stop_event.is_set():
+                connected_at = None
+                sess = AsyncSSMSession(
+                    ssm_client,
+                    logger=self.logger,
+                    label=label,
+                    readiness=kwargs.get("readiness", "output"),
+                    Target=kwargs.get("jump_instance"),
+                    DocumentName="AWS-StartPortForwardingSessionToRemoteHost",
+                    Parameters={
+                        "host": [kwargs.get("target_host")],
+                        "portNumber": [str(kwargs.get("remote_port"))],
+                        "localPortNumber": [str(plugin_port)],
+                    },
+                )
+                try:
+                    await sess.start()
+                    try:
+                        if sid is None:
+                            sid = sess.session["SessionId"]
+                            self.active_sessions[sid] = {
+                                "task": asyncio.current_task(),
+                                "stop_event": stop_event,
+                                "done": done,
+                                "label": label,
+                                "session_id": sid,
+                                "config": {
+                                    "target_host": kwargs.get("target_host"),
+                                    "local_port": local_port,
+                                    "remote_port": kwargs.get("remote_port"),
+                                    "instance_id": kwargs.get("jump_instance"),
+                                },
+                            }
+                            self._set_state(label, "running")
+                            started.set_result(sid)
+                        else:
+                            self.active_sessions[sid]["session_id"] = sess.session[
+                                "SessionId"
+                            ]
+                            self.stats[label]["reconnects"] += 1
+                            metrics.RECONNECTS.inc(label=label, kind="new")
+                            self._set_state(label, "running")
+                            self.logger.info(
+                                f"[{label}] Reconnected as session {sess.session['SessionId']}."
+                            )
+                        connected_at = time.monotonic()
+                        if await self._supervise(sess, label, stop_event, reconnect):
+                            break
+                    finally:
+                        await sess.close()
+                except Exception as e:
+                    if sid is None:
+                        if relay:
+                            await relay.remove_async(label)
+                        # Unless start_session already gave up and cancelled it
+                        if not started.done():
+                            started.set_exception(e)
+                        return
+                    self.logger.warning(f"[{label}] Reconnect failed: {e}")
+
+                if not reconnect:
+                    self._set_state(label, "failed")
+                    break
+                self._set_state(label, "reconnecting")
+                if (
+                    connected_at
+                    and time.monotonic() - connected_at >= self.stable_after
+                ):
+                    attempt = 0
+                delay = self._reconnect_delay(attempt)
+                attempt += 1
+                self.logger.info(f"[{label}] Reconnecting in {delay:.1f} seconds...")
+                try:
+                    await asyncio.wait_for(stop_event.wait(), delay)
+                except TimeoutError:
+                    pass
+        finally:
+            self.active_sessions.pop(sid, None)
+            if relay:
+                await relay.remove_async(label)
+            if stop_event.is_set():
+                self._set_state(label, "stopped")
+            done.set()
+
+    def stop_session(self, session_id, wait=False, timeout=10):
+        """Signal a session to stop. With wait, block until the session has been torn down."""
+        session = self.active_sessions.get(session_id)
+        if session:
+            self.loop.call_soon_threadsafe(session["stop_event"].set)
+            if wait and threading.current_thread() is not self.loop_thread:
+                session["done"].wait(timeout)
+            return True
+        return False
+
+    def stop_all(self):
+        for session in list(self.active_sessions.values()):
+            self.loop.call_soon_threadsafe(session["stop_event"].set)
+        self._close_relay()
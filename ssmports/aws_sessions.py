@@ -0,0 +1,314 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+import boto3
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
+
+from ssmports import metrics, tracing
+from ssmports.client_factory import ClientFactory
+from ssmports.exceptions import SSMPortForwardError
+
+
+class AWSSessions:
+    def __init__(self, client_factory=None):
+        # This is put here due to https://github.com/boto/botocore/issues/1841 -
+        # or maybe I should just not use the root logger.
+        boto3.set_stream_logger(name="botocore.credentials", level=logging.ERROR)
+
+        self.sessions = {}  # (profile, region) -> boto3 session
+        self.stats = Counter()  # hits, misses and waits for an in-progress creation
+        self._pending = {}  # (profile, region) -> Future of a session being created
+        self._sessions_lock = threading.Lock()
+        # When set, sessions are returned without a blocking STS call and validated in the background
+        self.lazy_validation = False
+        self.credential_errors = {}  # profile -> error of the last failed validation
+        self.listeners = (
+            []
+        )  # callables called with (profile, error) when credential_errors changes
+        self.credential_cache = (
+            None  # optional CredentialCache, avoids STS calls on restart
+        )
+        # All clients share retry settings and a rate limit per account, region and service
+        self.client_factory = client_factory or ClientFactory()
+        self.accounts = {}  # profile -> AWS account ID, as returned by STS
+        # Building a client loads the service model and endpoint rules, so clients are reused
+        self.clients = {}  # (profile, region, service) -> client
+        self._clients_lock = threading.Lock()
+
+    def client(self, service, profile_name=None, region_name=None):
+        """Return a cached client for a service with the session of a profile, rate limited per account"""
+        key = (profile_name, region_name, service)
+        client = self.clients.get(key)
+        if client is not None:
+            return client
+        with tracing.span(
+            "aws.client", service=service, profile=profile_name, region=region_name
+        ):
+            session = self.get_session(
+                profile_name=profile_name, region_name=region_name
+            )
+            with self._clients_lock:
+                if key not in self.clients:
+                    self.clients[key] = self.client_factory.create_client(
+                        session,
+                        service,
+                        region_name=region_name,
+                        account=self.accounts.get(profile_name),
+                        profile=profile_name,
+                    )
+                return self.clients[key]
+
+    def prewarm(self, scopes, services=("ssm",)):
+        """
+        Create the clients for every (profile, region) in scopes on a background thread, so starting a
+        tunnel later only costs the API calls. Failures are ignored here, they surface again on use.
+        """
+
+        def run():
+            for profile_name, region_name in scopes:
+                for service in services:
+                    try:
+                        self.client(
+                            service, profile_name=profile_name, region_name=region_name
+                        )
+                    except Exception as e:
+                        logging.getLogger().debug(
+                            f"Could not prewarm {service} client for profile '{profile_name}': {e}"
+                        )
+
+        thread = threading.Thread(target=run, daemon=True, name="aws-client-prewarm")
+        thread.start()
+        return thread
+
+    def _drop_clients(self, keep):
+        with self._clients_lock:
+            for key in list(self.clients):
+                if not keep(key[0]):
+                    self.clients.pop(key)
+
+    def get_session(self, profile_name=None, region_name=None):
+        """
+        Return the session for a (profile, region), creating it on first use. Concurrent callers for
+        the same key wait for a single creation instead of each validating the credentials.
+        """
+        key = (profile_name, region_name)
+        with self._sessions_lock:
+            if key in self.sessions:
+                self.stats["hits"] += 1
+                metrics.SESSION_CACHE.inc(result="hit")
+                return self.sessions[key]
+            pending = self._pending.get(key)
+            if pending is None:
+                self.stats["misses"] += 1
+                metrics.SESSION_CACHE.inc(result="miss")
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                self.stats["waits"] += 1
+                metrics.SESSION_CACHE.inc(result="wait")
+                owner = False
+
+        if not owner:
+            return pending.result()
+        try:
+            with tracing.span("aws.session", profile=profile_name, region=region_name):
+                session = self.create_session(
+                    profile_name=profile_name, region_name=region_name
+                )
+        except BaseException as e:
+            with self._sessions_lock:
+                self._pending.pop(key)
+            pending.set_exception(e)
+            raise
+        with self._sessions_lock:
+            self.sessions[key] = session
+            self._pending.pop(key)
+        pending.set_result(session)
+        return session
+
+    def invalidate(self, profile_name=None):
+        """Forget the sessions of a profile, so the next get_session validates the credentials again"""
+        with self._sessions_lock:
+            for key in list(self.sessions):
+                if key[0] == profile_name:
+                    self.sessions.pop(key)
+            self.accounts.pop(profile_name, None)
+        self._drop_clients(lambda profile: profile != profile_name)
+
+    def prune(self, profile_names):
+        """Forget the sessions of all profiles that are no longer in use"""
+        with self._sessions_lock:
+            for key in list(self.sessions):
+                if key[0] not in profile_names:
+                    self.sessions.pop(key)
+            for profile_name in list(self.accounts):
+                if profile_name not in profile_names:
+                    self.accounts.pop(profile_name)
+        self._drop_clients(lambda profile: profile in profile_names)
+
+    @staticmethod
+    def get_expiry(session):
+        """
+        Return when the credentials of a session expire as an aware datetime, or None if they do not.
+        Refreshable credentials (assume role, SSO) are refreshed first if they are about to expire, for
+        plain session tokens the x_security_token_expires value that saml2aws writes is used.
+        """
+        credentials = session.get_credentials()
+        if credentials is None:
+            return None
+        if hasattr(credentials, "get_frozen_credentials"):
+            credentials.get_frozen_credentials()
+        expiry = getattr(credentials, "_expiry_time", None)
+        if expiry is None:
+            expires = session._session.get_scoped_config().get(
+                "x_security_token_expires"
+            )
+            if not expires:
+                return None
+            expiry = datetime.fromisoformat(expires)
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        return expiry
+
+    def profiles(self):
+        """Return the profiles that currently have a session"""
+        with self._sessions_lock:
+            return {profile_name for profile_name, _ in self.sessions}
+
+    def _session_of(self, profile_name):
+        with self._sessions_lock:
+            return next(
+                (s for (p, _), s in self.sessions.items() if p == profile_name), None
+            )
+
+    def credential_expiry(self, profile_name=None):
+        """Return when the credentials of the session of a profile expire, see get_expiry"""
+        session = self._session_of(profile_name)
+        return self.get_expiry(session) if session else None
+
+    def refresh_window(self, profile_name=None):
+        """
+        Return how many seconds before expiry botocore renews the credentials of a profile by itself
+        (assume role, SSO), or None for credentials it can not renew.
+        """
+        session = self._session_of(profile_name)
+        credentials = session.get_credentials() if session else None
+        if not isinstance(credentials, RefreshableCredentials):
+            return None
+        return credentials._advisory_refresh_timeout
+
+    def fresh_credential_expiry(self, profile_name=None):
+        """Read the expiry of the credentials as they are on disk now, to notice that a user re-authenticated"""
+        session = boto3.Session(profile_name=profile_name)
+        if self.credential_cache:
+            self.credential_cache.attach(session)
+        return self.get_expiry(session)
+
+    def refresh(self, profile_name=None):
+        """Replace the sessions and clients of a profile with new ones, using the current credentials"""
+        with self._sessions_lock:
+            regions = [r for p, r in self.sessions if p == profile_name]
+        self.invalidate(profile_name)
+        for region_name in regions:
+            self.get_session(profile_name=profile_name, region_name=region_name)
+
+    def validate(self, session, profile_name=None):
+        """Check the credentials of a session with STS and remember the account ID of the profile"""
+        credentials = session.get_credentials() if self.credential_cache else None
+        identity = None
+        if credentials is not None:
+            identity = self.credential_cache.get_identity(profile_name, credentials)
+        if identity is not None:
+            metrics.CREDENTIAL_VALIDATIONS.inc(
+                profile=profile_name or "", result="cached"
+            )
+        else:
+            sts = self.client_factory.create_client(
+                session, "sts", profile=profile_name
+            )
+            try:
+                with tracing.span("sts.get_caller_identity", profile=profile_name):
+                    identity = sts.get_caller_identity()
+            except Exception:
+                metrics.CREDENTIAL_VALIDATIONS.inc(
+                    profile=profile_name or "", result="error"
+                )
+                raise
+            metrics.CREDENTIAL_VALIDATIONS.inc(profile=profile_name or "", result="sts")
+            if credentials is not None:
+                self.credential_cache.put_identity(
+                    profile_name, credentials, identity, self.get_expiry(session)
+                )
+        self.accounts[profile_name] = identity.get("Account")
+        if self.credential_errors.pop(profile_name, None):
+            self._notify(profile_name, None)
+
+    def add_listener(self, callback):
+        """Register callback(profile, error), called when a background validation fails and with None once it succeeds"""
+        self.listeners.append(callback)
+
+    def _notify(self, profile_name, error):
+        for listener in self.listeners:
+            try:
+                listener(profile_name, error)
+            except Exception as e:
+                logging.getLogger().error(f"Error in credential listener: {e}")
+
+    def validate_in_background(self, session, profile_name=None):
+        """Validate on a background thread, a failure is kept in credential_errors and drops the session"""
+
+        def run():
+            try:
+                self.validate(session, profile_name)
+            except Exception as e:
+                self.credential_errors[profile_name] = (
+                    f"Failed to create AWS session with profile '{profile_name}': {e}"
+                )
+                logging.getLogger().warning(self.credential_errors[profile_name])
+                self.invalidate(profile_name)
+                self._notify(profile_name, self.credential_errors[profile_name])
+
+        thread = threading.Thread(
+            target=run, daemon=True, name="aws-credential-validation"
+        )
+        thread.start()
+        return thread
+
+    def create_session(self, profile_name=None, region_name=None):
+        try:
+            if profile_name is None:
+                session = (
+                    boto3.Session()
+                    if region_name is None
+                    else boto3.Session(region_name=region_name)
+                )
+            else:
+                session = (
+                    boto3.Session(profile_name=profile_name)
+                    if region_name is None
+                    else boto3.Session(
+                        profile_name=profile_name, region_name=region_name
+                    )
+                )
+            if self.credential_cache:
+                self.credential_cache.attach(session)
+            # Credentials do not depend on the region, so validate them once per profile
+            if profile_name not in self.accounts:
+                if self.lazy_validation:
+                    self.validate_in_background(session, profile_name)
+                else:
+                    self.validate(session, profile_name)
+            return session
+        except (
+            NoCredentialsError,
+            PartialCredentialsError,
+            ClientError,
+            Exception,
+        ) as e:
+            raise SSMPortForwardError(
+                f"Failed to create AWS session with profile '{profile_name}': {e}"
+            )
@@ -0,0 +1,447 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from . import tracing
+from .config_loader import ConfigLoader
+from .controller import TunnelController
+from .daemon import UNIX_SOCKETS, DaemonClient
+from .exceptions import SSMPortForwardError
+from .http_api import HttpApiServer
+
+STATE_PATH = "~/.ssmports/cli_state.json"
+
+
+def state_path():
+    return os.path.expanduser(os.environ.get("SSMPORTS_STATE", STATE_PATH))
+
+
+def read_state():
+    """Return the state written by a running 'ssmports up', or None if there is none"""
+    try:
+        with open(state_path()) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not pid_alive(state.get("pid")):
+        return None
+    return state
+
+
+def write_state(state):
+    path = state_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def remove_state():
+    for path in (state_path(), stop_path()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def stop_path():
+    """Created by 'ssmports down' on Windows, where a running 'ssmports up' cannot be signalled"""
+    return f"{state_path()}.stop"
+
+
+def request_stop(pid):
+    if sys.platform == "win32":
+        # SIGTERM is TerminateProcess there, which skips stopping the tunnels and plugins
+        with open(stop_path(), "w"):
+            pass
+    else:
+        os.kill(pid, signal.SIGTERM)
+
+
+def stop_requested():
+    return os.path.exists(stop_path())
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    if sys.platform == "win32":
+        return _windows_pid_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _windows_pid_alive(pid):
+    # os.kill(pid, 0) sends CTRL_C_EVENT on Windows, ask for the exit code instead
+    import ctypes
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    ERROR_ACCESS_DENIED = 5
+    STILL_ACTIVE = 259
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return kernel32.GetLastError() == ERROR_ACCESS_DENIED
+    try:
+        exit_code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def port_open(port, timeout=0.5):
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def format_table(rows, headers):
+    widths = [
+        max(len(str(value)) for value in column) for column in zip(headers, *rows)
+    ]
+    lines = [headers, *rows]
+    return "\n".join(
+        "  ".join(str(value).ljust(width) for value, width in zip(line, widths))
+        for line in lines
+    )
+
+
+def cmd_list(args):
+    config = ConfigLoader(args.config).read_config()
+    connections = config["connections"]
+    if args.json:
+        print(json.dumps(connections, indent=2))
+        return 0
+    rows = [
+        (
+            label,
+            connection["local_port"],
+            connection.get("group", ""),
+            f"{connection['target_host']}:{connection['remote_port']}",
+            "yes" if connection.get("autostart") else "",
+        )
+        for label, connection in connections.items()
+    ]
+    print(format_table(rows, ("LABEL", "PORT", "GROUP", "TARGET", "AUTOSTART")))
+    return 0
+
+
+def start_http_api(args, controller):
+    """Start the HTTP API when it is enabled with --http or the http_api_port app setting"""
+    port = args.http or controller.app_config.get("http_api_port")
+    if not port:
+        return None
+    server = HttpApiServer(controller, port)
+    server.start()
+    return server
+
+
+def export_trace(args, controller):
+    """Write the recorded spans when enabled with --trace or the trace_file app setting"""
+    path = args.trace or controller.app_config.get("trace_file")
+    if not path:
+        return
+    try:
+        tracing.TRACER.export(path)
+    except OSError as e:
+        print(f"Could not write trace to {path}: {e}", file=sys.stderr)
+
+
+def print_start_results(results):
+    failed = [label for label, result in results.items() if not result["session_id"]]
+    for label, result in results.items():
+        if label in failed:
+            print(f"FAILED  {label}: {result['error']}", file=sys.stderr)
+        else:
+            print(f"UP      {label} ({result['session_id']})")
+    return failed
+
+
+def cmd_up(args):
+    if DaemonClient.available(args.socket):
+        # The daemon owns the tunnels, so this returns as soon as they are up
+        client = DaemonClient(args.socket)
+        results = client.call(
+            "start",
+            labels=args.labels,
+            groups=args.group,
+            autostart=not (args.all or args.labels or args.group),
+        )
+        return 1 if print_start_results(results) else 0
+
+    if state := read_state():
+        print(
+            f"ssmports is already running with pid {state['pid']}, run 'ssmports down' first",
+            file=sys.stderr,
+        )
+        return 1
+
+    if stop_requested():
+        # Left behind by a 'down' whose 'up' exited before it saw the request
+        os.remove(stop_path())
+    controller = TunnelController(args.config)
+    controller.load()
+    if args.all:
+        labels = list(controller.connections)
+    elif args.labels or args.group:
+        labels = controller.select(args.labels, args.group)
+    else:
+        labels = controller.autostart_labels()
+    if not labels:
+        print("No connections selected", file=sys.stderr)
+        return 1
+
+    stop_event = threading.Event()
+    state_lock = threading.Lock()
+
+    def save_state(*_):
+        # Called from forwarder threads on every state change
+        with state_lock:
+            write_state(
+                {
+                    "pid": os.getpid(),
+                    "config": os.path.abspath(args.config),
+                    "tunnels": controller.status(),
+                }
+            )
+
+    def on_signal(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    controller.add_listener(save_state)
+    http_api = start_http_api(args, controller)
+
+    t0 = time.perf_counter()
+    controller.start_many(labels)
+    elapsed = time.perf_counter() - t0
+    status = controller.status()
+    failed = [label for label in labels if status[label]["state"] != "running"]
+    for label in labels:
+        if label in failed:
+            print(f"FAILED  {label}: {status[label]['error']}", file=sys.stderr)
+        else:
+            print(
+                f"UP      {label} on localhost:{status[label]['local_port']} "
+                f"({status[label]['session_id']})"
+            )
+    print(f"{len(labels) - len(failed)}/{len(labels)} tunnels up in {elapsed:.1f}s")
+
+    try:
+        if failed and not args.keep_going:
+            return 1
+        save_state()
+        while not stop_event.wait(1):
+            if stop_requested():
+                break
+        return 0
+    finally:
+        if http_api:
+            http_api.stop()
+        controller.stop_all()
+        controller.close()
+        remove_state()
+        export_trace(args, controller)
+
+
+def cmd_down(args):
+    if DaemonClient.available(args.socket):
+        stopped = DaemonClient(args.socket).call(
+            "stop", labels=args.labels, groups=args.group
+        )
+        print(f"Stopped {len(stopped)} tunnels")
+        return 0
+    if args.labels or args.group:
+        print("Stopping single tunnels requires 'ssmports daemon'", file=sys.stderr)
+        return 1
+    state = read_state()
+    if not state:
+        print("ssmports is not running")
+        return 0
+    request_stop(state["pid"])
+    deadline = time.monotonic() + args.timeout
+    while pid_alive(state["pid"]):
+        if time.monotonic() > deadline:
+            print(f"ssmports with pid {state['pid']} did not stop", file=sys.stderr)
+            return 1
+        time.sleep(0.1)
+    print(f"Stopped {len(state.get('tunnels', {}))} tunnels")
+    return 0
+
+
+def cmd_status(args):
+    if DaemonClient.available(args.socket):
+        tunnels = {
+            label: status
+            for label, status in DaemonClient(args.socket).call("status").items()
+            if status["state"] != "stopped"
+        }
+    else:
+        state = read_state()
+        tunnels = state.get("tunnels", {}) if state else {}
+    for status in tunnels.values():
+        status["listening"] = status["state"] == "running" and port_open(
+            status["local_port"]
+        )
+    if args.json:
+        print(json.dumps(tunnels, indent=2))
+    elif not tunnels:
+        print("ssmports is not running")
+    else:
+        rows = [
+            (
+                label,
+                status["local_port"],
+                status["state"],
+                "yes" if status["listening"] else "no",
+                status["session_id"] or "",
+            )
+            for label, status in tunnels.items()
+        ]
+        print(format_table(rows, ("LABEL", "PORT", "STATE", "LISTENING", "SESSION")))
+    if not tunnels or not all(status["listening"] for status in tunnels.values()):
+        return 3
+    return 0
+
+
+def cmd_daemon(args):
+    if not UNIX_SOCKETS:
+        print("'ssmports daemon' needs Unix domain sockets", file=sys.stderr)
+        return 1
+    from .daemon import ControlServer
+
+    controller = TunnelController(args.config)
+    controller.load()
+    server = ControlServer(controller, args.socket)
+
+    def on_signal(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    print(f"ssmports daemon listening on {server.path}")
+    http_api = start_http_api(args, controller)
+    try:
+        if args.autostart:
+            controller.start_many(controller.autostart_labels(), wait=False)
+        server.serve_forever()
+    finally:
+        if http_api:
+            http_api.stop()
+        server.server_close()
+        controller.stop_all()
+        controller.close()
+        export_trace(args, controller)
+    return 0
+
+
+def cmd_shutdown(args):
+    if not DaemonClient.available(args.socket):
+        print("The ssmports daemon is not running")
+        return 0
+    DaemonClient(args.socket).call("shutdown")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ssmports", description="Port forwarding over SSM session manager"
+    )
+    parser.add_argument(
+        "-c", "--config", default="sessions.json", help="configuration file"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log the session output"
+    )
+    parser.add_argument(
+        "-s", "--socket", default=None, help="socket of the ssmports daemon"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    up = commands.add_parser(
+        "up", help="start tunnels and keep them running until stopped"
+    )
+    up.add_argument("labels", nargs="*", help="connections to start")
+    up.add_argument("-g", "--group", action="append", default=[], help="start a group")
+    up.add_argument("-a", "--all", action="store_true", help="start all connections")
+    up.add_argument(
+        "-k",
+        "--keep-going",
+        action="store_true",
+        help="keep the other tunnels running when a tunnel fails to start",
+    )
+    up.add_argument("--http", type=int, help="serve the HTTP API on this port")
+    up.add_argument(
+        "--trace",
+        help="write a trace of the tunnel starts on exit, .jsonl for JSON lines, Chrome trace format otherwise",
+    )
+    up.set_defaults(func=cmd_up)
+
+    down = commands.add_parser(
+        "down", help="stop tunnels of the daemon, or a running 'ssmports up'"
+    )
+    down.add_argument("labels", nargs="*", help="connections to stop")
+    down.add_argument("-g", "--group", action="append", default=[], help="stop a group")
+    down.add_argument("--timeout", type=float, default=30)
+    down.set_defaults(func=cmd_down)
+
+    status = commands.add_parser("status", help="show the running tunnels")
+    status.add_argument("--json", action="store_true")
+    status.set_defaults(func=cmd_status)
+
+    list_ = commands.add_parser("list", help="list the configured connections")
+    list_.add_argument("--json", action="store_true")
+    list_.set_defaults(func=cmd_list)
+
+    daemon = commands.add_parser(
+        "daemon", help="own the tunnels of this user and serve the other frontends"
+    )
+    daemon.add_argument(
+        "--autostart", action="store_true", help="start the autostart connections"
+    )
+    daemon.add_argument("--http", type=int, help="serve the HTTP API on this port")
+    daemon.add_argument(
+        "--trace",
+        help="write a trace of the tunnel starts on exit, .jsonl for JSON lines, Chrome trace format otherwise",
+    )
+    daemon.set_defaults(func=cmd_daemon)
+
+    shutdown = commands.add_parser(
+        "shutdown", help="stop the daemon and all of its tunnels"
+    )
+    shutdown.set_defaults(func=cmd_shutdown)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    try:
+        return args.func(args)
+    except (SSMPortForwardError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
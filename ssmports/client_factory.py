@@ -0,0 +1,120 @@
+import logging
+import threading
+from collections import Counter
+
+from botocore.config import Config
+
+from . import metrics
+from .rate_limiter import TokenBucket
+
+
+class ClientFactory:
+    """
+    Creates boto3 clients with shared settings: adaptive retries, connection pool size and timeouts.
+    Every request attempt first takes a token from a bucket shared by all clients of the same
+    (account, region, service), and throttling errors are counted per key. Until STS returned the
+    account of a profile, such as for the STS call itself, the profile name stands in for it.
+    """
+
+    THROTTLING_ERRORS = {
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "RequestLimitExceeded",
+        "RequestThrottled",
+        "TooManyRequestsException",
+    }
+
+    def __init__(
+        self,
+        rate=10.0,
+        max_attempts=10,
+        max_pool_connections=50,
+        connect_timeout=10,
+        read_timeout=60,
+    ):
+        self.logger = logging.getLogger()
+        self.limiters = {}  # (account, region, service) -> TokenBucket
+        self.calls = Counter()  # (account, region, service) -> request attempts
+        self.throttles = Counter()  # (account, region, service) -> throttled attempts
+        self._lock = threading.Lock()
+        # The hooks of every client run on the threads making requests
+        self._counts_lock = threading.Lock()
+        self.update_settings(
+            rate=rate,
+            max_attempts=max_attempts,
+            max_pool_connections=max_pool_connections,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+        )
+
+    def update_settings(
+        self,
+        rate=None,
+        max_attempts=None,
+        max_pool_connections=None,
+        connect_timeout=None,
+        read_timeout=None,
+    ):
+        """Change settings, these apply to clients created afterwards and to all rate limiters"""
+        with self._lock:
+            if rate is not None:
+                self.rate = rate
+                for limiter in self.limiters.values():
+                    limiter.rate = rate
+            for name, value in (
+                ("max_attempts", max_attempts),
+                ("max_pool_connections", max_pool_connections),
+                ("connect_timeout", connect_timeout),
+                ("read_timeout", read_timeout),
+            ):
+                if value is not None:
+                    setattr(self, name, value)
+            self.config = Config(
+                retries={"mode": "adaptive", "total_max_attempts": self.max_attempts},
+                max_pool_connections=self.max_pool_connections,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+            )
+
+    def _limiter(self, key):
+        with self._lock:
+            if key not in self.limiters:
+                self.limiters[key] = TokenBucket(self.rate)
+            return self.limiters[key]
+
+    def create_client(
+        self, session, service, region_name=None, account=None, profile=None
+    ):
+        """profile keys the rate limit when the account is not known yet, and labels the API call metrics"""
+        # Creating clients from a shared session is not thread safe
+        with self._lock:
+            client = session.client(
+                service, region_name=region_name, config=self.config
+            )
+        key = (account or profile, client.meta.region_name, service)
+        limiter = self._limiter(key)
+        labels = {
+            "profile": profile or "",
+            "region": client.meta.region_name,
+            "service": service,
+        }
+
+        def before_attempt(operation_name=None, **kwargs):
+            with self._counts_lock:
+                self.calls[key] += 1
+            metrics.AWS_API_CALLS.inc(operation=operation_name or "", **labels)
+            limiter.acquire()
+
+        def after_attempt(parsed_response=None, **kwargs):
+            error_code = (parsed_response or {}).get("Error", {}).get("Code")
+            if error_code in self.THROTTLING_ERRORS:
+                with self._counts_lock:
+                    self.throttles[key] += 1
+                metrics.AWS_THROTTLES.inc(**labels)
+                self.logger.debug(f"Throttled by {service} in {key[1]}: {error_code}")
+
+        # Both events fire for every attempt, including retries
+        client.meta.events.register("request-created", before_attempt)
+        client.meta.events.register("response-received", after_attempt)
+        return client
@@ -0,0 +1,61 @@
+class ConnectionDiff:
+    """Structured difference between two sets of connections, as produced by diff_connections"""
+
+    def __init__(self, added, removed, changed, cosmetic, unchanged):
+        self.added = added  # [label]
+        self.removed = removed  # [label]
+        self.changed = changed  # {label: [changed session keys]}
+        self.cosmetic = cosmetic  # [label]
+        self.unchanged = unchanged  # [label]
+
+    @property
+    def has_changes(self):
+        return bool(self.added or self.removed or self.changed or self.cosmetic)
+
+    def __repr__(self):
+        return (
+            f"ConnectionDiff(added={self.added}, removed={self.removed}, "
+            f"changed={self.changed}, cosmetic={self.cosmetic})"
+        )
+
+
+# Changing any of these requires the SSM session to be restarted
+SESSION_KEYS = (
+    "target_host",
+    "local_port",
+    "remote_port",
+    "jump_instance",
+    "profile",
+    "region",
+    "readiness",
+    "reconnect",
+    "relay",
+)
+
+
+def diff_connections(old, new):
+    """
+    Compare two {label: connection} dicts. A connection is "changed" when one of the SESSION_KEYS
+    differs, and "cosmetic" when only other keys (link, command, group, ...) differ.
+    """
+    added = [label for label in new if label not in old]
+    removed = [label for label in old if label not in new]
+    changed = {}
+    cosmetic = []
+    unchanged = []
+    for label in new:
+        if label not in old:
+            continue
+        old_connection, new_connection = old[label], new[label]
+        changed_keys = [
+            key
+            for key in SESSION_KEYS
+            if old_connection.get(key) != new_connection.get(key)
+        ]
+        if changed_keys:
+            changed[label] = changed_keys
+        elif old_connection != new_connection:
+            cosmetic.append(label)
+        else:
+            unchanged.append(label)
+    return ConnectionDiff(added, removed, changed, cosmetic, unchanged)
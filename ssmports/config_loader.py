@@ -0,0 +1,504 @@
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
+
+from . import tracing
+from .aws_sessions import AWSSessions
+from .credential_cache import CredentialCache
+from .ecs_id_resolver import ECSIDResolver
+from .id_cache import InstanceIDCache
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+from .exceptions import SSMPortForwardError
+
+
+class ConfigLoader:
+    DEFAULT_APP_SETTINGS = {
+        "app_config": {
+            "show_full_stacktrace": False,
+            "resolve_workers": 8,
+            "ecs_cache_ttl": 86400,
+            "ecs_cache_path": InstanceIDCache.DEFAULT_PATH,
+            "watch_config": False,
+            "engine": "threads",
+            "start_concurrency": 4,
+            "start_rate": 2.0,
+            "aws_api_rate": 10.0,
+            "aws_max_attempts": 10,
+            "aws_max_pool_connections": 50,
+            "aws_connect_timeout": 10,
+            "aws_read_timeout": 60,
+            "lazy_load": False,
+            "credential_warning": 900,
+            "credential_cache": False,
+            "credential_cache_path": CredentialCache.DEFAULT_PATH,
+            "http_api_port": 0,
+            "trace_file": "",
+        }
+    }
+
+    DEFAULT_CONFIG = {
+        "profile": "my-jump-account",
+        "region": "eu-west-1",
+        "jump_instance": "my-bastion-container",
+        "connections": {
+            "Production Database": {
+                "target_host": "prod-db.cluster-xxxx.eu-west-1.rds.amazonaws.com",
+                "local_port": 5432,
+                "remote_port": 5432,
+                "autostart": True,
+            },
+            "Staging Database": {
+                "target_host": "test-db.cluster-xxxx.eu-west-1.rds.amazonaws.com",
+                "local_port": 5433,
+                "remote_port": 5432,
+                "profile": "my-test-account",
+                "jump_instance": "i-0123456789abcdef0",
+            },
+            "Staging Database over ECS": {
+                "target_host": "test-db.cluster-xxxx.eu-west-1.rds.amazonaws.com",
+                "local_port": 5434,
+                "remote_port": 5432,
+                "profile": "my-test-account",
+                "jump_instance": "ecs:my-cluster_12345678901234567890123456789012_12345678901234567890123456789012-0151737364",
+            },
+        },
+    }
+
+    SCHEMA = {
+        "type": "object",
+        "properties": {
+            "profile": {"type": "string"},
+            "region": {"type": "string"},
+            "jump_instance": {"type": "string"},
+            "app_config": {
+                "type": "object",
+                "properties": {
+                    "show_full_stacktrace": {"type": "boolean"},
+                    "resolve_workers": {"type": "integer", "minimum": 1},
+                    "ecs_cache_ttl": {"type": "integer", "minimum": 0},
+                    "ecs_cache_path": {"type": "string"},
+                    "watch_config": {"type": "boolean"},
+                    "engine": {"enum": ["threads", "asyncio"]},
+                    "start_concurrency": {"type": "integer", "minimum": 1},
+                    "start_rate": {"type": "number", "exclusiveMinimum": 0},
+                    "aws_api_rate": {"type": "number", "exclusiveMinimum": 0},
+                    "aws_max_attempts": {"type": "integer", "minimum": 1},
+                    "aws_max_pool_connections": {"type": "integer", "minimum": 1},
+                    "aws_connect_timeout": {"type": "number", "exclusiveMinimum": 0},
+                    "aws_read_timeout": {"type": "number", "exclusiveMinimum": 0},
+                    "lazy_load": {"type": "boolean"},
+                    "credential_warning": {"type": "integer", "minimum": 0},
+                    "credential_cache": {"type": "boolean"},
+                    "credential_cache_path": {"type": "string"},
+                    "http_api_port": {
+                        "type": "integer",
+                        "minimum": 0,
+                        "maximum": 65535,
+                    },
+                    "trace_file": {"type": "string"},
+                },
+            },
+            "connections": {
+                "type": "object",
+                "additionalProperties": {
+                    "type": "object",
+                    "properties": {
+                        "target_host": {"type": "string"},
+                        "local_port": {"type": "integer"},
+                        "remote_port": {"type": "integer"},
+                        "instance_id": {"type": "string"},
+                        "link": {"type": "string"},
+                        "profile": {"type": "string"},
+                        "autostart": {"type": "boolean"},
+                        "readiness": {"enum": ["output", "probe"]},
+                        "reconnect": {"type": "boolean"},
+                        "relay": {"type": "boolean"},
+                    },
+                    "required": [
+                        "target_host",
+                        "local_port",
+                        "remote_port",
+                    ],
+                },
+            },
+        },
+        "required": ["connections"],
+    }
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self.ecs_id_resolvers = {}  # (profile, region) -> ECSIDResolver
+        self.aws_sessions = AWSSessions()
+        self.connection_errors = {}  # connection name -> error message
+        self.id_cache = None
+        # jump_instance values that name a container and still need resolving, per (profile, region).
+        # Resolved IDs are kept apart, their format is not checked again.
+        self.pending_names = set()  # (profile, region, container_name)
+        self.resolved_ids = set()  # instance IDs found by resolving a container name
+        # (profile, region) -> RLock, so one resolution per account runs at a time
+        self._scope_locks = {}
+        self._lock = threading.Lock()
+
+    def validate_schema(self, config):
+        try:
+            jsonschema.validate(instance=config, schema=self.SCHEMA)
+        except jsonschema.exceptions.ValidationError as e:
+            raise SSMPortForwardError(f"Configuration validation failed: {e.message}")
+
+    def validate_instance_id(self, instance_id):
+        ec2_instance_regex = r"^i-[0-9a-fA-F]{8,17}$"
+        # See https://docs.aws.amazon.com/systems-manager/latest/userguide/session-manager-working-with-sessions-start.html
+        # for ECS instance format
+        ecs_instance_regex = (
+            r"^ecs:[A-Za-z0-9-]{1,255}_[a-f0-9]{32}_[a-f0-9]{32}-[\d]{10}$"
+        )
+        if not re.match(ec2_instance_regex, instance_id) and not re.match(
+            ecs_instance_regex, instance_id
+        ):
+            raise SSMPortForwardError(f"Invalid instance_id format: {instance_id}")
+
+    def get_ecs_id_resolver(self, profile_name=None, region_name=None):
+        key = (profile_name, region_name)
+        with self._lock:
+            if key not in self.ecs_id_resolvers:
+                self.ecs_id_resolvers[key] = ECSIDResolver()
+            return self.ecs_id_resolvers[key]
+
+    def _scope_lock(self, profile_name=None, region_name=None):
+        with self._lock:
+            return self._scope_locks.setdefault(
+                (profile_name, region_name), threading.RLock()
+            )
+
+    def get_id_cache(self, app_config):
+        """Return the on-disk ECS ID cache, or None if caching is disabled (ecs_cache_ttl of 0 or unset)"""
+        ttl = app_config.get("ecs_cache_ttl", 0)
+        if not ttl:
+            return None
+        path = os.path.expanduser(
+            app_config.get("ecs_cache_path", InstanceIDCache.DEFAULT_PATH)
+        )
+        if self.id_cache is None or self.id_cache.path != path:
+            self.id_cache = InstanceIDCache(path, ttl=ttl)
+        self.id_cache.ttl = ttl
+        return self.id_cache
+
+    def prune_unused_contexts(self, config):
+        """
+        Drop the AWS sessions and ECS resolvers of profiles and regions that are no longer used by any
+        connection. Everything still in use is kept, so a reload does not repeat STS calls or ECS sweeps.
+        """
+        connections = config.get("connections", {}).values()
+        scopes = {(c.get("profile"), c.get("region")) for c in connections}
+        self.aws_sessions.prune({profile for profile, _ in scopes})
+        for scope in list(self.ecs_id_resolvers):
+            if scope not in scopes:
+                self.ecs_id_resolvers.pop(scope)
+
+    def collect_unresolved_container_names(self, config):
+        """
+        Find the connections whose jump_instance is a container name rather than an instance ID, and
+        record those names as pending. IDs this loader resolved are never taken for a name.
+        Returns {(profile, region): {container_name: [connection names]}}
+        """
+        unresolved = {}
+        for name, connection in config.get("connections", {}).items():
+            instance_id = connection.get("jump_instance", "")
+            if instance_id in self.resolved_ids:
+                continue
+            try:
+                self.validate_instance_id(instance_id)
+            except SSMPortForwardError:
+                key = (connection.get("profile"), connection.get("region"))
+                containers = unresolved.setdefault(key, {})
+                containers.setdefault(instance_id, []).append(name)
+                self.pending_names.add((*key, instance_id))
+        return unresolved
+
+    def resolve_container_names(self, profile, region, container_names, id_cache=None):
+        """
+        Resolve the container names of a single (profile, region), returns {container_name: instance_id}.
+        IDs found in the cache are checked with a single describe_tasks call, only the rest needs a sweep.
+        Resolutions of the same (profile, region) run one at a time, so they share the sweep.
+        """
+        with self._scope_lock(profile, region):
+            resolved = self._resolve_container_names(
+                profile, region, container_names, id_cache
+            )
+        self.resolved_ids.update(resolved.values())
+        return resolved
+
+    def _resolve_container_names(self, profile, region, container_names, id_cache):
+        ecs_client = self.aws_sessions.client(
+            "ecs", profile_name=profile, region_name=region
+        )
+        resolver = self.get_ecs_id_resolver(profile, region)
+        # IDs found before a reload may belong to tasks that stopped since, check them like cached IDs
+        candidates = {
+            container_name: resolver.found_ids.pop(container_name)
+            for container_name in container_names
+            if container_name in resolver.found_ids
+        }
+        if id_cache:
+            for container_name in container_names:
+                instance_id = id_cache.get(profile, region, container_name)
+                if instance_id and container_name not in candidates:
+                    candidates[container_name] = instance_id
+        if candidates:
+            valid = resolver.validate_instance_ids(candidates, ecs_client)
+            if id_cache:
+                for container_name in candidates.keys() - valid.keys():
+                    id_cache.discard(profile, region, container_name)
+
+        resolved = resolver.resolve_task_names(container_names, ecs_client)
+        if id_cache:
+            for container_name, instance_id in resolved.items():
+                id_cache.put(profile, region, container_name, instance_id)
+        for container_name in container_names:
+            if container_name not in resolved:
+                raise ValueError(
+                    f"Task name '{container_name}' not found in any ECS cluster."
+                )
+        return resolved
+
+    def apply_known_instance_ids(self, config):
+        """Fill in container names that were already resolved by this process, without any AWS calls"""
+        unresolved = self.collect_unresolved_container_names(config)
+        for scope, containers in unresolved.items():
+            resolver = self.ecs_id_resolvers.get(scope)
+            if not resolver:
+                continue
+            for container_name, names in containers.items():
+                if instance_id := resolver.found_ids.get(container_name):
+                    self.resolved_ids.add(instance_id)
+                    for name in names:
+                        config["connections"][name]["jump_instance"] = instance_id
+
+    def forget_instance_id(self, connection):
+        """
+        Forget the ECS instance ID of a connection after a start found its target gone. The container
+        name is put back in the connection, so the next start resolves it again.
+        """
+        profile, region = connection.get("profile"), connection.get("region")
+        resolver = self.ecs_id_resolvers.get((profile, region))
+        if not resolver:
+            return None
+        container_names = resolver.forget(connection.get("jump_instance"))
+        if not container_names:
+            return None
+        self.resolved_ids.discard(connection.get("jump_instance"))
+        self.pending_names.add((profile, region, container_names[0]))
+        if self.id_cache:
+            for container_name in container_names:
+                self.id_cache.discard(profile, region, container_name)
+            self.id_cache.save()
+        connection["jump_instance"] = container_names[0]
+        return container_names[0]
+
+    def resolve_connection(self, connection):
+        """
+        Resolve the container name of a single connection in place, used on first use in lazy_load mode.
+        Only values recorded as pending container names are resolved, a background resolution of the
+        same account is waited for.
+        """
+        profile, region = connection.get("profile"), connection.get("region")
+        if (profile, region, connection.get("jump_instance")) not in self.pending_names:
+            return
+        with self._scope_lock(profile, region):
+            container_name = connection["jump_instance"]
+            if (profile, region, container_name) not in self.pending_names:
+                # Resolved in place by the resolution that was waited for
+                return
+            with tracing.span(
+                "ecs.resolve", profile=profile, region=region, container=container_name
+            ) as span:
+                resolved = self.resolve_container_names(
+                    profile, region, [container_name], self.id_cache
+                )
+                if self.id_cache:
+                    self.id_cache.save()
+                connection["jump_instance"] = resolved[container_name]
+                span.set(target=connection["jump_instance"])
+
+    def validate_or_load_instance_ids(self, config, raise_errors=True):
+        """
+        Resolve container names into ECS instance IDs. Every (profile, region) is resolved in its own
+        worker, so load time is set by the slowest account. Failures are collected per connection in
+        connection_errors and reported together once all accounts are done, unless raise_errors is off.
+        """
+        logger = logging.getLogger()
+        unresolved = self.collect_unresolved_container_names(config)
+        self.connection_errors = {}
+        if not unresolved:
+            return
+
+        app_config = config.get("app_config", {})
+        max_workers = app_config.get(
+            "resolve_workers",
+            self.DEFAULT_APP_SETTINGS["app_config"]["resolve_workers"],
+        )
+        id_cache = self.get_id_cache(app_config)
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(unresolved)),
+            thread_name_prefix="config-resolver",
+        ) as executor:
+            futures = {
+                key: executor.submit(
+                    self.resolve_container_names,
+                    key[0],
+                    key[1],
+                    list(containers),
+                    id_cache,
+                )
+                for key, containers in unresolved.items()
+            }
+
+        if id_cache:
+            id_cache.save()
+
+        # Merge in config order, regardless of which account finished first
+        for (profile, region), containers in unresolved.items():
+            try:
+                resolved = futures[(profile, region)].result()
+            except Exception as e:
+                logger.error(f"Error resolving instance ID from a container name: {e}")
+                # Credentials may have expired, validate them again on the next load
+                self.aws_sessions.invalidate(profile)
+                for names in containers.values():
+                    for name in names:
+                        self.connection_errors[name] = (
+                            f"Failed to create AWS session with profile '{profile}' due to AWS error: {e}"
+                        )
+                continue
+
+            for container_name, names in containers.items():
+                for name in names:
+                    config["connections"][name]["jump_instance"] = resolved[
+                        container_name
+                    ]
+
+        if self.connection_errors and raise_errors:
+            errors = [
+                f"{name}: {self.connection_errors[name]}"
+                for name in config["connections"]
+                if name in self.connection_errors
+            ]
+            if len(errors) == 1:
+                raise SSMPortForwardError(errors[0])
+            raise SSMPortForwardError(
+                f"Failed to resolve {len(errors)} connections:\n" + "\n".join(errors)
+            )
+
+    def resolve_in_background(self, config, on_done=None):
+        """
+        Resolve container names on a background thread, used with lazy_load. Failures do not abort
+        anything, on_done is called with {connection name: error message} once all accounts are done.
+        """
+
+        def run():
+            try:
+                self.validate_or_load_instance_ids(config, raise_errors=False)
+            except Exception as e:
+                logging.getLogger().error(f"Error resolving container names: {e}")
+            if on_done:
+                on_done(dict(self.connection_errors))
+
+        thread = threading.Thread(target=run, daemon=True, name="config-resolver")
+        thread.start()
+        return thread
+
+    def fold_defaults_into_connections(self, config):
+        defaults = {}
+        for default in ["profile", "region", "jump_instance"]:
+            if default in config:
+                defaults[default] = config[default]
+
+        for name in config["connections"]:
+            connection = config["connections"][name]
+            for key, value in defaults.items():
+                if key not in connection:
+                    connection[key] = value
+
+    def create_default_config_file(self, config_path):
+        if not os.path.exists(config_path):
+            with open(config_path, "w") as f:
+                f.write(json.dumps(self.DEFAULT_CONFIG, indent=2))
+            full_path = os.path.abspath(config_path)
+            print(
+                f"No sessions.json found, created default configuration at {full_path}"
+            )
+
+    def add_app_config_defaults(self, config):
+        if "app_config" not in config:
+            config["app_config"] = {}
+        for key, value in self.DEFAULT_APP_SETTINGS["app_config"].items():
+            if key not in config["app_config"]:
+                config["app_config"][key] = value
+
+    def configure_aws_clients(self, app_config):
+        """Apply the retry, rate limit and connection settings to the AWS clients created from now on"""
+        self.aws_sessions.client_factory.update_settings(
+            rate=app_config.get("aws_api_rate"),
+            max_attempts=app_config.get("aws_max_attempts"),
+            max_pool_connections=app_config.get("aws_max_pool_connections"),
+            connect_timeout=app_config.get("aws_connect_timeout"),
+            read_timeout=app_config.get("aws_read_timeout"),
+        )
+
+    def configure_credential_cache(self, app_config):
+        """Enable or disable the on-disk credential cache, following the credential_cache app setting"""
+        if not app_config.get("credential_cache"):
+            self.aws_sessions.credential_cache = None
+            return
+        path = os.path.expanduser(
+            app_config.get("credential_cache_path", CredentialCache.DEFAULT_PATH)
+        )
+        cache = self.aws_sessions.credential_cache
+        if cache is None or cache.path != path:
+            self.aws_sessions.credential_cache = CredentialCache(path)
+
+    def read_config(self):
+        """Read and validate the configuration file without any AWS calls, container names stay unresolved"""
+        if not os.path.exists(self.config_path):
+            self.create_default_config_file(self.config_path)
+
+        with open(self.config_path, "r") as f:
+            try:
+                config = json.load(f)
+            except json.JSONDecodeError as e:
+                raise SSMPortForwardError(f"Failed to parse JSON config: {e}")
+
+        self.add_app_config_defaults(config)
+        self.validate_schema(config)
+        self.fold_defaults_into_connections(config)
+        return config
+
+    def load_config(self):
+        """Load and return the configuration from a JSON file."""
+        config = self.read_config()
+        self.configure_aws_clients(config["app_config"])
+        self.configure_credential_cache(config["app_config"])
+        self.prune_unused_contexts(config)
+        if config["app_config"].get("lazy_load"):
+            # No AWS calls here: credentials are validated in the background, and container names
+            # are resolved by resolve_in_background or on first use
+            self.aws_sessions.lazy_validation = True
+            self.connection_errors = {}
+            self.get_id_cache(config["app_config"])
+            self.apply_known_instance_ids(config)
+        else:
+            self.aws_sessions.lazy_validation = False
+            self.validate_or_load_instance_ids(config)
+
+        return config, self.aws_sessions
@@ -0,0 +1,149 @@
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class ConfigWatcher:
+    """
+    Watch a config file and call on_change after it was rewritten with different content. Uses inotify
+    on Linux and falls back to polling the file mtime elsewhere. Bursts of writes are debounced, and
+    saves that leave the content unchanged are skipped by comparing a hash of the file.
+    """
+
+    def __init__(
+        self, path, on_change, debounce=0.5, poll_interval=1.0, use_inotify=True
+    ):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.logger = logging.getLogger()
+        self.stop_event = threading.Event()
+        self.ready = threading.Event()  # set once changes are being watched
+        self.thread = None
+        self.last_hash = self._hash()
+
+    def _hash(self):
+        try:
+            with open(self.path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    def _mtime(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        if self.use_inotify:
+            try:
+                self._watch_inotify()
+                return
+            except OSError as e:
+                self.logger.warning(
+                    f"inotify unavailable ({e}), polling {self.path} instead"
+                )
+        self._watch_polling()
+
+    def _changed(self):
+        """Called after a debounced burst of writes, only notifies when the content changed"""
+        current_hash = self._hash()
+        if current_hash is None or current_hash == self.last_hash:
+            return
+        self.last_hash = current_hash
+        try:
+            self.on_change()
+        except Exception as e:
+            self.logger.error(f"Error handling change of {self.path}: {e}")
+
+    def _watch_polling(self):
+        last_mtime = self._mtime()
+        self.ready.set()
+        while not self.stop_event.wait(self.poll_interval):
+            mtime = self._mtime()
+            if mtime == last_mtime:
+                continue
+            # Wait until the file stops changing
+            while not self.stop_event.wait(self.debounce):
+                settled = self._mtime()
+                if settled == mtime:
+                    break
+                mtime = settled
+            last_mtime = mtime
+            self._changed()
+
+    def _watch_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            # Watch the directory, editors and generators often replace the file instead of writing it
+            directory, filename = os.path.split(self.path)
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+            filename = os.fsencode(filename)
+            self.ready.set()
+
+            while not self.stop_event.is_set():
+                if not self._read_inotify(fd, filename, timeout=self.poll_interval):
+                    continue
+                # Debounce: keep reading until the directory has been quiet for a while
+                while not self.stop_event.is_set() and self._read_inotify(
+                    fd, filename, timeout=self.debounce
+                ):
+                    pass
+                self._changed()
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read_inotify(fd, filename, timeout):
+        """Wait up to timeout for events, returns True if any of them concerned the watched file"""
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return False
+        offset = 0
+        matched = False
+        while offset + EVENT_HEADER.size <= len(data):
+            _, _, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + name_length].rstrip(b"\0")
+            offset += name_length
+            matched = matched or name == filename
+        return matched
@@ -0,0 +1,356 @@
+import logging
+import threading
+import time
+
+from . import tracing
+from .async_forwarder import AsyncSSMPortForwarder
+from .config_diff import diff_connections
+from .config_loader import ConfigLoader
+from .credential_monitor import CredentialMonitor
+from .exceptions import SSMPortForwardError
+from .forwarder import SSMPortForwarder
+from .scheduler import StartScheduler
+
+
+class TunnelController:
+    """
+    Headless owner of the configuration, the forwarder and the start scheduler: starts and stops tunnels
+    by label or group and reports their status. Used by the command line, the control servers and the
+    GUI, it does not depend on Tk.
+
+    Given a forwarder such as a RemoteForwarder, the tunnels run in another process: the connections
+    are those of that process, resolving containers and watching credentials are left to it.
+    """
+
+    def __init__(
+        self,
+        config_path="sessions.json",
+        config_loader=None,
+        logger=None,
+        forwarder=None,
+    ):
+        self.config_loader = config_loader or ConfigLoader(config_path)
+        self.logger = logger or logging.getLogger()
+        self.connections = {}
+        self.app_config = {}
+        self.aws_sessions = None
+        self.remote = forwarder is not None
+        self.forwarder = forwarder
+        self.scheduler = None
+        self.credential_monitor = None
+        self.active_session_ids = {}  # label -> session_id
+        self.started_at = {}  # label -> time.time() the tunnel came up
+        self.errors = {}  # label -> error of the last failed start
+        self.starting = set()  # labels whose start is in progress
+        self.listeners = []  # callables called with (label, state)
+        self.credential_listeners = []  # callables called with (profile, state, expiry)
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """
+        Register callback(label, state), called for forwarder states and for queued, starting, running
+        and failed starts
+        """
+        self.listeners.append(callback)
+
+    def add_credential_listener(self, callback):
+        """Register callback(profile, state, expiry), for "expiring", "expired" and "refreshed" credentials"""
+        self.credential_listeners.append(callback)
+
+    def _notify_credentials(self, profile, state, expiry=None):
+        for listener in self.credential_listeners:
+            try:
+                listener(profile, state, expiry)
+            except Exception as e:
+                self.logger.error(f"Error in credential listener: {e}")
+
+    def _notify(self, label, state):
+        for listener in self.listeners:
+            try:
+                listener(label, state)
+            except Exception as e:
+                self.logger.error(f"[{label}] Error in controller listener: {e}")
+
+    def load(self):
+        """Load the configuration, the forwarder is created on the first load"""
+        if self.remote:
+            # The daemon may run with another configuration file, never read or create one here
+            config = {"connections": self.forwarder.connections(), "app_config": {}}
+        else:
+            config, self.aws_sessions = self.config_loader.load_config()
+        self.connections = config.get("connections", {})
+        self.app_config = config.get("app_config", {})
+        if self.scheduler is None:
+            self._create_forwarder()
+            self._create_credential_monitor()
+        return config
+
+    def reload(self):
+        """
+        Load the configuration again. Tunnels of removed connections are stopped and tunnels whose
+        session settings changed are restarted, the others keep running. Returns the ConnectionDiff.
+        """
+        old_connections = self.connections
+        if self.remote:
+            # The other process reloads and restarts its own tunnels
+            self.forwarder.reload()
+        self.load()
+        diff = diff_connections(old_connections, self.connections)
+        if self.remote:
+            with self._lock:
+                self.active_session_ids = self.forwarder.running_sessions()
+            return diff
+        for label in diff.removed:
+            if label in self.active_session_ids:
+                self.logger.info(f"Connection {label} was removed, stopping session...")
+                self.stop(label, wait=False)
+        labels = [label for label in diff.changed if label in self.active_session_ids]
+        for label in labels:
+            self.logger.info(
+                f"Settings {', '.join(diff.changed[label])} of {label} changed, restarting session..."
+            )
+        self.restart(labels)
+        return diff
+
+    def restart(self, labels):
+        """Stop tunnels and queue them to start again, for new settings or credentials"""
+        for label in labels:
+            self.stop(label, wait=True)
+        if labels:
+            self.start_many(labels, wait=False)
+
+    def _create_credential_monitor(self):
+        warn_before = self.app_config.get("credential_warning")
+        if not warn_before or self.remote:
+            return
+        self.credential_monitor = CredentialMonitor(
+            self.aws_sessions,
+            warn_before=warn_before,
+            on_expiring=self._on_credentials_expiring,
+            on_expired=self._on_credentials_expired,
+            on_refreshed=self._on_credentials_refreshed,
+        )
+        self.credential_monitor.start()
+
+    def _on_credentials_expiring(self, profile, expiry):
+        self.logger.warning(
+            f"AWS credentials of profile '{profile}' expire at {expiry:%H:%M:%S %Z}."
+        )
+        self._notify_credentials(profile, "expiring", expiry)
+
+    def _on_credentials_expired(self, profile):
+        self.logger.error(
+            f"AWS credentials of profile '{profile}' have expired, waiting for new credentials..."
+        )
+        self._notify_credentials(profile, "expired")
+
+    def _on_credentials_refreshed(self, profile):
+        """Restart only the tunnels of the profile, so they pick up the new credentials"""
+        labels = [
+            label
+            for label in list(self.active_session_ids)
+            if self.connections.get(label, {}).get("profile") == profile
+        ]
+        self.logger.info(
+            f"AWS credentials of profile '{profile}' refreshed, restarting {len(labels)} tunnels."
+        )
+        self.restart(labels)
+        self._notify_credentials(profile, "refreshed")
+
+    def close(self):
+        """Stop the background work of the controller, the tunnels are stopped with stop_all"""
+        if self.credential_monitor:
+            self.credential_monitor.stop()
+
+    def _create_forwarder(self):
+        if self.remote:
+            self.active_session_ids.update(self.forwarder.running_sessions())
+        elif self.app_config.get("engine") == "asyncio":
+            self.forwarder = AsyncSSMPortForwarder(self.logger)
+            self.logger.info("Using the asyncio tunnel engine.")
+        else:
+            self.forwarder = SSMPortForwarder(self.logger)
+        self.forwarder.add_listener(self._on_session_state)
+        self.scheduler = StartScheduler(
+            self.start,
+            max_concurrency=self.app_config.get("start_concurrency", 4),
+            rate=self.app_config.get("start_rate", 2.0),
+        )
+
+    def _on_session_state(self, label, state):
+        if state == "running" and label in self.starting:
+            # Reported by start once the session is recorded, so listeners can look it up
+            return
+        if state in ("failed", "stopped"):
+            with self._lock:
+                self.active_session_ids.pop(label, None)
+                self.started_at.pop(label, None)
+        elif (
+            state == "running" and self.remote and label not in self.active_session_ids
+        ):
+            # Started by another frontend of the same process
+            sid = self.forwarder.running_sessions().get(label)
+            if sid:
+                with self._lock:
+                    self.active_session_ids[label] = sid
+        self._notify(label, state)
+
+    def select(self, labels=(), groups=()):
+        """Return the labels of the given connections and groups in config order, unknown names raise"""
+        unknown = [label for label in labels if label not in self.connections]
+        known_groups = {c.get("group") for c in self.connections.values()}
+        unknown += [f"group {group}" for group in groups if group not in known_groups]
+        if unknown:
+            raise SSMPortForwardError(f"Unknown connections: {', '.join(unknown)}")
+        return [
+            label
+            for label, connection in self.connections.items()
+            if label in labels or connection.get("group") in groups
+        ]
+
+    def autostart_labels(self):
+        return [
+            label
+            for label, connection in self.connections.items()
+            if connection.get("autostart")
+        ]
+
+    def port_in_use_by(self, label):
+        """Return the label of another running tunnel on the same local port, or None"""
+        local_port = self.connections[label]["local_port"]
+        for active_label in list(self.active_session_ids):
+            if active_label != label:
+                active = self.connections.get(active_label, {})
+                if active.get("local_port") == local_port:
+                    return active_label
+        return None
+
+    def start(self, label):
+        """Start a tunnel and block until it is ready, returns the session ID"""
+        connection = self.connections[label]
+        if label in self.active_session_ids:
+            return self.active_session_ids[label]
+        if active_label := self.port_in_use_by(label):
+            raise SSMPortForwardError(
+                f"Local port {connection['local_port']} is already in use by connection '{active_label}'."
+            )
+        self.starting.add(label)
+        self._notify(label, "starting")
+        try:
+            with tracing.span(
+                "connection.start",
+                label=label,
+                profile=connection.get("profile"),
+                region=connection.get("region"),
+                target=connection.get("jump_instance"),
+                target_host=connection.get("target_host"),
+            ) as span:
+                if self.remote:
+                    ssm_client = None
+                else:
+                    # With lazy_load the container name may not have been resolved yet
+                    self.config_loader.resolve_connection(connection)
+                    ssm_client = self.aws_sessions.client(
+                        "ssm",
+                        profile_name=connection.get("profile"),
+                        region_name=connection.get("region"),
+                    )
+                sid = self.forwarder.start_session(
+                    ssm_client=ssm_client, label=label, **connection
+                )
+                span.set(session_id=sid)
+            with self._lock:
+                self.active_session_ids[label] = sid
+                self.started_at[label] = time.time()
+        except Exception as e:
+            self.errors[label] = str(e)
+            self.logger.warning(f"Failed to start {label}: {e}")
+            self._forget_stopped_target(label, e)
+            self._notify(label, "failed")
+            raise
+        finally:
+            self.starting.discard(label)
+        self.errors.pop(label, None)
+        self.logger.info(f"Session started: {sid} for {label}")
+        self._notify(label, "running")
+        return sid
+
+    def _forget_stopped_target(self, label, error):
+        """The task of a resolved container stopped, resolve the container name again on the next start"""
+        if self.remote or "TargetNotConnected" not in str(error):
+            return
+        container_name = self.config_loader.forget_instance_id(self.connections[label])
+        if container_name:
+            self.logger.info(
+                f"[{label}] Container '{container_name}' is no longer running there, it is resolved again on the next start."
+            )
+
+    def start_many(self, labels, wait=True):
+        """Queue starts in the scheduler, with wait block until all of them are handled"""
+        for label in labels:
+            if label in self.active_session_ids:
+                continue
+            connection = self.connections[label]
+            priority = (
+                0 if connection.get("autostart") else 1,
+                connection.get("group", ""),
+                label,
+            )
+            scope = (connection.get("profile"), connection.get("region"))
+            if self.scheduler.submit(label, scope, priority):
+                self._notify(label, "queued")
+        if wait:
+            self.scheduler.join()
+        return {label: self.active_session_ids.get(label) for label in labels}
+
+    def stop(self, label, wait=True):
+        """Stop a tunnel, returns False if it was not running"""
+        if self.scheduler:
+            self.scheduler.cancel(label)
+        with self._lock:
+            sid = self.active_session_ids.pop(label, None)
+            self.started_at.pop(label, None)
+        if sid is None:
+            return False
+        self.logger.info(f"Stopping session {sid} for {label}...")
+        return self.forwarder.stop_session(sid, wait=wait)
+
+    def stop_all(self, wait=True):
+        for label in list(self.active_session_ids):
+            self.stop(label, wait=wait)
+
+    def status(self):
+        """Return {label: status} for every connection, in config order"""
+        now = time.time()
+        # A RemoteForwarder keeps no statistics, its tunnels are running while they have a session
+        stats = getattr(self.forwarder, "stats", {})
+        active_sessions = getattr(self.forwarder, "active_sessions", {})
+        relay = getattr(self.forwarder, "relay", None)
+        relay_stats = dict(relay.stats) if relay else {}
+        result = {}
+        for label, connection in self.connections.items():
+            sid = self.active_session_ids.get(label)
+            label_stats = stats.get(label, {})
+            state = label_stats.get("state", "running") if sid else None
+            if sid is None:
+                if label in self.starting:
+                    state = "starting"
+                elif self.scheduler and label in self.scheduler.pending:
+                    state = "queued"
+                elif label in self.errors:
+                    state = "failed"
+            active = active_sessions.get(sid, {}) if sid else {}
+            result[label] = {
+                "state": state or "stopped",
+                "local_port": connection["local_port"],
+                "group": connection.get("group"),
+                "session_id": active.get("session_id", sid),
+                "uptime": (
+                    now - self.started_at[label] if label in self.started_at else None
+                ),
+                "reconnects": label_stats.get("reconnects", 0),
+                "downtime": label_stats.get("downtime", 0.0),
+                "error": self.errors.get(label),
+                "relay": relay_stats.get(label) if connection.get("relay") else None,
+            }
+        return result
@@ -0,0 +1,71 @@
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from botocore.utils import JSONFileCache
+
+
+class CredentialCache:
+    """
+    On-disk cache of temporary credentials and caller identities, so a restart within the lifetime of
+    the credentials needs no STS calls. Temporary credentials are cached the way the AWS CLI does it, by
+    giving the assume role providers of botocore a JSONFileCache. Caller identities are stored next to
+    them, keyed by profile and access key, until the credentials expire. Files are only readable by the
+    current user.
+    """
+
+    DEFAULT_PATH = "~/.ssmports/credential_cache"
+    # Identities of credentials that do not expire, such as long term access keys, are checked again after this
+    IDENTITY_TTL = 43200
+    PROVIDERS = ("assume-role", "assume-role-with-web-identity", "sso")
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = os.path.expanduser(path)
+        self.logger = logging.getLogger()
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        os.chmod(self.path, 0o700)
+        # JSONFileCache writes through mkstemp, which creates files with mode 0600
+        self.cache = JSONFileCache(self.path)
+
+    def attach(self, session):
+        """Let the credential providers of a boto3 session read and write this cache"""
+        resolver = session._session.get_component("credential_provider")
+        for name in self.PROVIDERS:
+            provider = resolver.get_provider(name)
+            if provider is not None and hasattr(provider, "cache"):
+                provider.cache = self.cache
+
+    @staticmethod
+    def _identity_key(profile_name, credentials):
+        digest = hashlib.sha256(
+            f"{profile_name}|{credentials.access_key}".encode()
+        ).hexdigest()
+        return f"identity-{digest}"
+
+    def get_identity(self, profile_name, credentials):
+        """Return the cached caller identity of these credentials, or None if missing or expired"""
+        try:
+            entry = self.cache[self._identity_key(profile_name, credentials)]
+            expiration = datetime.fromisoformat(entry["Expiration"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if expiration <= datetime.now(timezone.utc):
+            return None
+        return entry["Identity"]
+
+    def put_identity(self, profile_name, credentials, identity, expiry=None):
+        """Cache a caller identity until the credentials expire"""
+        if expiry is None:
+            expiry = datetime.now(timezone.utc) + timedelta(seconds=self.IDENTITY_TTL)
+        try:
+            self.cache[self._identity_key(profile_name, credentials)] = {
+                "Identity": {
+                    key: identity[key]
+                    for key in ("UserId", "Account", "Arn")
+                    if key in identity
+                },
+                "Expiration": expiry.isoformat(),
+            }
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not write credential cache {self.path}: {e}")
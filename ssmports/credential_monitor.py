@@ -0,0 +1,119 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+
+class CredentialMonitor:
+    """
+    Watch the expiry of the credentials of every profile in use. on_expiring(profile, expiry) is called
+    once when a profile gets within warn_before seconds of expiry, and on_expired(profile) once it has
+    expired. After that the credentials on disk are checked on every run: once the user re-authenticated,
+    the sessions of the profile are replaced in the background and on_refreshed(profile) is called.
+    Credentials that botocore renews by itself (assume role, SSO) are only reported once renewing failed.
+    """
+
+    def __init__(
+        self,
+        aws_sessions,
+        warn_before=900,
+        interval=30,
+        on_expiring=None,
+        on_expired=None,
+        on_refreshed=None,
+    ):
+        self.aws_sessions = aws_sessions
+        self.warn_before = timedelta(seconds=warn_before)
+        self.interval = interval
+        self.on_expiring = on_expiring
+        self.on_expired = on_expired
+        self.on_refreshed = on_refreshed
+        self.logger = logging.getLogger()
+        self.states = {}  # profile -> "valid", "expiring" or "expired"
+        self.expiry = {}  # profile -> datetime the current credentials expire
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self._run, daemon=True, name="credential-monitor"
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+    @staticmethod
+    def _notify(callback, *args):
+        if callback:
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.getLogger().error(f"Error in credential monitor callback: {e}")
+
+    def check(self, now=None):
+        """Check all profiles once, returns {profile: state}"""
+        now = now or datetime.now(timezone.utc)
+        profiles = self.aws_sessions.profiles()
+        for profile in list(self.states):
+            if profile not in profiles:
+                self.states.pop(profile)
+                self.expiry.pop(profile, None)
+        for profile in profiles:
+            try:
+                self._check_profile(profile, now)
+            except Exception as e:
+                self.logger.debug(f"Could not check credentials of '{profile}': {e}")
+        return dict(self.states)
+
+    def _check_profile(self, profile, now):
+        state = self.states.get(profile, "valid")
+        try:
+            expiry = self.aws_sessions.credential_expiry(profile)
+        except Exception as e:
+            # Refreshable credentials that can no longer be refreshed, such as an expired SSO login
+            self.logger.debug(f"Could not refresh credentials of '{profile}': {e}")
+            expiry = now
+        refresh_window = self.aws_sessions.refresh_window(profile)
+        if (
+            refresh_window is not None
+            and expiry is not None
+            and expiry - now > timedelta(seconds=refresh_window)
+        ):
+            # Renewed by botocore before they expire, they only need attention once a refresh failed
+            self.states[profile] = "valid"
+            self.expiry[profile] = expiry
+            return
+
+        if state != "valid":
+            # Waiting for the user to re-authenticate
+            fresh_expiry = self.aws_sessions.fresh_credential_expiry(profile)
+            if fresh_expiry and fresh_expiry - now > self.warn_before:
+                self.logger.info(
+                    f"New credentials found for profile '{profile}', refreshing sessions..."
+                )
+                self.aws_sessions.refresh(profile)
+                self.states[profile] = "valid"
+                self.expiry[profile] = fresh_expiry
+                self._notify(self.on_refreshed, profile)
+                return
+
+        if expiry is None:
+            self.states[profile] = "valid"
+            return
+        self.expiry[profile] = expiry
+        if expiry <= now:
+            if state != "expired":
+                self.states[profile] = "expired"
+                self._notify(self.on_expired, profile)
+        elif expiry - now <= self.warn_before:
+            if state == "valid":
+                self.states[profile] = "expiring"
+                self._notify(self.on_expiring, profile, expiry)
+        else:
+            self.states[profile] = "valid"
@@ -0,0 +1,336 @@
+import itertools
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+
+from .exceptions import SSMPortForwardError
+
+SOCKET_NAME = "ssmports.sock"
+
+
+def default_socket_path():
+    """Per-user socket path, in XDG_RUNTIME_DIR when available"""
+    if path := os.environ.get("SSMPORTS_SOCKET"):
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    return os.path.expanduser(os.path.join("~", ".ssmports", SOCKET_NAME))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One client connection, requests and responses are single lines of JSON"""
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message, separators=(",", ":")) + "\n").encode()
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def handle(self):
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    method = request["method"]
+                except (ValueError, KeyError, TypeError):
+                    self.send({"id": None, "error": {"message": "Invalid request"}})
+                    continue
+                self.server.dispatch(self, request.get("id"), method, request)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.server.unsubscribe(self)
+
+
+# Windows has no Unix domain sockets, there the daemon is not available and frontends run their own tunnels
+UNIX_SOCKETS = hasattr(socket, "AF_UNIX") and hasattr(socketserver, "UnixStreamServer")
+
+if UNIX_SOCKETS:
+
+    class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """
+        Control daemon that owns the tunnels of a TunnelController, so every frontend of a user shares the
+        same tunnels. Frontends talk JSON-RPC over a Unix domain socket that only the user can access:
+        one JSON object per line, {"id", "method", "params"} in and {"id", "result"} or {"id", "error"}
+        out. Subscribed connections also receive {"method": "state", "params": {"label", "state"}}.
+        """
+
+        daemon_threads = True
+
+        def __init__(self, controller, path=None):
+            self.controller = controller
+            self.path = path or default_socket_path()
+            self.logger = logging.getLogger()
+            self.subscribers = set()
+            self._subscribers_lock = threading.Lock()
+            self._prepare_socket_path()
+            super().__init__(self.path, _Handler)
+            os.chmod(self.path, 0o600)
+            controller.add_listener(self._publish)
+            self.methods = {
+                "list": self.rpc_list,
+                "status": self.rpc_status,
+                "start": self.rpc_start,
+                "stop": self.rpc_stop,
+                "reload": self.rpc_reload,
+                "subscribe": self.rpc_subscribe,
+                "shutdown": self.rpc_shutdown,
+            }
+
+        def _prepare_socket_path(self):
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            if not os.path.exists(self.path):
+                return
+            if DaemonClient.available(self.path):
+                raise SSMPortForwardError(
+                    f"A daemon is already listening on {self.path}"
+                )
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(self.path)
+
+        def dispatch(self, handler, request_id, method, request):
+            params = request.get("params") or {}
+            try:
+                if method not in self.methods:
+                    raise SSMPortForwardError(f"Unknown method: {method}")
+                result = self.methods[method](handler, **params)
+                handler.send({"id": request_id, "result": result})
+            except Exception as e:
+                handler.send({"id": request_id, "error": {"message": str(e)}})
+
+        def _publish(self, label, state):
+            message = {"method": "state", "params": {"label": label, "state": state}}
+            with self._subscribers_lock:
+                subscribers = list(self.subscribers)
+            for handler in subscribers:
+                try:
+                    handler.send(message)
+                except OSError:
+                    self.unsubscribe(handler)
+
+        def unsubscribe(self, handler):
+            with self._subscribers_lock:
+                self.subscribers.discard(handler)
+
+        def _select(self, labels=(), groups=()):
+            if not labels and not groups:
+                return list(self.controller.connections)
+            return self.controller.select(labels, groups)
+
+        def rpc_list(self, handler):
+            return self.controller.connections
+
+        def rpc_status(self, handler):
+            return self.controller.status()
+
+        def rpc_start(self, handler, labels=(), groups=(), autostart=False):
+            if autostart:
+                selected = self.controller.autostart_labels()
+            else:
+                selected = self._select(labels, groups)
+            self.controller.start_many(selected)
+            status = self.controller.status()
+            return {
+                label: {
+                    "session_id": self.controller.active_session_ids.get(label),
+                    "error": status[label]["error"],
+                }
+                for label in selected
+            }
+
+        def rpc_stop(self, handler, labels=(), groups=()):
+            return [
+                label
+                for label in self._select(labels, groups)
+                if self.controller.stop(label)
+            ]
+
+        def rpc_reload(self, handler):
+            diff = self.controller.reload()
+            return {
+                "added": diff.added,
+                "removed": diff.removed,
+                "changed": list(diff.changed),
+            }
+
+        def rpc_subscribe(self, handler):
+            with self._subscribers_lock:
+                self.subscribers.add(handler)
+            return True
+
+        def rpc_shutdown(self, handler):
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return True
+
+        def server_close(self):
+            super().server_close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class DaemonClient:
+    """Client side of the ControlServer protocol, calls are serialised over a single connection"""
+
+    def __init__(self, path=None, timeout=120):
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available(path=None):
+        """Return True if a daemon accepts connections on the socket"""
+        if not UNIX_SOCKETS:
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(1)
+        try:
+            sock.connect(path or default_socket_path())
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def _connect(self):
+        if not UNIX_SOCKETS:
+            raise SSMPortForwardError("The ssmports daemon needs Unix domain sockets.")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise SSMPortForwardError(f"Cannot reach the ssmports daemon: {e}")
+        return sock, sock.makefile("rb")
+
+    def call(self, method, **params):
+        with self._lock:
+            if self._sock is None:
+                self._sock, self._file = self._connect()
+            request_id = next(self._ids)
+            request = {"id": request_id, "method": method, "params": params}
+            try:
+                self._sock.sendall((json.dumps(request) + "\n").encode())
+                while True:
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("connection closed")
+                    response = json.loads(line)
+                    if response.get("id") == request_id:
+                        break
+            except (OSError, ValueError) as e:
+                self.close()
+                raise SSMPortForwardError(f"Lost the ssmports daemon: {e}")
+        if "error" in response:
+            raise SSMPortForwardError(response["error"]["message"])
+        return response["result"]
+
+    def subscribe(self, callback):
+        """Call callback(label, state) for every state change, on a reader thread. Returns the thread."""
+        sock, stream = self._connect()
+        sock.settimeout(None)
+        sock.sendall(b'{"id":0,"method":"subscribe"}\n')
+
+        def run():
+            try:
+                for line in stream:
+                    message = json.loads(line)
+                    if message.get("method") == "state":
+                        callback(message["params"]["label"], message["params"]["state"])
+            except (OSError, ValueError):
+                pass
+            finally:
+                sock.close()
+
+        thread = threading.Thread(target=run, daemon=True, name="daemon-events")
+        thread.start()
+        return thread
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+
+class RemoteForwarder:
+    """
+    Stand-in for SSMPortForwarder that lets the daemon run the tunnels. start_session starts a
+    connection by label in the daemon, so the ssm_client and connection settings of the caller are
+    not used. Closing the frontend leaves the tunnels running.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.listeners = []
+        self.labels = {}  # session_id -> label
+        self._subscribed = False
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+        if not self._subscribed:
+            self._subscribed = True
+            self.client.subscribe(self._on_state)
+
+    def _on_state(self, label, state):
+        for listener in self.listeners:
+            try:
+                listener(label, state)
+            except Exception as e:
+                logging.getLogger().error(
+                    f"[{label}] Error in session state listener: {e}"
+                )
+
+    def running_sessions(self):
+        """Return {label: session_id} of the tunnels the daemon is running"""
+        sessions = {
+            label: status["session_id"]
+            for label, status in self.client.call("status").items()
+            if status["session_id"]
+        }
+        self.labels = {sid: label for label, sid in sessions.items()}
+        return sessions
+
+    def start_session(self, ssm_client, label, **kwargs):
+        result = self.client.call("start", labels=[label])[label]
+        if not result["session_id"]:
+            raise SSMPortForwardError(result["error"] or "Failed to start session")
+        self.labels[result["session_id"]] = label
+        return result["session_id"]
+
+    def stop_session(self, session_id, wait=False, timeout=10):
+        label = self.labels.pop(session_id, None)
+        if label is None:
+            return False
+        return bool(self.client.call("stop", labels=[label]))
+
+    def stop_all(self):
+        self.client.call("stop")
+
+    def connections(self):
+        """Return the connections of the daemon's configuration, {label: connection}"""
+        return self.client.call("list")
+
+    def reload(self):
+        """Let the daemon reload its configuration, returns the added, removed and changed labels"""
+        return self.client.call("reload")
+
+    def close(self):
+        self.client.close()
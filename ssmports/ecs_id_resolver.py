@@ -0,0 +1,133 @@
+import time
+from collections import Counter
+
+from . import metrics
+
+
+class ECSIDResolver:
+    # describe_tasks accepts at most 100 task ARNs per call
+    DESCRIBE_TASKS_BATCH_SIZE = 100
+
+    def __init__(self):
+        self.found_ids = {}
+        self.api_calls = Counter()
+        self.sweeps = 0
+
+    def _call(self, ecs_client, operation, **kwargs):
+        self.api_calls[operation] += 1
+        return getattr(ecs_client, operation)(**kwargs)
+
+    def _paginate(self, ecs_client, operation, result_key, **kwargs):
+        """Yield every item of a list_* call, following nextToken until exhausted."""
+        while True:
+            response = self._call(ecs_client, operation, **kwargs)
+            yield from response.get(result_key, [])
+            next_token = response.get("nextToken")
+            if not next_token:
+                return
+            kwargs["nextToken"] = next_token
+
+    def _describe_tasks(self, ecs_client, cluster_arn, task_arns):
+        for i in range(0, len(task_arns), self.DESCRIBE_TASKS_BATCH_SIZE):
+            batch = task_arns[i : i + self.DESCRIBE_TASKS_BATCH_SIZE]
+            response = self._call(
+                ecs_client, "describe_tasks", cluster=cluster_arn, tasks=batch
+            )
+            yield from response.get("tasks", [])
+
+    def iter_containers(self, ecs_client):
+        """
+        Sweep every cluster and task once, yielding (container_name, ecs_instance_id) pairs
+        in the order the ECS API returns them.
+        """
+        self.sweeps += 1
+        metrics.ECS_SWEEPS.inc()
+        for cluster_arn in self._paginate(ecs_client, "list_clusters", "clusterArns"):
+            cluster_name = cluster_arn.split("/")[-1]
+            task_arns = list(
+                self._paginate(
+                    ecs_client, "list_tasks", "taskArns", cluster=cluster_arn
+                )
+            )
+            for task_desc in self._describe_tasks(ecs_client, cluster_arn, task_arns):
+                task_id = task_desc.get("taskArn", "").split("/")[-1]
+                for container in task_desc.get("containers", []):
+                    container_id = container.get("runtimeId")
+                    ecs_instance_id = f"ecs:{cluster_name}_{task_id}_{container_id}"
+                    yield container.get("name"), ecs_instance_id
+
+    def resolve_task_names(self, task_names, ecs_client):
+        """
+        Resolve several container names with a single sweep of the account. Every container seen
+        during the sweep is added to the index, the first container found for a name wins. The sweep
+        stops as soon as every requested name is found. Returns a dict with the names that could be
+        resolved.
+        """
+        missing = {name for name in task_names if name not in self.found_ids}
+        if missing:
+            t0 = time.perf_counter()
+            for name, ecs_instance_id in self.iter_containers(ecs_client):
+                self.found_ids.setdefault(name, ecs_instance_id)
+                missing.discard(name)
+                if not missing:
+                    break
+            metrics.ECS_SWEEP_SECONDS.observe(time.perf_counter() - t0)
+        return {
+            name: self.found_ids[name] for name in task_names if name in self.found_ids
+        }
+
+    def validate_instance_ids(self, candidates, ecs_client):
+        """
+        Check previously resolved {container_name: ecs_instance_id} pairs with one batched
+        describe_tasks call per cluster instead of a full sweep. Pairs whose task is still running
+        with the same container are added to the index and returned.
+        """
+        by_cluster = {}
+        for name, ecs_instance_id in candidates.items():
+            try:
+                # Cluster names may contain underscores, task and runtime IDs do not
+                cluster_name, task_id, container_id = ecs_instance_id.removeprefix(
+                    "ecs:"
+                ).rsplit("_", 2)
+            except ValueError:
+                continue
+            by_cluster.setdefault(cluster_name, []).append(
+                (name, task_id, container_id)
+            )
+
+        valid = {}
+        for cluster_name, entries in by_cluster.items():
+            task_ids = sorted({task_id for _, task_id, _ in entries})
+            running = {}
+            for task_desc in self._describe_tasks(ecs_client, cluster_name, task_ids):
+                if task_desc.get("lastStatus") != "RUNNING":
+                    continue
+                task_id = task_desc.get("taskArn", "").split("/")[-1]
+                running[task_id] = {
+                    (container.get("name"), container.get("runtimeId"))
+                    for container in task_desc.get("containers", [])
+                }
+            for name, task_id, container_id in entries:
+                if (name, container_id) in running.get(task_id, ()):
+                    valid[name] = candidates[name]
+                    self.found_ids.setdefault(name, candidates[name])
+        return valid
+
+    def forget(self, ecs_instance_id):
+        """Drop an ID whose task is gone from the index, returns the container names that resolved to it"""
+        names = [
+            name for name, found in self.found_ids.items() if found == ecs_instance_id
+        ]
+        for name in names:
+            self.found_ids.pop(name)
+        return names
+
+    def resolve_task_name(self, task_name, ecs_client):
+        """
+        Given a container name, enumerate over all the ECS clusters and generate an ECS instance ID usable
+        for SSM Session Manager: ecs_<cluster_name>_<task_id>_<container_id>
+        """
+        resolved = self.resolve_task_names([task_name], ecs_client)
+        if task_name not in resolved:
+            raise ValueError(f"Task name '{task_name}' not found in any ECS cluster.")
+        return resolved[task_name]
@@ -0,0 +1,277 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from . import metrics
+from .relay import TunnelRelay, free_port
+from .session import SSMSession
+from .exceptions import SSMPortForwardError
+
+
+class SSMPortForwarder:
+    START_TIMEOUT = 30  # seconds start_session waits for the first session
+
+    def __init__(
+        self,
+        logger=None,
+        watch_interval=0.5,
+        reconnect_base_delay=1.0,
+        reconnect_max_delay=60.0,
+        stable_after=30.0,
+    ):
+        self.logger = logger or logging.getLogger()
+        self.watch_interval = watch_interval
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        # Seconds a session has to stay up before the reconnect backoff starts over
+        self.stable_after = stable_after
+        self.active_sessions = (
+            {}
+        )  # {session_id: {"thread": thread, "stop_event": event, "label": label, "config": config}}
+        # label -> {"state", "reconnects", "resumes", "downtime", "down_since"}
+        self.stats = {}
+        self.listeners = []  # callables called with (label, state)
+        self.relay = None  # TunnelRelay, created for the first tunnel in relay mode
+
+    def add_listener(self, callback):
+        """Register callback(label, state), called when a session is running, reconnecting, failed or stopped"""
+        self.listeners.append(callback)
+
+    def _set_state(self, label, state):
+        stats = self.stats.setdefault(
+            label,
+            {
+                "state": None,
+                "reconnects": 0,
+                "resumes": 0,
+                "downtime": 0.0,
+                "down_since": None,
+            },
+        )
+        if stats["state"] == state:
+            return
+        if state == "reconnecting" and stats["down_since"] is None:
+            stats["down_since"] = time.monotonic()
+        elif state != "reconnecting" and stats["down_since"] is not None:
+            downtime = time.monotonic() - stats["down_since"]
+            stats["downtime"] += downtime
+            stats["down_since"] = None
+            metrics.TUNNEL_DOWNTIME.inc(downtime, label=label)
+        stats["state"] = state
+        metrics.TUNNEL_UP.set(1 if state == "running" else 0, label=label)
+        for listener in self.listeners:
+            try:
+                listener(label, state)
+            except Exception as e:
+                self.logger.error(f"[{label}] Error in session state listener: {e}")
+
+    def _get_relay(self):
+        if self.relay is None:
+            self.relay = TunnelRelay(logger=self.logger)
+        return self.relay
+
+    def _reconnect_delay(self, attempt):
+        """Exponential backoff with jitter, so tunnels that dropped together do not reconnect together"""
+        delay = min(self.reconnect_max_delay, self.reconnect_base_delay * 2**attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _resume_delay(self, attempt, up_since):
+        """
+        Backoff before a resume: none after a session that was stable, growing while resumed sessions
+        keep dropping right away. Returns the delay and the attempt count to continue with.
+        """
+        if time.monotonic() - up_since >= self.stable_after:
+            attempt = 0
+        delay = self._reconnect_delay(attempt - 1) if attempt else 0
+        return delay, attempt + 1
+
+    def _supervise(self, sess, label, stop_event, reconnect=True):
+        """
+        Watchdog: block while the plugin is running. When the plugin exits while the tunnel should be up,
+        first try to resume the SSM session. Returns True when the session was stopped, False when the
+        session could not be resumed and a new one is needed.
+        """
+        attempt = 0
+        up_since = time.monotonic()
+        while True:
+            while not stop_event.wait(self.watch_interval):
+                if sess.proc.poll() is not None:
+                    break
+            if stop_event.is_set():
+                return True
+            output = "\n".join(sess.recent_output(5))
+            self.logger.warning(
+                f"[{label}] session-manager-plugin exited unexpectedly: {output}"
+            )
+            if not reconnect:
+                return False
+            self._set_state(label, "reconnecting")
+            delay, attempt = self._resume_delay(attempt, up_since)
+            if delay:
+                self.logger.info(f"[{label}] Resuming in {delay:.1f} seconds...")
+                if stop_event.wait(delay):
+                    return True
+            try:
+                sess.resume()
+            except Exception as e:
+                self.logger.warning(
+                    f"[{label}] Could not resume session, starting a new one: {e}"
+                )
+                return False
+            self.stats[label]["reconnects"] += 1
+            self.stats[label]["resumes"] += 1
+            metrics.RECONNECTS.inc(label=label, kind="resume")
+            up_since = time.monotonic()
+            self._set_state(label, "running")
+            self.logger.info(f"[{label}] Resumed session {sess.session['SessionId']}.")
+
+    def start_session(self, ssm_client, label, **kwargs):
+        instance_id = kwargs.get("jump_instance")
+        target_host = kwargs.get("target_host")
+        local_port = kwargs.get("local_port")
+        remote_port = kwargs.get("remote_port")
+        readiness = kwargs.get("readiness", "output")
+        reconnect = kwargs.get("reconnect", True)
+        # In relay mode the relay owns local_port and the plugin listens on an internal port
+        relay = self._get_relay() if kwargs.get("relay", False) else None
+        plugin_port = local_port
+        if relay:
+            plugin_port = free_port()
+            relay.add(label, local_port, plugin_port)
+
+        stop_event = threading.Event()
+        session_id_ready = threading.Event()
+        shared_data: dict[str, Exception | None] = {
+            "session_id": None,
+            "error": None,
+            "abandoned": False,  # start_session timed out and released the tunnel
+        }
+
+        # Either create a new SSM client because a different profile/region is needed,
+        # or use the default one
+        def run():
+            # The SessionId of the first session stays the handle for this tunnel, reconnects
+            # get a new SessionId which is kept in active_sessions[sid]["session_id"]
+            sid = None
+            attempt = 0
+            while not stop_event.is_set():
+                connected_at = None
+                try:
+                    with SSMSession(
+                        ssm_client,
+                        logger=self.logger,
+                        label=label,
+                        readiness=readiness,
+                        Target=instance_id,
+                        DocumentName="AWS-StartPortForwardingSessionToRemoteHost",
+                        Parameters={
+                            "host": [target_host],
+                            "portNumber": [str(remote_port)],
+                            "localPortNumber": [str(plugin_port)],
+                        },
+                    ) as sess:
+                        if sid is None and shared_data["abandoned"]:
+                            # Nobody tracks this tunnel anymore, tear it down instead of keeping the port
+                            self.logger.warning(
+                                f"[{label}] Session came up after the start timed out, stopping it."
+                            )
+                            break
+                        if sid is None:
+                            sid = sess.session["SessionId"]
+                            shared_data["session_id"] = sid
+                            self.active_sessions[sid] = {
+                                "thread": threading.current_thread(),
+                                "stop_event": stop_event,
+                                "label": label,
+                                "session_id": sid,
+                                "config": {
+                                    "target_host": target_host,
+                                    "local_port": local_port,
+                                    "remote_port": remote_port,
+                                    "instance_id": instance_id,
+                                },
+                            }
+                            self._set_state(label, "running")
+                            session_id_ready.set()
+                        else:
+                            self.active_sessions[sid]["session_id"] = sess.session[
+                                "SessionId"
+                            ]
+                            self.stats[label]["reconnects"] += 1
+                            metrics.RECONNECTS.inc(label=label, kind="new")
+                            self._set_state(label, "running")
+                            self.logger.info(
+                                f"[{label}] Reconnected as session {sess.session['SessionId']}."
+                            )
+                        connected_at = time.monotonic()
+                        if self._supervise(sess, label, stop_event, reconnect):
+                            break
+                except Exception as e:
+                    if sid is None:
+                        shared_data["error"] = e
+                        break
+                    self.logger.warning(f"[{label}] Reconnect failed: {e}")
+
+                if not reconnect:
+                    self._set_state(label, "failed")
+                    break
+                self._set_state(label, "reconnecting")
+                if (
+                    connected_at
+                    and time.monotonic() - connected_at >= self.stable_after
+                ):
+                    attempt = 0
+                delay = self._reconnect_delay(attempt)
+                attempt += 1
+                self.logger.info(f"[{label}] Reconnecting in {delay:.1f} seconds...")
+                stop_event.wait(delay)
+
+            self.active_sessions.pop(sid, None)
+            if relay and not shared_data["abandoned"]:
+                relay.remove(label)
+            if stop_event.is_set() and sid is not None:
+                self._set_state(label, "stopped")
+            # Report a failed first start only after the relay released local_port
+            session_id_ready.set()
+
+        # Run in a copy of the current context, so the spans of the session become children of the caller's span
+        t = threading.Thread(
+            target=contextvars.copy_context().run, args=(run,), daemon=True
+        )
+        t.start()
+
+        # Wait for session_id or error to be populated
+        if session_id_ready.wait(timeout=self.START_TIMEOUT):
+            if shared_data["error"]:
+                raise shared_data["error"]
+            return shared_data["session_id"]
+        # Give up on the tunnel, so a retry can use local_port again
+        shared_data["abandoned"] = True
+        stop_event.set()
+        if relay:
+            relay.remove(label)
+        raise SSMPortForwardError("Failed to start SSM session within timeout")
+
+    def stop_session(self, session_id, wait=False, timeout=10):
+        """Signal a session to stop. With wait, block until the session has been torn down."""
+        session = self.active_sessions.get(session_id)
+        if session:
+            session["stop_event"].set()
+            thread = session.get("thread")
+            if wait and thread and thread is not threading.current_thread():
+                thread.join(timeout)
+            return True
+        return False
+
+    def stop_all(self):
+        for session in list(self.active_sessions.values()):
+            session["stop_event"].set()
+        self._close_relay()
+
+    def _close_relay(self):
+        """Release the local ports of relayed tunnels now, rather than when their threads get to it"""
+        if self.relay:
+            self.relay.close()
+            self.relay = None
@@ -0,0 +1,253 @@
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from . import metrics, tracing
+from .exceptions import SSMPortForwardError
+
+ALLOWED_HOSTS = {"localhost", "127.0.0.1", "[::1]"}
+# A browser only sends these on a cross-site request after a CORS preflight, which the API never grants
+CUSTOM_HEADER = "X-Ssmports"
+MAX_BODY = 1024 * 1024
+
+
+def _strip_port(netloc):
+    host, _, port = netloc.rpartition(":")
+    return host if port.isdigit() else netloc
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.getLogger().debug(f"HTTP API: {format % args}")
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status, text, content_type="text/plain; charset=utf-8"):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _discard_body(self):
+        """No route reads a body, but it has to leave the stream before the next keep-alive request"""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if 0 <= length <= MAX_BODY:
+            self.rfile.read(length)
+        else:
+            self.close_connection = True
+
+    def _route(self, method):
+        self._discard_body()
+        # Only accept requests addressed to localhost, so web pages cannot reach the API through DNS rebinding
+        host = _strip_port(self.headers.get("Host", ""))
+        if host not in ALLOWED_HOSTS:
+            self._send_json(403, {"error": "Forbidden host"})
+            return
+        if method == "POST" and not self._same_site():
+            self._send_json(403, {"error": "Cross-site requests are not allowed"})
+            return
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            status, body = self.server.handle_request_parts(method, parts, query, self)
+        except SSMPortForwardError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+        if body is not None:
+            self._send_json(status, body)
+
+    def _same_site(self):
+        """
+        Reject requests that web pages can send: a foreign Origin, or only "simple" headers. Scripts
+        send either Content-Type: application/json or an X-Ssmports header.
+        """
+        origin = self.headers.get("Origin")
+        if origin is not None:
+            if _strip_port(urlsplit(origin).netloc) not in ALLOWED_HOSTS:
+                return False
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        return content_type == "application/json" or CUSTOM_HEADER in self.headers
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+
+class HttpApiServer(ThreadingHTTPServer):
+    """
+    Localhost-only HTTP control and status API for a TunnelController:
+
+    GET  /connections                      status of every connection
+    GET  /connections/<label>              status of one connection, with ?wait=<state>&timeout=<s>
+                                           the response is held until the connection reaches the state
+    POST /connections/<label>/start|stop   start or stop a connection, start returns once it is up
+    POST /groups/<group>/start|stop        the same for every connection of a group, POST requests need
+                                           Content-Type: application/json or an X-Ssmports header
+    GET  /events                           server-sent events, one "state" event per state change
+    GET  /metrics                          metrics in the Prometheus text format
+    GET  /trace                            recorded spans in the Chrome trace format, ?format=jsonl for JSON lines
+
+    With metrics_only, as started by the GUI, only /metrics is served.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, controller, port=8765, host="127.0.0.1", heartbeat=15, metrics_only=False
+    ):
+        self.controller = controller
+        self.heartbeat = heartbeat
+        self.metrics_only = metrics_only
+        self.logger = logging.getLogger()
+        self.subscribers = set()  # queues of the connected event streams
+        self.changed = threading.Condition()
+        self.thread = None
+        super().__init__((host, port), _Handler)
+        controller.add_listener(self._publish)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.serve_forever, daemon=True, name="http-api"
+        )
+        self.thread.start()
+        self.logger.info(
+            f"HTTP API listening on http://{self.server_address[0]}:{self.server_address[1]}"
+        )
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        with self.changed:
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+
+    def _publish(self, label, state):
+        event = {"label": label, "state": state, "time": time.time()}
+        with self.changed:
+            for subscriber in self.subscribers:
+                subscriber.put(event)
+            self.changed.notify_all()
+
+    def handle_request_parts(self, method, parts, query, handler):
+        if self.metrics_only and (method, parts) != ("GET", ["metrics"]):
+            return 404, {"error": "Not found"}
+        if method == "GET" and parts == ["connections"]:
+            return 200, self.controller.status()
+        if method == "GET" and len(parts) == 2 and parts[0] == "connections":
+            return self._get_connection(parts[1], query)
+        if method == "GET" and parts == ["events"]:
+            self._stream_events(handler)
+            return None, None
+        if method == "GET" and parts == ["metrics"]:
+            handler._send_text(
+                200,
+                metrics.REGISTRY.render(),
+                content_type="text/plain; version=0.0.4; charset=utf-8",
+            )
+            return None, None
+        if method == "GET" and parts == ["trace"]:
+            if query.get("format") == "jsonl":
+                handler._send_text(
+                    200,
+                    tracing.TRACER.json_lines(),
+                    content_type="application/x-ndjson",
+                )
+                return None, None
+            return 200, tracing.TRACER.chrome_trace()
+        if method == "POST" and len(parts) == 3 and parts[2] in ("start", "stop"):
+            if parts[0] == "connections":
+                labels = self.controller.select(labels=[parts[1]])
+            elif parts[0] == "groups":
+                labels = self.controller.select(groups=[parts[1]])
+            else:
+                return 404, {"error": "Not found"}
+            return self._start_or_stop(parts[2], labels)
+        return 404, {"error": "Not found"}
+
+    def _get_connection(self, label, query):
+        status = self.controller.status()
+        if label not in status:
+            return 404, {"error": f"Unknown connection: {label}"}
+        wait_for = query.get("wait")
+        if wait_for:
+            deadline = time.monotonic() + float(query.get("timeout", 30))
+            with self.changed:
+                while (state := self.controller.status()[label]["state"]) != wait_for:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return 408, {"error": f"{label} is {state}, not {wait_for}"}
+                    # Also poll, the controller records a new session just after the forwarder reports it
+                    self.changed.wait(min(remaining, 0.5))
+        return 200, self.controller.status()[label]
+
+    def _start_or_stop(self, action, labels):
+        if action == "start":
+            self.controller.start_many(labels)
+        else:
+            for label in labels:
+                self.controller.stop(label)
+        status = self.controller.status()
+        result = {label: status[label] for label in labels}
+        failed = action == "start" and any(
+            result[label]["state"] != "running" for label in labels
+        )
+        return 502 if failed else 200, result
+
+    def _stream_events(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+        events = queue.Queue()
+        with self.changed:
+            self.subscribers.add(events)
+        try:
+            # Start with the current state, so clients do not miss changes made before they connected
+            for label, status in self.controller.status().items():
+                self._write_event(
+                    handler,
+                    {"label": label, "state": status["state"], "time": time.time()},
+                )
+            while True:
+                try:
+                    event = events.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    handler.wfile.write(b": keep-alive\n\n")
+                    handler.wfile.flush()
+                    continue
+                if event is None:
+                    return
+                self._write_event(handler, event)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.changed:
+                self.subscribers.discard(events)
+
+    @staticmethod
+    def _write_event(handler, event):
+        handler.wfile.write(f"event: state\ndata: {json.dumps(event)}\n\n".encode())
+        handler.wfile.flush()
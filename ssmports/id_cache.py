@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class InstanceIDCache:
+    """
+    JSON file cache of resolved ECS instance IDs, keyed by (profile, region, container name). Entries
+    older than the TTL are ignored, younger entries are trusted optimistically and are expected to be
+    validated by the caller before they are used.
+    """
+
+    DEFAULT_PATH = os.path.join("~", ".ssmports", "ecs_id_cache.json")
+
+    def __init__(self, path=DEFAULT_PATH, ttl=86400):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.entries = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(profile, region, container_name):
+        return "|".join([profile or "", region or "", container_name])
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        except (OSError, ValueError) as e:
+            logging.getLogger().warning(
+                f"Ignoring unreadable ECS ID cache {self.path}: {e}"
+            )
+            entries = {}
+        with self._lock:
+            self.entries = entries if isinstance(entries, dict) else {}
+            self.dirty = False
+
+    def get(self, profile, region, container_name):
+        with self._lock:
+            entry = self.entries.get(self._key(profile, region, container_name))
+        if not entry:
+            return None
+        if time.time() - entry.get("resolved_at", 0) > self.ttl:
+            return None
+        return entry.get("instance_id")
+
+    def put(self, profile, region, container_name, instance_id):
+        with self._lock:
+            self.entries[self._key(profile, region, container_name)] = {
+                "instance_id": instance_id,
+                "resolved_at": time.time(),
+            }
+            self.dirty = True
+
+    def discard(self, profile, region, container_name):
+        with self._lock:
+            if self.entries.pop(self._key(profile, region, container_name), None):
+                self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            entries = {
+                key: entry
+                for key, entry in self.entries.items()
+                if now - entry.get("resolved_at", 0) <= self.ttl
+            }
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(entries, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.getLogger().warning(
+                f"Could not write ECS ID cache {self.path}: {e}"
+            )
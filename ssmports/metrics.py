@@ -0,0 +1,281 @@
+import math
+import threading
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A metric family, values are kept per combination of label values"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # tuple of label values -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self.values.clear()
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels))
+
+    def samples(self):
+        """Yield (suffix, [(label, value)], value)"""
+        with self._lock:
+            items = list(self.values.items())
+        for key, value in sorted(items):
+            yield "", list(zip(self.labelnames, key)), value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = "histogram"
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*sorted(buckets), math.inf)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = [
+                (key, (list(counts), total))
+                for key, (counts, total) in self.values.items()
+            ]
+        for key, (counts, total) in sorted(items):
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield "_bucket", [*labels, ("le", _format_value(bound))], count
+            yield "_sum", labels, total
+            yield "_count", labels, counts[-1]
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []  # callables run before rendering, to refresh gauges
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), **kwargs):
+        return self._register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# Tunnel lifecycle, see SSMSession and SSMPortForwarder
+START_SESSION_SECONDS = REGISTRY.histogram(
+    "ssmports_start_session_seconds",
+    "Latency of the SSM StartSession call",
+    ["label"],
+)
+PLUGIN_SPAWN_SECONDS = REGISTRY.histogram(
+    "ssmports_plugin_spawn_seconds",
+    "Time to spawn the session-manager-plugin process",
+    ["label"],
+)
+READINESS_SECONDS = REGISTRY.histogram(
+    "ssmports_readiness_seconds",
+    "Time from plugin spawn until the tunnel accepted connections",
+    ["label"],
+)
+START_FAILURES = REGISTRY.counter(
+    "ssmports_start_failures_total", "Tunnel starts that failed", ["label"]
+)
+TERMINATE_FAILURES = REGISTRY.counter(
+    "ssmports_terminate_session_failures_total",
+    "SSM TerminateSession calls that failed",
+    ["label"],
+)
+RECONNECTS = REGISTRY.counter(
+    "ssmports_reconnects_total",
+    "Tunnels re-established after the plugin exited, kind is resume or new",
+    ["label", "kind"],
+)
+TUNNEL_UP = REGISTRY.gauge(
+    "ssmports_tunnel_up", "1 while the tunnel is running, 0 otherwise", ["label"]
+)
+TUNNEL_DOWNTIME = REGISTRY.counter(
+    "ssmports_tunnel_downtime_seconds_total",
+    "Time spent reconnecting after the tunnel dropped",
+    ["label"],
+)
+PLUGIN_PROCESSES = REGISTRY.gauge(
+    "ssmports_plugin_processes", "Running session-manager-plugin processes"
+)
+PLUGIN_RSS = REGISTRY.gauge(
+    "ssmports_plugin_rss_bytes",
+    "Resident memory of each session-manager-plugin process",
+    ["label", "pid"],
+)
+
+# Traffic of tunnels in relay mode, see TunnelRelay
+RELAY_BYTES = REGISTRY.counter(
+    "ssmports_relay_bytes_total",
+    "Bytes relayed, direction in is from the client to the tunnel",
+    ["label", "direction"],
+)
+RELAY_CONNECTIONS = REGISTRY.gauge(
+    "ssmports_relay_active_connections", "Open client connections", ["label"]
+)
+RELAY_CONNECT_SECONDS = REGISTRY.histogram(
+    "ssmports_relay_connect_seconds",
+    "Time to connect a client to the session-manager-plugin",
+    ["label"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
+RELAY_FIRST_BYTE_SECONDS = REGISTRY.histogram(
+    "ssmports_relay_first_byte_seconds",
+    "Time from accepting a client connection to the first byte from the tunnel",
+    ["label"],
+)
+
+# AWS API usage, see AWSSessions, ClientFactory and ECSIDResolver
+AWS_API_CALLS = REGISTRY.counter(
+    "ssmports_aws_api_calls_total",
+    "AWS API request attempts, including retries",
+    ["profile", "region", "service", "operation"],
+)
+AWS_THROTTLES = REGISTRY.counter(
+    "ssmports_aws_throttles_total",
+    "AWS API request attempts that were throttled",
+    ["profile", "region", "service"],
+)
+CREDENTIAL_VALIDATIONS = REGISTRY.counter(
+    "ssmports_credential_validations_total",
+    "Credential checks of a profile, result is sts, cached or error",
+    ["profile", "result"],
+)
+SESSION_CACHE = REGISTRY.counter(
+    "ssmports_session_cache_total",
+    "AWS session lookups, result is hit, miss or wait",
+    ["result"],
+)
+ECS_SWEEPS = REGISTRY.counter(
+    "ssmports_ecs_sweeps_total", "Sweeps over all ECS clusters to resolve containers"
+)
+ECS_SWEEP_SECONDS = REGISTRY.histogram(
+    "ssmports_ecs_sweep_seconds", "Duration of a sweep over all ECS clusters"
+)
+
+# pid -> label of the plugin processes that are running
+plugin_processes = {}
+
+
+def track_plugin(pid, label):
+    plugin_processes[pid] = label or ""
+
+
+def untrack_plugin(pid):
+    plugin_processes.pop(pid, None)
+
+
+def read_rss(pid):
+    """Resident memory of a process in bytes, None where /proc is not available"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _collect_plugins():
+    processes = dict(plugin_processes)
+    PLUGIN_PROCESSES.set(len(processes))
+    PLUGIN_RSS.clear()
+    for pid, label in processes.items():
+        rss = read_rss(pid)
+        if rss is not None:
+            PLUGIN_RSS.set(rss, label=label, pid=pid)
+
+
+REGISTRY.add_collector(_collect_plugins)
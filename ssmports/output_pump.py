@@ -0,0 +1,83 @@
+import threading
+from collections import deque
+
+
+class PluginOutputPump:
+    """
+    Continuously drain the output of a session-manager-plugin process on a reader thread. A plugin
+    that nobody reads from blocks once the OS pipe buffer is full, which silently stalls the tunnel.
+    Lines are forwarded to the logger and the last max_lines are kept for diagnostics. The first line
+    containing one of the markers is kept separately, so it cannot scroll out of the buffer.
+    Without start, lines can be handed to feed by another reader, such as an asyncio task.
+    """
+
+    def __init__(self, stream, logger, label=None, max_lines=200, markers=()):
+        self.stream = stream
+        self.logger = logger
+        self.label = label
+        self.markers = markers
+        self.lines = deque(maxlen=max_lines)
+        self.total_lines = 0
+        self.marker_line = None
+        self.closed = False
+        self._condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for raw_line in iter(self.stream.readline, b""):
+                self.feed(raw_line)
+        except (OSError, ValueError):
+            # The stream was closed underneath us
+            pass
+        finally:
+            self.close()
+
+    def feed(self, raw_line):
+        """Handle one line of output, returns it when it is the first line containing a marker"""
+        line = raw_line.decode(errors="replace").rstrip()
+        first_marker = False
+        with self._condition:
+            self.lines.append(line)
+            self.total_lines += 1
+            if self.marker_line is None and any(
+                marker in line for marker in self.markers
+            ):
+                self.marker_line = line
+                first_marker = True
+            self._condition.notify_all()
+        if line:
+            prefix = f"[{self.label}] " if self.label else ""
+            self.logger.info(f"{prefix}session-manager-plugin: {line}")
+        return line if first_marker else None
+
+    def close(self):
+        """Mark the end of the output, wakes up wait_for_marker"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def recent(self, count=None):
+        """Return the last count lines of output, or everything still in the buffer"""
+        with self._condition:
+            lines = list(self.lines)
+        return lines if count is None else lines[-count:]
+
+    def wait_for_marker(self, timeout):
+        """
+        Block until a line containing one of the markers is read. Returns that line, or None when the
+        stream closed or the timeout passed first; check closed to tell them apart.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.marker_line is not None or self.closed, timeout
+            )
+            return self.marker_line
+
+    def join(self, timeout=None):
+        if self.thread.is_alive():
+            self.thread.join(timeout)
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+
+from . import metrics
+from .exceptions import SSMPortForwardError
+
+
+def free_port(host="127.0.0.1"):
+    """
+    Return a port that is free right now, for the session-manager-plugin of a relayed tunnel. Another
+    process could take it before the plugin binds it, the plugin then fails to start like on any conflict.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class TunnelRelay:
+    """
+    Listens on the local ports of tunnels in relay mode and forwards every connection to the internal
+    port of the session-manager-plugin, counting traffic per tunnel. All connections are handled on one
+    asyncio event loop, either the given loop or one on its own thread.
+
+    stats[label] holds bytes_in (client to tunnel), bytes_out, active_connections, connections,
+    failed_connections, connect_time (seconds to reach the plugin) and first_byte_time (seconds from
+    accepting a connection to the first byte from the tunnel) of the last connection.
+    """
+
+    BUFFER_SIZE = 65536
+
+    def __init__(self, loop=None, host="127.0.0.1", logger=None):
+        self.host = host
+        self.logger = logger or logging.getLogger()
+        self.servers = {}  # label -> asyncio.Server
+        self.tasks = {}  # label -> tasks of the open connections
+        self.stats = {}
+        self.thread = None  # the loop thread, when the relay runs its own loop
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(
+                target=loop.run_forever, daemon=True, name="ssm-relay-loop"
+            )
+            self.thread.start()
+        self.loop = loop
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def add(self, label, listen_port, target_port):
+        """Start relaying listen_port to target_port, raises if listen_port can not be bound"""
+        self._run(self.add_async(label, listen_port, target_port))
+
+    def remove(self, label):
+        """Stop listening and close the open connections of a tunnel"""
+        if label in self.servers:
+            self._run(self.remove_async(label))
+
+    def close(self):
+        """Stop relaying every tunnel, and stop the event loop if the relay runs its own"""
+        for label in list(self.servers):
+            self.remove(label)
+        if self.thread:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+            self.loop.close()
+            self.thread = None
+
+    async def add_async(self, label, listen_port, target_port):
+        if label in self.servers:
+            raise SSMPortForwardError(f"[{label}] The relay is already running.")
+        stats = self.stats.setdefault(
+            label,
+            {
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "active_connections": 0,
+                "connections": 0,
+                "failed_connections": 0,
+                "connect_time": None,
+                "first_byte_time": None,
+            },
+        )
+        stats["listen_port"] = listen_port
+        stats["target_port"] = target_port
+        try:
+            server = await asyncio.start_server(
+                lambda reader, writer: self._handle(label, target_port, reader, writer),
+                self.host,
+                listen_port,
+            )
+        except OSError as e:
+            raise SSMPortForwardError(
+                f"Could not listen on local port {listen_port}: {e}"
+            )
+        self.servers[label] = server
+        self.tasks[label] = set()
+        self.logger.info(
+            f"[{label}] Relaying port {listen_port} to session-manager-plugin on port {target_port}."
+        )
+
+    async def remove_async(self, label):
+        server = self.servers.pop(label, None)
+        if server is None:
+            return
+        server.close()
+        for task in self.tasks.pop(label, set()):
+            task.cancel()
+        await server.wait_closed()
+
+    async def _handle(self, label, target_port, client_reader, client_writer):
+        task = asyncio.current_task()
+        self.tasks.get(label, set()).add(task)
+        stats = self.stats[label]
+        stats["connections"] += 1
+        stats["active_connections"] += 1
+        metrics.RELAY_CONNECTIONS.set(stats["active_connections"], label=label)
+        accepted = time.monotonic()
+        upstream_writer = None
+        try:
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection(
+                    self.host, target_port
+                )
+            except OSError as e:
+                stats["failed_connections"] += 1
+                self.logger.warning(f"[{label}] Relay could not reach the tunnel: {e}")
+                return
+            stats["connect_time"] = time.monotonic() - accepted
+            metrics.RELAY_CONNECT_SECONDS.observe(stats["connect_time"], label=label)
+            await asyncio.gather(
+                self._pipe(label, client_reader, upstream_writer, "in"),
+                self._pipe(label, upstream_reader, client_writer, "out", accepted),
+            )
+        finally:
+            stats["active_connections"] -= 1
+            metrics.RELAY_CONNECTIONS.set(stats["active_connections"], label=label)
+            self.tasks.get(label, set()).discard(task)
+            client_writer.close()
+            if upstream_writer:
+                upstream_writer.close()
+
+    async def _pipe(self, label, reader, writer, direction, accepted=None):
+        """Copy one direction until EOF, with accepted set the time to the first byte is recorded"""
+        stats = self.stats[label]
+        key = f"bytes_{direction}"
+        try:
+            while data := await reader.read(self.BUFFER_SIZE):
+                if accepted is not None:
+                    stats["first_byte_time"] = time.monotonic() - accepted
+                    metrics.RELAY_FIRST_BYTE_SECONDS.observe(
+                        stats["first_byte_time"], label=label
+                    )
+                    accepted = None
+                stats[key] += len(data)
+                metrics.RELAY_BYTES.inc(len(data), label=label, direction=direction)
+                writer.write(data)
+                await writer.drain()
+            # Pass on the half close, the other direction may still have data
+            if writer.can_write_eof():
+                writer.write_eof()
+        except OSError:
+            # Closing both sides ends the other direction as well
+            writer.close()
@@ -0,0 +1,81 @@
+import itertools
+import logging
+import queue
+import threading
+
+from .rate_limiter import TokenBucket
+
+
+class StartScheduler:
+    """
+    Start sessions in the background with bounded concurrency. Queued starts are handled in priority
+    order (lowest first), and starts sharing a scope, typically (profile, region), are rate limited
+    together so bulk starts do not run into SSM throttling.
+    """
+
+    def __init__(self, start_fn, max_concurrency=4, rate=2.0, burst=None):
+        self.start_fn = start_fn  # blocking callable taking a label
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.logger = logging.getLogger()
+        self.queue = queue.PriorityQueue()
+        self.pending = set()  # labels that are queued and not cancelled
+        self.limiters = {}  # scope -> TokenBucket
+        self.workers = []
+        self._order = itertools.count()  # keeps FIFO order within a priority
+        self._lock = threading.Lock()
+
+    def _limiter(self, scope):
+        with self._lock:
+            if scope not in self.limiters:
+                self.limiters[scope] = TokenBucket(self.rate, self.burst)
+            return self.limiters[scope]
+
+    def submit(self, label, scope=None, priority=0):
+        """Queue a start, returns False if the label is already queued"""
+        with self._lock:
+            if label in self.pending:
+                return False
+            self.pending.add(label)
+            self.queue.put((priority, next(self._order), label, scope))
+            self.workers = [w for w in self.workers if w.is_alive()]
+            if len(self.workers) < self.max_concurrency:
+                worker = threading.Thread(target=self._work, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+        return True
+
+    def cancel(self, label):
+        """Drop a queued start that has not begun yet"""
+        with self._lock:
+            if label in self.pending:
+                self.pending.discard(label)
+                return True
+            return False
+
+    def _work(self):
+        # Workers exit once the queue is drained, so an idle scheduler holds no threads
+        while True:
+            try:
+                _, _, label, scope = self.queue.get(timeout=1)
+            except queue.Empty:
+                return
+            try:
+                with self._lock:
+                    if label not in self.pending:
+                        continue
+                self._limiter(scope).acquire()
+                with self._lock:
+                    if label not in self.pending:
+                        continue
+                    self.pending.discard(label)
+                self.start_fn(label)
+            except Exception as e:
+                self.logger.error(f"Scheduled start of {label} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        """Block until every queued start has been handled"""
+        self.queue.join()
@@ -0,0 +1,254 @@
+import json
+import socket
+import subprocess
+import time
+
+
+from . import metrics, tracing
+from .exceptions import SSMPortForwardError
+from .output_pump import PluginOutputPump
+
+
+class PluginSession:
+    """
+    What SSMSession and AsyncSSMSession share: the session-manager-plugin command line, its output and
+    telling from that output whether the tunnel came up. The subclasses run the plugin, on threads or
+    on an asyncio event loop.
+    """
+
+    PLUGIN = "session-manager-plugin"
+    # Printed by session-manager-plugin once the local port is listening
+    READY_MARKER = "Waiting for connections"
+    ERROR_MARKERS = ("Cannot perform start session", "Cannot start session")
+
+    def __init__(
+        self,
+        ssm_client,
+        logger,
+        label: str = None,
+        check_connection: bool = True,
+        timeout: int = 60,
+        readiness: str = "output",
+        output_lines: int = 200,
+        **kwargs,
+    ):
+        """
+        readiness decides how check_connection waits for the tunnel: "output" watches the plugin output
+        for its ready marker, "probe" connects to the local port until it accepts a connection.
+        """
+        self.ssm = ssm_client
+        self.logger = logger
+        self.label = label
+        self.check_connection = check_connection
+        self.timeout = timeout
+        self.readiness = readiness
+        self.output_lines = output_lines
+        self.kwargs = kwargs
+        self.session = None
+        self.proc = None
+        self.output_pump = None
+        self.ready_time = None  # seconds from plugin launch until the tunnel was ready
+
+    def _log(self, message):
+        prefix = f"[{self.label}] " if self.label else ""
+        self.logger.info(f"{prefix}{message}")
+
+    def _plugin_args(self):
+        return (
+            self.PLUGIN,
+            json.dumps(self.session),
+            self.ssm.meta.region_name,
+            "StartSession",
+            "",
+            json.dumps(self.kwargs),
+            self.ssm.meta.endpoint_url,
+        )
+
+    def _new_output_pump(self, stream=None):
+        return PluginOutputPump(
+            stream,
+            self.logger,
+            self.label,
+            self.output_lines,
+            markers=(self.READY_MARKER, *self.ERROR_MARKERS),
+        )
+
+    def _local_port(self):
+        """The port the plugin listens on, None when the parameters do not set one"""
+        try:
+            return int(self.kwargs["Parameters"]["localPortNumber"][0])
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def _resumed(self, response):
+        """Continue with the token and stream URL of a resume_session response"""
+        self.session = {
+            "SessionId": response["SessionId"],
+            "TokenValue": response["TokenValue"],
+            "StreamUrl": response["StreamUrl"],
+        }
+
+    def recent_output(self, count=None):
+        """The last lines printed by session-manager-plugin, for diagnostics"""
+        return self.output_pump.recent(count) if self.output_pump else []
+
+    def _exit_message(self):
+        error_msg = "\n".join(self.recent_output(20)) or "Unknown error"
+        return f"session-manager-plugin exited: {error_msg}"
+
+    def _check_marker_line(self, line):
+        """Raise unless the first marker the plugin printed is the ready marker, line is None on a timeout"""
+        if line is None:
+            raise SSMPortForwardError(
+                "session-manager-plugin did not report the tunnel as ready in time."
+            )
+        if self.READY_MARKER not in line:
+            raise SSMPortForwardError(f"session-manager-plugin failed: {line}")
+
+    def _probe_failed(self, port_number):
+        return SSMPortForwardError(
+            f"Unable to connect to {port_number} using session manager."
+        )
+
+
+class SSMSession(PluginSession):
+    """SSM Session Manager context manager class."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.probe_count = 0  # connections made to the local port to check readiness
+
+    def __enter__(self):
+        self._log(f"Starting SSM session for target: {self.kwargs.get('Target')}")
+        t0 = time.monotonic()
+        try:
+            with tracing.span(
+                "ssm.start_session",
+                label=self.label,
+                target=self.kwargs.get("Target"),
+                region=self.ssm.meta.region_name,
+            ):
+                self.session = self.ssm.start_session(**self.kwargs)
+        except Exception:
+            metrics.START_FAILURES.inc(label=self.label or "")
+            raise
+        metrics.START_SESSION_SECONDS.observe(
+            time.monotonic() - t0, label=self.label or ""
+        )
+        try:
+            self._launch_plugin()
+            self._wait_until_ready()
+            return self
+        except Exception:
+            metrics.START_FAILURES.inc(label=self.label or "")
+            self.__exit__(None, None, None)
+            raise
+
+    def resume(self):
+        """
+        Reconnect after the plugin dropped by resuming the existing session with a fresh token and
+        stream URL, which avoids negotiating a new session. Raises if the session can not be resumed,
+        the caller should then fall back to a new session.
+        """
+        session_id = self.session["SessionId"]
+        self._log(f"Resuming SSM session {session_id}...")
+        self._stop_plugin()
+        with tracing.span(
+            "ssm.resume_session", label=self.label, session_id=session_id
+        ):
+            response = self.ssm.resume_session(SessionId=session_id)
+        self._resumed(response)
+        self._launch_plugin()
+        self._wait_until_ready()
+
+    def _launch_plugin(self):
+        try:
+            self._log("Launching session-manager-plugin...")
+            t0 = time.monotonic()
+            with tracing.span("plugin.exec", label=self.label) as span:
+                self.proc = subprocess.Popen(
+                    self._plugin_args(),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL,
+                )
+                span.set(pid=self.proc.pid)
+        except FileNotFoundError:
+            raise SSMPortForwardError("The AWS session-manager-plugin is required.")
+        metrics.PLUGIN_SPAWN_SECONDS.observe(
+            time.monotonic() - t0, label=self.label or ""
+        )
+        metrics.track_plugin(self.proc.pid, self.label)
+        self.output_pump = self._new_output_pump(self.proc.stdout).start()
+
+    def _wait_until_ready(self):
+        if not self.check_connection:
+            return
+        with tracing.span("plugin.ready", label=self.label, readiness=self.readiness):
+            if self.readiness == "output":
+                self._wait_for_output_ready()
+            elif (port_number := self._local_port()) is not None:
+                self._wait_for_port_ready(port_number)
+        if self.ready_time is not None:
+            metrics.READINESS_SECONDS.observe(self.ready_time, label=self.label or "")
+
+    def _stop_plugin(self):
+        if self.proc:
+            self._log("Terminating session-manager-plugin...")
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._log("Force killing session-manager-plugin...")
+                self.proc.kill()
+            metrics.untrack_plugin(self.proc.pid)
+            if self.output_pump:
+                self.output_pump.join(timeout=1)
+
+    def _plugin_exit_message(self):
+        self.proc.wait()
+        # Give the pump a moment to read whatever the plugin printed before it died
+        self.output_pump.join(timeout=1)
+        return self._exit_message()
+
+    def _wait_for_output_ready(self):
+        self._log("Waiting for session-manager-plugin to open the local port...")
+        t0 = time.perf_counter()
+        line = self.output_pump.wait_for_marker(self.timeout)
+        if line is None and self.output_pump.closed:
+            raise SSMPortForwardError(self._plugin_exit_message())
+        self._check_marker_line(line)
+        self.ready_time = time.perf_counter() - t0
+        self._log(f"Tunnel ready after {self.ready_time * 1000:.0f} ms.")
+
+    def _wait_for_port_ready(self, port_number):
+        self._log(f"Checking connection to 127.0.0.1:{port_number}...")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        addr = ("127.0.0.1", port_number)
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < self.timeout:
+            if self.proc.poll() is not None:
+                # Process died
+                raise SSMPortForwardError(self._plugin_exit_message())
+
+            self.probe_count += 1
+            if sock.connect_ex(addr) == 0:
+                self.ready_time = time.perf_counter() - t0
+                self._log(f"Successfully connected to 127.0.0.1:{port_number}.")
+                sock.close()
+                break
+            time.sleep(0.25)
+            continue
+        else:
+            raise self._probe_failed(port_number)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop_plugin()
+
+        if self.session:
+            try:
+                self.ssm.terminate_session(SessionId=self.session["SessionId"])
+            except Exception:
+                metrics.TERMINATE_FAILURES.inc(label=self.label or "")
+                raise
+            self.session = None
@@ -0,0 +1,148 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# The span that is open in the current thread or asyncio task
+_current_span = contextvars.ContextVar("ssmports_span", default=None)
+
+
+class Span:
+    """One timed phase, spans started while it is open become its children"""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = {k: v for k, v in (attributes or {}).items() if v is not None}
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self.thread_id = threading.get_native_id()
+        self.thread_name = threading.current_thread().name
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "thread": self.thread_name,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Records spans of the phases of starting a tunnel, so a slow start can be loaded in a timeline
+    viewer. Only the last max_spans finished spans are kept.
+    """
+
+    def __init__(self, max_spans=10000):
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        t0 = time.monotonic()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            span.duration = time.monotonic() - t0
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def finished_spans(self):
+        with self._lock:
+            return list(self.spans)
+
+    def json_lines(self):
+        """One JSON object per span, in the order the spans finished"""
+        return "".join(
+            json.dumps(span.to_dict(), default=str) + "\n"
+            for span in self.finished_spans()
+        )
+
+    def chrome_trace(self):
+        """The spans as Chrome trace events, for chrome://tracing, Perfetto or speedscope"""
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for span in self.finished_spans():
+            threads[span.thread_id] = span.thread_name
+            args = dict(span.attributes)
+            args.update(
+                trace_id=span.trace_id, span_id=span.span_id, parent_id=span.parent_id
+            )
+            if span.error:
+                args["error"] = span.error
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": "ssmports",
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": args,
+                }
+            )
+        for thread_id, thread_name in threads.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": thread_id,
+                    "args": {"name": thread_name},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        """Write the spans to a file, as JSON lines if it ends with .jsonl, as a Chrome trace otherwise"""
+        path = os.path.expanduser(path)
+        with open(path, "w") as f:
+            if path.endswith(".jsonl"):
+                f.write(self.json_lines())
+            else:
+                json.dump(self.chrome_trace(), f, default=str)
+
+
+TRACER = Tracer()
+
+
+def span(name, **attributes):
+    """Open a span on the shared tracer, attributes with a None value are left out"""
+    return TRACER.span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get()
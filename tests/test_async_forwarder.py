@@ -0,0 +1,151 @@
+import asyncio
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ssmports.async_forwarder import AsyncSSMPortForwarder, AsyncSSMSession
+from ssmports.exceptions import SSMPortForwardError
+from ssmports.relay import free_port
+
+FAKE_PLUGIN = f"""#!{sys.executable}
+import sys, time
+print("Port 8080 opened for sessionId test-id.")
+if sys.argv[6] == "long":
+    print("x" * 200000)
+    sys.argv[6] = "Waiting for connections..."
+print("{{}}".format(sys.argv[6] if len(sys.argv) > 6 else "Waiting for connections..."), flush=True)
+time.sleep(30)
+"""
+
+
+class TestAsyncSSMPortForwarder:
+    @pytest.fixture
+    def fake_plugin(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "session-manager-plugin")
+            with open(path, "w") as f:
+                f.write(FAKE_PLUGIN)
+            os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+            with patch.object(AsyncSSMSession, "PLUGIN", path):
+                yield path
+
+    @pytest.fixture
+    def ssm_client(self):
+        client = MagicMock()
+        client.start_session.side_effect = [
+            {"SessionId": f"test-id{i}", "TokenValue": "token", "StreamUrl": "wss://"}
+            for i in range(5)
+        ]
+        client.meta.region_name = "us-east-1"
+        client.meta.endpoint_url = "Waiting for connections..."
+        return client
+
+    def test_start_and_stop(self, fake_plugin, ssm_client):
+        forwarder = AsyncSSMPortForwarder(logger=MagicMock())
+        threads_before = threading.active_count()
+
+        session_ids = [
+            forwarder.start_session(
+                ssm_client=ssm_client,
+                label=f"test{i}",
+                jump_instance="i-123",
+                target_host="example.com",
+                local_port=8080 + i,
+                remote_port=80,
+            )
+            for i in range(5)
+        ]
+        assert session_ids == [f"test-id{i}" for i in range(5)]
+        assert forwarder.stats["test0"]["state"] == "running"
+        # The tunnels themselves do not need a thread each
+        assert threading.active_count() <= threads_before + 2
+        assert len(forwarder.tasks) == 5
+
+        forwarder.stop_session("test-id4", wait=True)
+        assert forwarder.stats["test4"]["state"] == "stopped"
+        assert "test-id4" not in forwarder.active_sessions
+        ssm_client.terminate_session.assert_called_once_with(SessionId="test-id4")
+
+        remaining = list(forwarder.active_sessions.values())
+        forwarder.stop_all()
+        for session in remaining:
+            assert session["done"].wait(timeout=10)
+        assert forwarder.active_sessions == {}
+        # Finished tunnels are dropped from the task set
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), forwarder.loop).result()
+        assert forwarder.tasks == set()
+
+    def test_relay_shares_the_event_loop(self, fake_plugin, ssm_client):
+        forwarder = AsyncSSMPortForwarder(logger=MagicMock())
+        local_port = free_port()
+        sid = forwarder.start_session(
+            ssm_client=ssm_client,
+            label="test",
+            jump_instance="i-123",
+            target_host="example.com",
+            local_port=local_port,
+            remote_port=80,
+            relay=True,
+        )
+        assert forwarder.relay.loop is forwarder.loop
+        plugin_port = ssm_client.start_session.call_args.kwargs["Parameters"][
+            "localPortNumber"
+        ][0]
+        assert forwarder.relay.stats["test"]["listen_port"] == local_port
+        assert forwarder.relay.stats["test"]["target_port"] == int(plugin_port)
+        assert int(plugin_port) != local_port
+        forwarder.stop_session(sid, wait=True)
+        assert "test" not in forwarder.relay.servers
+
+    def test_start_error_marker(self, fake_plugin, ssm_client):
+        ssm_client.meta.endpoint_url = "Cannot perform start session: EOF"
+        forwarder = AsyncSSMPortForwarder(logger=MagicMock())
+        with pytest.raises(SSMPortForwardError, match="Cannot perform start session"):
+            forwarder.start_session(
+                ssm_client=ssm_client,
+                label="test",
+                jump_instance="i-123",
+                target_host="example.com",
+                local_port=8080,
+                remote_port=80,
+            )
+        ssm_client.terminate_session.assert_called_once_with(SessionId="test-id0")
+
+    def test_start_timeout_cancels_the_tunnel(self, fake_plugin, ssm_client):
+        ssm_client.meta.endpoint_url = "Still starting..."
+        forwarder = AsyncSSMPortForwarder(logger=MagicMock())
+        with patch.object(AsyncSSMPortForwarder, "START_TIMEOUT", 1):
+            with pytest.raises(SSMPortForwardError, match="within timeout"):
+                forwarder.start_session(
+                    ssm_client=ssm_client,
+                    label="test",
+                    jump_instance="i-123",
+                    target_host="example.com",
+                    local_port=8080,
+                    remote_port=80,
+                )
+        deadline = time.monotonic() + 10
+        while forwarder.tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert forwarder.tasks == set()
+        ssm_client.terminate_session.assert_called_once_with(SessionId="test-id0")
+
+    def test_long_output_lines(self, fake_plugin, ssm_client):
+        ssm_client.meta.endpoint_url = "long"
+        forwarder = AsyncSSMPortForwarder(logger=MagicMock())
+        sid = forwarder.start_session(
+            ssm_client=ssm_client,
+            label="test",
+            jump_instance="i-123",
+            target_host="example.com",
+            local_port=8080,
+            remote_port=80,
+        )
+        assert forwarder.stats["test"]["state"] == "running"
+        forwarder.stop_session(sid, wait=True)
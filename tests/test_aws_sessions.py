@@ -0,0 +1,159 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ssmports.aws_sessions import AWSSessions
+from ssmports.exceptions import SSMPortForwardError
+
+
+class TestAWSSessions:
+    @pytest.fixture
+    def sessions(self):
+        factory = MagicMock()
+        factory.create_client.side_effect = lambda *args, **kwargs: MagicMock()
+        aws_sessions = AWSSessions(client_factory=factory)
+        with patch.object(
+            aws_sessions, "create_session", side_effect=lambda **kwargs: MagicMock()
+        ):
+            yield aws_sessions
+
+    def test_clients_are_cached(self, sessions):
+        ssm = sessions.client("ssm", profile_name="dev", region_name="eu-west-1")
+        assert (
+            sessions.client("ssm", profile_name="dev", region_name="eu-west-1") is ssm
+        )
+        assert (
+            sessions.client("ecs", profile_name="dev", region_name="eu-west-1")
+            is not ssm
+        )
+        assert (
+            sessions.client("ssm", profile_name="dev", region_name="us-east-1")
+            is not ssm
+        )
+        assert sessions.client_factory.create_client.call_count == 3
+
+    def test_invalidate_drops_clients_of_profile(self, sessions):
+        dev = sessions.client("ssm", profile_name="dev", region_name="eu-west-1")
+        prod = sessions.client("ssm", profile_name="prod", region_name="eu-west-1")
+        sessions.invalidate("dev")
+        assert (
+            sessions.client("ssm", profile_name="dev", region_name="eu-west-1")
+            is not dev
+        )
+        assert (
+            sessions.client("ssm", profile_name="prod", region_name="eu-west-1") is prod
+        )
+
+    def test_prune_drops_unused_clients(self, sessions):
+        sessions.client("ssm", profile_name="dev", region_name="eu-west-1")
+        sessions.client("ssm", profile_name="prod", region_name="eu-west-1")
+        sessions.prune({"prod"})
+        assert set(sessions.clients) == {("prod", "eu-west-1", "ssm")}
+
+    def test_prewarm(self, sessions):
+        sessions.prewarm({("dev", "eu-west-1"), (None, None)}).join(timeout=5)
+        assert set(sessions.clients) == {
+            ("dev", "eu-west-1", "ssm"),
+            (None, None, "ssm"),
+        }
+
+    def test_sessions_are_keyed_by_profile_and_region(self, sessions):
+        eu = sessions.get_session("dev", "eu-west-1")
+        assert sessions.get_session("dev", "eu-west-1") is eu
+        assert sessions.get_session("dev", "us-east-1") is not eu
+        assert sessions.stats["hits"] == 1
+        assert sessions.stats["misses"] == 2
+
+    def test_concurrent_callers_share_one_creation(self):
+        aws_sessions = AWSSessions(client_factory=MagicMock())
+        release = threading.Event()
+
+        def create_session(**kwargs):
+            release.wait(5)
+            return MagicMock()
+
+        results = []
+        with patch.object(
+            aws_sessions, "create_session", side_effect=create_session
+        ) as mock_create:
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(
+                        aws_sessions.get_session("dev", "eu-west-1")
+                    )
+                )
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            while aws_sessions.stats["waits"] < 4:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join(timeout=5)
+        assert mock_create.call_count == 1
+        assert len(results) == 5
+        assert all(result is results[0] for result in results)
+
+    def test_failed_creation_is_not_cached(self):
+        aws_sessions = AWSSessions(client_factory=MagicMock())
+        with patch.object(
+            aws_sessions,
+            "create_session",
+            side_effect=[SSMPortForwardError("(ExpiredToken)"), MagicMock()],
+        ):
+            with pytest.raises(SSMPortForwardError):
+                aws_sessions.get_session("dev", "eu-west-1")
+            assert aws_sessions.get_session("dev", "eu-west-1") is not None
+
+    @patch("ssmports.aws_sessions.boto3.Session")
+    def test_credentials_validated_once_per_profile(self, mock_boto_session):
+        factory = MagicMock()
+        sts = factory.create_client.return_value
+        sts.get_caller_identity.return_value = {"Account": "123456789012"}
+        aws_sessions = AWSSessions(client_factory=factory)
+        aws_sessions.get_session("dev", "eu-west-1")
+        aws_sessions.get_session("dev", "us-east-1")
+        assert sts.get_caller_identity.call_count == 1
+        assert aws_sessions.accounts == {"dev": "123456789012"}
+        aws_sessions.invalidate("dev")
+        aws_sessions.get_session("dev", "eu-west-1")
+        assert sts.get_caller_identity.call_count == 2
+
+    @patch("ssmports.aws_sessions.boto3.Session")
+    def test_lazy_validation(self, mock_boto_session):
+        factory = MagicMock()
+        sts = factory.create_client.return_value
+        release = threading.Event()
+
+        def get_caller_identity():
+            release.wait(5)
+            raise Exception("(ExpiredToken)")
+
+        sts.get_caller_identity.side_effect = get_caller_identity
+        aws_sessions = AWSSessions(client_factory=factory)
+        aws_sessions.lazy_validation = True
+        events = []
+        aws_sessions.add_listener(
+            lambda profile, error: events.append((profile, error))
+        )
+        # Returned right away, before the credentials were checked
+        assert aws_sessions.get_session("dev", "eu-west-1") is not None
+        assert "dev" not in aws_sessions.credential_errors
+
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == "aws-credential-validation":
+                thread.join(timeout=5)
+        assert "(ExpiredToken)" in aws_sessions.credential_errors["dev"]
+        assert aws_sessions.sessions == {}
+        assert events == [("dev", aws_sessions.credential_errors["dev"])]
+
+        # Once the credentials validate again the error is cleared
+        sts.get_caller_identity.side_effect = None
+        sts.get_caller_identity.return_value = {"Account": "123456789012"}
+        aws_sessions.lazy_validation = False
+        aws_sessions.get_session("dev", "eu-west-1")
+        assert events[-1] == ("dev", None)
@@ -0,0 +1,156 @@
+import json
+import os
+import signal
+import tempfile
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from ssmports import cli
+
+
+class TestCli:
+    @pytest.fixture
+    def config_path(self):
+        config = {
+            "connections": {
+                "DB": {
+                    "target_host": "db",
+                    "local_port": 5432,
+                    "remote_port": 5432,
+                    "autostart": True,
+                },
+                "Web": {"target_host": "web", "local_port": 8080, "remote_port": 80},
+            }
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "sessions.json")
+            with open(path, "w") as f:
+                json.dump(config, f)
+            with patch.dict(
+                os.environ,
+                {
+                    "SSMPORTS_STATE": os.path.join(temp_dir, "state.json"),
+                    "SSMPORTS_SOCKET": os.path.join(temp_dir, "ssmports.sock"),
+                },
+            ):
+                yield path
+
+    def test_list(self, config_path, capsys):
+        assert cli.main(["-c", config_path, "list"]) == 0
+        output = capsys.readouterr().out
+        assert "DB" in output and "db:5432" in output
+
+    def test_status_not_running(self, config_path, capsys):
+        assert cli.main(["-c", config_path, "status"]) == 3
+        assert "not running" in capsys.readouterr().out
+
+    def test_status_of_running_up(self, config_path, capsys):
+        cli.write_state(
+            {
+                "pid": os.getpid(),
+                "tunnels": {
+                    "DB": {"state": "running", "local_port": 5432, "session_id": "s-1"}
+                },
+            }
+        )
+        with patch("ssmports.cli.port_open", return_value=True):
+            assert cli.main(["-c", config_path, "status", "--json"]) == 0
+        assert json.loads(capsys.readouterr().out)["DB"]["listening"] is True
+
+    @patch("ssmports.cli.TunnelController")
+    def test_up_failed_start(self, mock_controller, config_path, capsys):
+        controller = mock_controller.return_value
+        controller.app_config = {}
+        controller.autostart_labels.return_value = ["DB"]
+        controller.status.return_value = {
+            "DB": {"state": "failed", "error": "boom", "local_port": 5432}
+        }
+        handlers = signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM)
+        try:
+            assert cli.main(["-c", config_path, "up"]) == 1
+        finally:
+            signal.signal(signal.SIGINT, handlers[0])
+            signal.signal(signal.SIGTERM, handlers[1])
+        controller.start_many.assert_called_once_with(["DB"])
+        controller.stop_all.assert_called_once()
+        assert "FAILED  DB: boom" in capsys.readouterr().err
+
+    @patch("ssmports.cli.TunnelController")
+    def test_up_runs_until_terminated(self, mock_controller, config_path):
+        controller = mock_controller.return_value
+        controller.app_config = {}
+        controller.select.return_value = ["Web"]
+        controller.status.return_value = {
+            "Web": {"state": "running", "local_port": 8080, "session_id": "s-1"}
+        }
+
+        def terminate():
+            assert cli.read_state()["tunnels"]["Web"]["session_id"] == "s-1"
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        handlers = signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM)
+        timer = threading.Timer(0.2, terminate)
+        timer.start()
+        try:
+            assert cli.main(["-c", config_path, "up", "Web"]) == 0
+        finally:
+            timer.cancel()
+            signal.signal(signal.SIGINT, handlers[0])
+            signal.signal(signal.SIGTERM, handlers[1])
+        controller.stop_all.assert_called_once()
+        assert cli.read_state() is None
+
+    @patch("ssmports.cli.TunnelController")
+    def test_down_on_windows(self, mock_controller, config_path, capsys):
+        controller = mock_controller.return_value
+        controller.app_config = {}
+        controller.select.return_value = ["Web"]
+        controller.status.return_value = {
+            "Web": {"state": "running", "local_port": 8080, "session_id": "s-1"}
+        }
+        stopped = threading.Event()
+
+        def up():
+            assert cli.main(["-c", config_path, "up", "Web"]) == 0
+            stopped.set()
+
+        handlers = signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM)
+        try:
+            with patch("ssmports.cli.signal.signal"):
+                thread = threading.Thread(target=up)
+                thread.start()
+                while cli.read_state() is None:
+                    threading.Event().wait(0.05)
+            with (
+                patch.object(cli.sys, "platform", "win32"),
+                patch.object(
+                    cli, "_windows_pid_alive", lambda pid: not stopped.is_set()
+                ),
+                patch.object(cli.os, "kill") as kill,
+            ):
+                assert cli.main(["-c", config_path, "down"]) == 0
+            kill.assert_not_called()
+            thread.join(timeout=5)
+        finally:
+            signal.signal(signal.SIGINT, handlers[0])
+            signal.signal(signal.SIGTERM, handlers[1])
+        controller.stop_all.assert_called_once()
+        assert not os.path.exists(cli.stop_path())
+        assert "Stopped 1 tunnels" in capsys.readouterr().out
+
+    @patch("ssmports.cli.DaemonClient")
+    def test_up_and_down_through_daemon(self, mock_client, config_path, capsys):
+        mock_client.available.return_value = True
+        client = mock_client.return_value
+        client.call.return_value = {"DB": {"session_id": "s-1", "error": None}}
+        assert cli.main(["-c", config_path, "up", "DB"]) == 0
+        client.call.assert_called_with(
+            "start", labels=["DB"], groups=[], autostart=False
+        )
+        assert "UP      DB (s-1)" in capsys.readouterr().out
+
+        client.call.return_value = ["DB"]
+        assert cli.main(["-c", config_path, "down", "-g", "data"]) == 0
+        client.call.assert_called_with("stop", labels=[], groups=["data"])
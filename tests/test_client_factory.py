@@ -0,0 +1,121 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+from ssmports import metrics
+from ssmports.client_factory import ClientFactory
+
+
+def fake_response(status_code, body):
+    raw = MagicMock()
+    raw.stream.return_value = [json.dumps(body).encode()]
+    return AWSResponse(
+        "https://ssm.eu-west-1.amazonaws.com/",
+        status_code,
+        {"Content-Type": "application/x-amz-json-1.1"},
+        raw,
+    )
+
+
+class TestClientFactory:
+    @pytest.fixture
+    def session(self):
+        return boto3.Session(
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+            region_name="eu-west-1",
+        )
+
+    def test_client_settings(self, session):
+        factory = ClientFactory(max_attempts=3, max_pool_connections=20)
+        client = factory.create_client(session, "ssm", region_name="us-east-1")
+        assert client.meta.region_name == "us-east-1"
+        assert client.meta.config.retries == {
+            "mode": "adaptive",
+            "total_max_attempts": 3,
+        }
+        assert client.meta.config.max_pool_connections == 20
+
+    def test_clients_share_limiter_per_account_region_service(self, session):
+        factory = ClientFactory()
+        factory.create_client(session, "ssm", account="111")
+        factory.create_client(session, "ssm", account="111")
+        factory.create_client(session, "ecs", account="111")
+        factory.create_client(session, "ssm", account="222")
+        assert set(factory.limiters) == {
+            ("111", "eu-west-1", "ssm"),
+            ("111", "eu-west-1", "ecs"),
+            ("222", "eu-west-1", "ssm"),
+        }
+
+    def test_profiles_without_account_do_not_share_a_limiter(self, session):
+        factory = ClientFactory()
+        factory.create_client(session, "sts", profile="dev")
+        factory.create_client(session, "sts", profile="prod")
+        assert set(factory.limiters) == {
+            ("dev", "eu-west-1", "sts"),
+            ("prod", "eu-west-1", "sts"),
+        }
+
+    def test_attempts_take_a_token(self, session):
+        factory = ClientFactory()
+        client = factory.create_client(session, "ssm", account="111")
+        client.meta.events.register(
+            "before-send",
+            lambda **kwargs: fake_response(200, {"SessionId": "s-1"}),
+        )
+        client.terminate_session(SessionId="s-1")
+        client.terminate_session(SessionId="s-1")
+        key = ("111", "eu-west-1", "ssm")
+        assert factory.calls[key] == 2
+        assert factory.limiters[key].tokens < factory.limiters[key].capacity
+
+    def test_attempts_are_counted_across_threads(self, session):
+        factory = ClientFactory(rate=1000000)
+        client = factory.create_client(session, "ssm", account="111")
+        client.meta.events.register(
+            "before-send",
+            lambda **kwargs: fake_response(200, {"SessionId": "s-1"}),
+        )
+
+        def run():
+            for _ in range(25):
+                client.terminate_session(SessionId="s-1")
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert factory.calls[("111", "eu-west-1", "ssm")] == 200
+
+    def test_throttling_is_counted(self, session):
+        factory = ClientFactory(max_attempts=1)
+        client = factory.create_client(
+            session, "ssm", account="111", profile="throttle-test"
+        )
+        client.meta.events.register(
+            "before-send",
+            lambda **kwargs: fake_response(
+                400, {"__type": "ThrottlingException", "message": "Rate exceeded"}
+            ),
+        )
+        with pytest.raises(ClientError):
+            client.terminate_session(SessionId="s-1")
+        assert factory.throttles[("111", "eu-west-1", "ssm")] == 1
+        labels = {"profile": "throttle-test", "region": "eu-west-1", "service": "ssm"}
+        assert metrics.AWS_THROTTLES.get(**labels) == 1
+        assert metrics.AWS_API_CALLS.get(operation="TerminateSession", **labels) == 1
+
+    def test_update_settings(self, session):
+        factory = ClientFactory(rate=10)
+        factory.create_client(session, "ssm")
+        factory.update_settings(rate=2, max_attempts=4)
+        assert all(limiter.rate == 2 for limiter in factory.limiters.values())
+        client = factory.create_client(session, "ecs")
+        assert client.meta.config.retries["total_max_attempts"] == 4
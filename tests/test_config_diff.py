@@ -0,0 +1,48 @@
+from ssmports.config_diff import diff_connections
+
+
+class TestDiffConnections:
+    base = {
+        "target_host": "db.example.com",
+        "local_port": 5432,
+        "remote_port": 5432,
+        "jump_instance": "i-1234567890abcdef0",
+        "profile": "test",
+        "region": "eu-west-1",
+    }
+
+    def test_no_changes(self):
+        old = {"Conn1": dict(self.base)}
+        new = {"Conn1": dict(self.base)}
+        diff = diff_connections(old, new)
+        assert not diff.has_changes
+        assert diff.unchanged == ["Conn1"]
+
+    def test_added_and_removed(self):
+        old = {"Conn1": dict(self.base)}
+        new = {"Conn2": dict(self.base)}
+        diff = diff_connections(old, new)
+        assert diff.added == ["Conn2"]
+        assert diff.removed == ["Conn1"]
+        assert diff.has_changes
+
+    def test_changed_session_keys(self):
+        old = {"Conn1": dict(self.base)}
+        new = {"Conn1": dict(self.base, local_port=5433, jump_instance="i-0abc")}
+        diff = diff_connections(old, new)
+        assert diff.changed == {"Conn1": ["local_port", "jump_instance"]}
+        assert diff.cosmetic == []
+
+    def test_cosmetic_only(self):
+        old = {"Conn1": dict(self.base)}
+        new = {"Conn1": dict(self.base, link="http://127.0.0.1:{local_port}")}
+        diff = diff_connections(old, new)
+        assert diff.changed == {}
+        assert diff.cosmetic == ["Conn1"]
+
+    def test_tunnel_behaviour_keys_restart_the_session(self):
+        old = {"Conn1": dict(self.base)}
+        new = {"Conn1": dict(self.base, readiness="probe", reconnect=False, relay=True)}
+        diff = diff_connections(old, new)
+        assert diff.changed == {"Conn1": ["readiness", "reconnect", "relay"]}
+        assert diff.cosmetic == []
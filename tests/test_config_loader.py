@@ -1,11 +1,12 @@
 import json
 import os
 import tempfile
+import time
 import pytest
 from unittest.mock import MagicMock, patch
 
-from src.config_loader import ConfigLoader
-from src.exceptions import SSMPortForwardError
+from ssmports.config_loader import ConfigLoader
+from ssmports.exceptions import SSMPortForwardError
 
 
 class TestConfigLoader:
@@ -28,8 +29,8 @@ class TestConfigLoader:
         yield temp_path
         os.unlink(temp_path)
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_load_config_valid(
         self, mock_aws_sessions, mock_ecs_resolver, temp_config_file
     ):
@@ -58,8 +59,8 @@ class TestConfigLoader:
         finally:
             os.unlink(temp_path)
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_validate_schema_invalid(self, mock_aws_sessions, mock_ecs_resolver):
         mock_aws_sessions.return_value = MagicMock()
         mock_ecs_resolver.return_value = MagicMock()
@@ -70,8 +71,8 @@ class TestConfigLoader:
         ):
             loader.validate_schema(invalid_config)
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_validate_no_double_ports(self, mock_aws_sessions, mock_ecs_resolver):
         mock_aws_sessions.return_value = MagicMock()
         mock_ecs_resolver.return_value = MagicMock()
@@ -85,16 +86,16 @@ class TestConfigLoader:
         with pytest.raises(SSMPortForwardError, match="Duplicate local_port found"):
             loader.validate_no_double_ports(config)
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_validate_instance_id_valid_ec2(self, mock_aws_sessions, mock_ecs_resolver):
         mock_aws_sessions.return_value = MagicMock()
         mock_ecs_resolver.return_value = MagicMock()
         loader = ConfigLoader("dummy.json")
         loader.validate_instance_id("i-1234567890abcdef0")  # Should not raise
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_validate_instance_id_valid_ecs(self, mock_aws_sessions, mock_ecs_resolver):
         mock_aws_sessions.return_value = MagicMock()
         mock_ecs_resolver.return_value = MagicMock()
@@ -103,8 +104,8 @@ class TestConfigLoader:
             "ecs:my-cluster_12345678901234567890123456789012_12345678901234567890123456789012-0151737364"
         )
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_validate_instance_id_invalid(self, mock_aws_sessions, mock_ecs_resolver):
         mock_aws_sessions.return_value = MagicMock()
         mock_ecs_resolver.return_value = MagicMock()
@@ -112,8 +113,8 @@ class TestConfigLoader:
         with pytest.raises(SSMPortForwardError, match="Invalid instance_id format"):
             loader.validate_instance_id("invalid-id")
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_fold_defaults_into_connections(self, mock_aws_sessions, mock_ecs_resolver):
         mock_aws_sessions.return_value = MagicMock()
         mock_ecs_resolver.return_value = MagicMock()
@@ -138,14 +139,16 @@ class TestConfigLoader:
         assert config["connections"]["Conn1"]["jump_instance"] == "i-123"
         assert config["connections"]["Conn2"]["profile"] == "other"  # Not overwritten
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_validate_or_load_instance_ids_resolves_ecs(
         self, mock_aws_sessions, mock_ecs_resolver
     ):
-        mock_session = MagicMock()
-        mock_aws_sessions.return_value.get_session.return_value = mock_session
-        mock_ecs_resolver.return_value.resolve_task_name.return_value = "i-resolved"
+        mock_ecs_client = MagicMock()
+        mock_aws_sessions.return_value.client.return_value = mock_ecs_client
+        mock_ecs_resolver.return_value.resolve_task_names.return_value = {
+            "some-container": "i-resolved"
+        }
         loader = ConfigLoader("dummy.json")
         config = {
             "connections": {
@@ -165,12 +168,427 @@ class TestConfigLoader:
         ):
             loader.validate_or_load_instance_ids(config)
         assert config["connections"]["Conn1"]["jump_instance"] == "i-resolved"
-        mock_ecs_resolver.return_value.resolve_task_name.assert_called_once_with(
-            "some-container", mock_session.client("ecs")
+        mock_ecs_resolver.return_value.resolve_task_names.assert_called_once_with(
+            ["some-container"], mock_ecs_client
+        )
+        mock_aws_sessions.return_value.client.assert_called_once_with(
+            "ecs", profile_name="test", region_name="us-west-1"
+        )
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_validate_or_load_instance_ids_single_sweep_per_account(
+        self, mock_aws_sessions
+    ):
+        mock_ecs_client = MagicMock()
+        mock_aws_sessions.return_value.client.return_value = mock_ecs_client
+        mock_ecs_client.list_clusters.return_value = {
+            "clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/my-cluster"]
+        }
+        mock_ecs_client.list_tasks.return_value = {
+            "taskArns": [
+                f"arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task{i}"
+                for i in range(20)
+            ]
+        }
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": f"arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task{i}",
+                    "containers": [{"name": f"container{i}", "runtimeId": f"r{i}"}],
+                }
+                for i in range(20)
+            ]
+        }
+        loader = ConfigLoader("dummy.json")
+        config = {
+            "connections": {
+                f"Conn{i}": {
+                    "target_host": "host",
+                    "local_port": i,
+                    "remote_port": 1,
+                    "jump_instance": f"container{i}",
+                    "profile": "test",
+                    "region": "us-east-1",
+                }
+                for i in range(20)
+            }
+        }
+        loader.validate_or_load_instance_ids(config)
+
+        resolver = loader.get_ecs_id_resolver("test", "us-east-1")
+        assert resolver.sweeps == 1
+        assert mock_ecs_client.list_clusters.call_count == 1
+        assert (
+            config["connections"]["Conn7"]["jump_instance"] == "ecs:my-cluster_task7_r7"
+        )
+
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_validate_or_load_instance_ids_reports_errors_per_connection(
+        self, mock_aws_sessions, mock_ecs_resolver
+    ):
+        def client(service, profile_name=None, region_name=None):
+            if profile_name == "expired":
+                raise SSMPortForwardError("(ExpiredToken)")
+            return MagicMock()
+
+        mock_aws_sessions.return_value.client.side_effect = client
+        mock_ecs_resolver.return_value.resolve_task_names.return_value = {
+            "container": "i-resolved"
+        }
+        loader = ConfigLoader("dummy.json")
+        config = {
+            "connections": {
+                name: {
+                    "target_host": "host",
+                    "local_port": i,
+                    "remote_port": 1,
+                    "jump_instance": "container",
+                    "profile": profile,
+                }
+                for i, (name, profile) in enumerate(
+                    [("Conn1", "expired"), ("Conn2", "valid"), ("Conn3", "expired")]
+                )
+            }
+        }
+        with pytest.raises(
+            SSMPortForwardError, match="Failed to resolve 2 connections"
+        ):
+            loader.validate_or_load_instance_ids(config)
+
+        assert list(loader.connection_errors) == ["Conn1", "Conn3"]
+        assert "(ExpiredToken)" in loader.connection_errors["Conn1"]
+        assert config["connections"]["Conn2"]["jump_instance"] == "i-resolved"
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_validate_or_load_instance_ids_uses_disk_cache(self, mock_aws_sessions):
+        mock_ecs_client = MagicMock()
+        mock_aws_sessions.return_value.client.return_value = mock_ecs_client
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task1",
+                    "lastStatus": "RUNNING",
+                    "containers": [{"name": "container", "runtimeId": "runtime1"}],
+                }
+            ]
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            app_config = {
+                "ecs_cache_ttl": 3600,
+                "ecs_cache_path": os.path.join(temp_dir, "ecs_id_cache.json"),
+            }
+            loader = ConfigLoader("dummy.json")
+            loader.get_id_cache(app_config).put(
+                "test", None, "container", "ecs:my-cluster_task1_runtime1"
+            )
+            config = {
+                "app_config": app_config,
+                "connections": {
+                    "Conn1": {
+                        "target_host": "host",
+                        "local_port": 1,
+                        "remote_port": 1,
+                        "jump_instance": "container",
+                        "profile": "test",
+                    }
+                },
+            }
+            loader.validate_or_load_instance_ids(config)
+
+        assert (
+            config["connections"]["Conn1"]["jump_instance"]
+            == "ecs:my-cluster_task1_runtime1"
+        )
+        mock_ecs_client.describe_tasks.assert_called_once()
+        mock_ecs_client.list_clusters.assert_not_called()
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_reload_reuses_resolved_ids(self, mock_aws_sessions):
+        mock_ecs_client = MagicMock()
+        mock_aws_sessions.return_value.client.return_value = mock_ecs_client
+        mock_ecs_client.list_clusters.return_value = {
+            "clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/my-cluster"]
+        }
+        mock_ecs_client.list_tasks.return_value = {
+            "taskArns": ["arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task1"]
+        }
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task1",
+                    "lastStatus": "RUNNING",
+                    "containers": [{"name": "container", "runtimeId": "runtime1"}],
+                }
+            ]
+        }
+        config = {
+            "profile": "test",
+            "app_config": {"ecs_cache_ttl": 0},
+            "connections": {
+                "Conn1": {
+                    "target_host": "host",
+                    "local_port": 1,
+                    "remote_port": 1,
+                    "jump_instance": "container",
+                }
+            },
+        }
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as f:
+            json.dump(config, f)
+            temp_path = f.name
+        try:
+            loader = ConfigLoader(temp_path)
+            loader.load_config()
+            loaded, _ = loader.load_config()
+        finally:
+            os.unlink(temp_path)
+
+        assert (
+            loaded["connections"]["Conn1"]["jump_instance"]
+            == "ecs:my-cluster_task1_runtime1"
+        )
+        assert mock_ecs_client.list_clusters.call_count == 1
+        # The ID of the first load is checked with describe_tasks instead of a sweep
+        assert mock_ecs_client.describe_tasks.call_count == 2
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_reload_resolves_stopped_tasks_again(self, mock_aws_sessions):
+        mock_ecs_client = MagicMock()
+        mock_aws_sessions.return_value.client.return_value = mock_ecs_client
+        mock_ecs_client.list_clusters.return_value = {
+            "clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/my-cluster"]
+        }
+        mock_ecs_client.list_tasks.return_value = {
+            "taskArns": ["arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task2"]
+        }
+        mock_ecs_client.describe_tasks.side_effect = lambda cluster, tasks: {
+            "tasks": [
+                {
+                    "taskArn": f"arn:aws:ecs:us-east-1:123456789012:task/my-cluster/{task}",
+                    "lastStatus": "STOPPED" if task == "task1" else "RUNNING",
+                    "containers": [{"name": "container", "runtimeId": "runtime"}],
+                }
+                for task in tasks
+            ]
+        }
+        loader = ConfigLoader("dummy.json")
+        loader.get_ecs_id_resolver("test", None).found_ids[
+            "container"
+        ] = "ecs:my-cluster_task1_runtime"
+        config = {
+            "connections": {
+                "Conn1": {
+                    "target_host": "host",
+                    "local_port": 1,
+                    "remote_port": 1,
+                    "jump_instance": "container",
+                    "profile": "test",
+                }
+            },
+        }
+        loader.validate_or_load_instance_ids(config)
+
+        assert (
+            config["connections"]["Conn1"]["jump_instance"]
+            == "ecs:my-cluster_task2_runtime"
+        )
+        assert mock_ecs_client.list_clusters.call_count == 1
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_forget_instance_id(self, mock_aws_sessions):
+        loader = ConfigLoader("dummy.json")
+        loader.get_ecs_id_resolver("test", None).found_ids[
+            "container"
+        ] = "ecs:my-cluster_task1_runtime1"
+        connection = {
+            "jump_instance": "ecs:my-cluster_task1_runtime1",
+            "profile": "test",
+        }
+        assert loader.forget_instance_id(connection) == "container"
+        assert connection["jump_instance"] == "container"
+        assert loader.get_ecs_id_resolver("test", None).found_ids == {}
+        # Instance IDs that were not resolved from a container name are left alone
+        connection = {"jump_instance": "i-0123456789abcdef0", "profile": "test"}
+        assert loader.forget_instance_id(connection) is None
+        assert connection["jump_instance"] == "i-0123456789abcdef0"
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_lazy_load_makes_no_aws_calls(self, mock_aws_sessions):
+        config = {
+            "profile": "test",
+            "app_config": {"lazy_load": True, "ecs_cache_ttl": 0},
+            "connections": {
+                "Conn1": {
+                    "target_host": "host",
+                    "local_port": 1,
+                    "remote_port": 1,
+                    "jump_instance": "container",
+                },
+                "Conn2": {
+                    "target_host": "host",
+                    "local_port": 2,
+                    "remote_port": 1,
+                    "jump_instance": "other-container",
+                },
+            },
+        }
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False) as f:
+            json.dump(config, f)
+            temp_path = f.name
+        try:
+            loader = ConfigLoader(temp_path)
+            # Resolved earlier by this process, for example before a reload
+            loader.get_ecs_id_resolver("test", None).found_ids["container"] = "i-known"
+            loaded, _ = loader.load_config()
+        finally:
+            os.unlink(temp_path)
+
+        mock_aws_sessions.return_value.client.assert_not_called()
+        mock_aws_sessions.return_value.get_session.assert_not_called()
+        assert mock_aws_sessions.return_value.lazy_validation is True
+        assert loaded["connections"]["Conn1"]["jump_instance"] == "i-known"
+        assert loaded["connections"]["Conn2"]["jump_instance"] == "other-container"
+
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_resolve_in_background_reports_errors(
+        self, mock_aws_sessions, mock_ecs_resolver
+    ):
+        def client(service, profile_name=None, region_name=None):
+            if profile_name == "expired":
+                raise SSMPortForwardError("(ExpiredToken)")
+            return MagicMock()
+
+        mock_aws_sessions.return_value.client.side_effect = client
+        mock_ecs_resolver.return_value.resolve_task_names.return_value = {
+            "container": "i-resolved"
+        }
+        loader = ConfigLoader("dummy.json")
+        config = {
+            "connections": {
+                name: {
+                    "target_host": "host",
+                    "local_port": i,
+                    "remote_port": 1,
+                    "jump_instance": "container",
+                    "profile": profile,
+                }
+                for i, (name, profile) in enumerate(
+                    [("Conn1", "expired"), ("Conn2", "valid")]
+                )
+            }
+        }
+        results = []
+        loader.resolve_in_background(config, on_done=results.append).join(timeout=5)
+        assert list(results[0]) == ["Conn1"]
+        assert config["connections"]["Conn2"]["jump_instance"] == "i-resolved"
+
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_resolve_connection(self, mock_aws_sessions, mock_ecs_resolver):
+        mock_ecs_resolver.return_value.resolve_task_names.return_value = {
+            "container": "i-0123456789abcdef0"
+        }
+        loader = ConfigLoader("dummy.json")
+        connection = {"jump_instance": "container", "profile": "test"}
+        loader.collect_unresolved_container_names({"connections": {"C": connection}})
+        loader.resolve_connection(connection)
+        assert connection["jump_instance"] == "i-0123456789abcdef0"
+
+        # Already resolved connections need no AWS calls
+        loader.resolve_connection(connection)
+        mock_ecs_resolver.return_value.resolve_task_names.assert_called_once()
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_resolved_ids_are_not_resolved_again(self, mock_aws_sessions):
+        # Cluster names with underscores and 64 hex runtime IDs do not match validate_instance_id
+        instance_id = f"ecs:my_cluster_task1_{'a' * 64}"
+        mock_ecs_client = MagicMock()
+        mock_aws_sessions.return_value.client.return_value = mock_ecs_client
+        mock_ecs_client.list_clusters.return_value = {
+            "clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/my_cluster"]
+        }
+        mock_ecs_client.list_tasks.return_value = {
+            "taskArns": ["arn:aws:ecs:us-east-1:123456789012:task/my_cluster/task1"]
+        }
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my_cluster/task1",
+                    "containers": [{"name": "bastion", "runtimeId": "a" * 64}],
+                }
+            ]
+        }
+        loader = ConfigLoader("dummy.json")
+        config = {"connections": {"C": {"jump_instance": "bastion"}}}
+        loader.collect_unresolved_container_names(config)
+        connection = config["connections"]["C"]
+        loader.resolve_connection(connection)
+        assert connection["jump_instance"] == instance_id
+
+        loader.resolve_connection(connection)
+        assert loader.collect_unresolved_container_names(config) == {}
+        assert mock_ecs_client.list_clusters.call_count == 1
+
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_resolution_per_account_is_serialised(self, mock_aws_sessions):
+        mock_ecs_client = MagicMock()
+        mock_aws_sessions.return_value.client.return_value = mock_ecs_client
+
+        def list_clusters(**kwargs):
+            time.sleep(0.2)
+            return {
+                "clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/cluster"]
+            }
+
+        mock_ecs_client.list_clusters.side_effect = list_clusters
+        mock_ecs_client.list_tasks.return_value = {
+            "taskArns": ["arn:aws:ecs:us-east-1:123456789012:task/cluster/task1"]
+        }
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/cluster/task1",
+                    "lastStatus": "RUNNING",
+                    "containers": [{"name": "bastion", "runtimeId": "r1"}],
+                }
+            ]
+        }
+        loader = ConfigLoader("dummy.json")
+        config = {
+            "connections": {
+                "A": {"jump_instance": "bastion"},
+                "B": {"jump_instance": "bastion"},
+            }
+        }
+        loader.collect_unresolved_container_names(config)
+        background = loader.resolve_in_background(
+            {"connections": {"A": config["connections"]["A"]}}
         )
+        loader.resolve_connection(config["connections"]["B"])
+        background.join(timeout=5)
+        assert config["connections"]["A"]["jump_instance"] == "ecs:cluster_task1_r1"
+        assert config["connections"]["B"]["jump_instance"] == "ecs:cluster_task1_r1"
+        assert mock_ecs_client.list_clusters.call_count == 1
+
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
+    def test_prune_unused_contexts(self, mock_aws_sessions, mock_ecs_resolver):
+        loader = ConfigLoader("dummy.json")
+        loader.get_ecs_id_resolver("old", "eu-west-1")
+        loader.get_ecs_id_resolver("kept", "eu-west-1")
+        config = {
+            "connections": {
+                "Conn1": {"profile": "kept", "region": "eu-west-1"},
+            }
+        }
+        loader.prune_unused_contexts(config)
+        assert list(loader.ecs_id_resolvers) == [("kept", "eu-west-1")]
+        mock_aws_sessions.return_value.prune.assert_called_once_with({"kept"})
 
-    @patch("src.config_loader.ECSIDResolver")
-    @patch("src.config_loader.AWSSessions")
+    @patch("ssmports.config_loader.ECSIDResolver")
+    @patch("ssmports.config_loader.AWSSessions")
     def test_add_app_config_defaults(self, mock_aws_sessions, mock_ecs_resolver):
         mock_aws_sessions.return_value = MagicMock()
         mock_ecs_resolver.return_value = MagicMock()
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+from ssmports.config_watcher import ConfigWatcher
+
+
+class TestConfigWatcher:
+    @pytest.fixture
+    def config_path(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "sessions.json")
+            with open(path, "w") as f:
+                f.write('{"connections": {}}')
+            yield path
+
+    @staticmethod
+    def rewrite(path, content):
+        with open(path, "w") as f:
+            f.write(content)
+        # Make sure the mtime moves even on filesystems with a coarse resolution
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    @pytest.mark.parametrize(
+        "use_inotify",
+        [
+            False,
+            pytest.param(
+                True,
+                marks=pytest.mark.skipif(
+                    not sys.platform.startswith("linux"), reason="inotify is Linux only"
+                ),
+            ),
+        ],
+    )
+    def test_change_is_reported_once(self, config_path, use_inotify):
+        changed = threading.Event()
+        calls = []
+
+        def on_change():
+            calls.append(1)
+            changed.set()
+
+        watcher = ConfigWatcher(
+            config_path,
+            on_change,
+            debounce=0.05,
+            poll_interval=0.05,
+            use_inotify=use_inotify,
+        )
+        watcher.start()
+        assert watcher.ready.wait(timeout=5)
+        try:
+            self.rewrite(config_path, '{"connections": {"a": {}}}')
+            self.rewrite(config_path, '{"connections": {"b": {}}}')
+            assert changed.wait(timeout=5)
+        finally:
+            watcher.stop()
+        assert len(calls) == 1
+
+    def test_unchanged_content_is_skipped(self, config_path):
+        calls = []
+        watcher = ConfigWatcher(config_path, lambda: calls.append(1))
+        self.rewrite(config_path, '{"connections": {}}')
+        watcher._changed()
+        assert calls == []
+
+        self.rewrite(config_path, '{"connections": {"a": {}}}')
+        watcher._changed()
+        assert calls == [1]
@@ -0,0 +1,232 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ssmports import tracing
+from ssmports.controller import TunnelController
+from ssmports.daemon import RemoteForwarder
+from ssmports.exceptions import SSMPortForwardError
+
+CONNECTIONS = {
+    "DB": {
+        "target_host": "db",
+        "local_port": 5432,
+        "remote_port": 5432,
+        "group": "data",
+        "autostart": True,
+    },
+    "Cache": {
+        "target_host": "cache",
+        "local_port": 6379,
+        "remote_port": 6379,
+        "group": "data",
+    },
+    "Web": {"target_host": "web", "local_port": 8080, "remote_port": 80},
+    "Web copy": {"target_host": "web2", "local_port": 8080, "remote_port": 80},
+}
+
+
+class TestTunnelController:
+    @pytest.fixture
+    def controller(self):
+        loader = MagicMock()
+        loader.load_config.return_value = (
+            {"connections": {k: dict(v) for k, v in CONNECTIONS.items()}},
+            MagicMock(),
+        )
+        with patch("ssmports.controller.SSMPortForwarder") as mock_forwarder:
+            forwarder = mock_forwarder.return_value
+            forwarder.start_session.side_effect = lambda label, **kwargs: f"sid-{label}"
+            forwarder.stats = {}
+            forwarder.active_sessions = {}
+            controller = TunnelController(config_loader=loader)
+            controller.load()
+            yield controller
+
+    def test_select(self, controller):
+        assert controller.select(["Web"], ["data"]) == ["DB", "Cache", "Web"]
+        assert controller.autostart_labels() == ["DB"]
+        with pytest.raises(SSMPortForwardError, match="Unknown connections: Nope"):
+            controller.select(["Nope"])
+
+    def test_start_and_stop(self, controller):
+        states = []
+        controller.add_listener(lambda label, state: states.append((label, state)))
+        controller.forwarder.start_session.side_effect = lambda label, **kwargs: (
+            controller._on_session_state(label, "running") or f"sid-{label}"
+        )
+        assert controller.start("Web") == "sid-Web"
+        assert controller.start("Web") == "sid-Web"
+        assert controller.forwarder.start_session.call_count == 1
+        # The forwarder reports running before the session is recorded, the controller after
+        assert states == [("Web", "starting"), ("Web", "running")]
+        status = controller.status()["Web"]
+        assert status["session_id"] == "sid-Web"
+        assert status["uptime"] >= 0
+        span = next(
+            span
+            for span in reversed(tracing.TRACER.finished_spans())
+            if span.name == "connection.start"
+        )
+        assert span.attributes["label"] == "Web"
+        assert span.attributes["session_id"] == "sid-Web"
+
+        assert controller.stop("Web")
+        controller.forwarder.stop_session.assert_called_once_with("sid-Web", wait=True)
+        assert not controller.stop("Web")
+        assert controller.status()["Web"]["state"] == "stopped"
+
+    def test_port_conflict(self, controller):
+        controller.start("Web")
+        with pytest.raises(
+            SSMPortForwardError, match="already in use by connection 'Web'"
+        ):
+            controller.start("Web copy")
+
+    def test_failed_start(self, controller):
+        controller.forwarder.start_session.side_effect = Exception("boom")
+        with pytest.raises(Exception, match="boom"):
+            controller.start("Web")
+        status = controller.status()["Web"]
+        assert status["state"] == "failed"
+        assert status["error"] == "boom"
+
+    def test_stopped_target_is_resolved_again(self, controller):
+        controller.forwarder.start_session.side_effect = Exception(
+            "An error occurred (TargetNotConnected) when calling the StartSession operation"
+        )
+        with pytest.raises(Exception, match="TargetNotConnected"):
+            controller.start("Web")
+        controller.config_loader.forget_instance_id.assert_called_once_with(
+            controller.connections["Web"]
+        )
+
+    def test_start_many(self, controller):
+        states = []
+        controller.add_listener(lambda label, state: states.append((label, state)))
+        result = controller.start_many(controller.select(groups=["data"]))
+        assert result == {"DB": "sid-DB", "Cache": "sid-Cache"}
+        assert ("DB", "queued") in states and ("Cache", "queued") in states
+
+    def test_forwarder_stop_clears_session(self, controller):
+        controller.start("Web")
+        controller._on_session_state("Web", "failed")
+        assert "Web" not in controller.active_session_ids
+
+    def test_reload(self, controller):
+        controller.start("DB")
+        controller.start("Web")
+        connections = {k: dict(v) for k, v in CONNECTIONS.items()}
+        del connections["Web"]
+        connections["DB"]["remote_port"] = 5433
+        connections["Cache"]["link"] = "http://localhost:{local_port}"
+        controller.config_loader.load_config.return_value = (
+            {"connections": connections},
+            controller.aws_sessions,
+        )
+        with patch.object(controller, "start_many") as start_many:
+            diff = controller.reload()
+        assert diff.removed == ["Web"]
+        assert diff.changed == {"DB": ["remote_port"]}
+        controller.forwarder.stop_session.assert_any_call("sid-Web", wait=False)
+        controller.forwarder.stop_session.assert_any_call("sid-DB", wait=True)
+        start_many.assert_called_once_with(["DB"], wait=False)
+
+    def test_credential_monitor(self, controller):
+        assert controller.credential_monitor is None
+        controller.start("DB")
+        controller.start("Cache")
+        controller.connections["Cache"]["profile"] = "dev"
+        with patch.object(controller, "start_many") as start_many:
+            controller._on_credentials_refreshed("dev")
+        controller.forwarder.stop_session.assert_called_once_with(
+            "sid-Cache", wait=True
+        )
+        start_many.assert_called_once_with(["Cache"], wait=False)
+
+    def test_credential_listener(self, controller):
+        events = []
+        controller.add_credential_listener(
+            lambda profile, state, expiry: events.append((profile, state))
+        )
+        controller._on_credentials_expiring("dev", datetime.now(timezone.utc))
+        controller._on_credentials_expired("dev")
+        controller._on_credentials_refreshed("dev")
+        assert events == [
+            ("dev", "expiring"),
+            ("dev", "expired"),
+            ("dev", "refreshed"),
+        ]
+
+    @patch("ssmports.controller.CredentialMonitor")
+    def test_credential_monitor_is_started(self, mock_monitor):
+        loader = MagicMock()
+        loader.load_config.return_value = (
+            {"connections": {}, "app_config": {"credential_warning": 600}},
+            MagicMock(),
+        )
+        with patch("ssmports.controller.SSMPortForwarder"):
+            controller = TunnelController(config_loader=loader)
+            controller.load()
+        assert mock_monitor.call_args.kwargs["warn_before"] == 600
+        mock_monitor.return_value.start.assert_called_once()
+        controller.close()
+        mock_monitor.return_value.stop.assert_called_once()
+
+
+class TestRemoteTunnelController:
+    @pytest.fixture
+    def controller(self):
+        loader = MagicMock()
+        forwarder = MagicMock(spec=RemoteForwarder)
+        forwarder.connections.return_value = {
+            k: dict(v) for k, v in CONNECTIONS.items()
+        }
+        forwarder.running_sessions.return_value = {"DB": "sid-DB"}
+        forwarder.start_session.side_effect = lambda ssm_client, label, **kwargs: (
+            f"sid-{label}"
+        )
+        controller = TunnelController(config_loader=loader, forwarder=forwarder)
+        controller.load()
+        return controller
+
+    def test_load(self, controller):
+        controller.config_loader.load_config.assert_not_called()
+        controller.config_loader.read_config.assert_not_called()
+        assert list(controller.connections) == list(CONNECTIONS)
+        assert controller.credential_monitor is None
+        assert controller.active_session_ids == {"DB": "sid-DB"}
+        assert controller.status()["DB"]["state"] == "running"
+
+    def test_start(self, controller):
+        assert controller.start("Web") == "sid-Web"
+        controller.config_loader.resolve_connection.assert_not_called()
+        assert controller.forwarder.start_session.call_args.kwargs["ssm_client"] is None
+
+    def test_started_elsewhere(self, controller):
+        controller.forwarder.running_sessions.return_value = {
+            "DB": "sid-DB",
+            "Cache": "sid-Cache",
+        }
+        controller._on_session_state("Cache", "running")
+        assert controller.active_session_ids["Cache"] == "sid-Cache"
+        controller._on_session_state("Cache", "stopped")
+        assert "Cache" not in controller.active_session_ids
+
+    def test_reload(self, controller):
+        controller.forwarder.connections.return_value = {
+            "DB": dict(CONNECTIONS["DB"]),
+            "Other": {"local_port": 8080},
+        }
+        controller.forwarder.running_sessions.return_value = {"Other": "sid-Other"}
+        diff = controller.reload()
+        controller.forwarder.reload.assert_called_once()
+        controller.forwarder.stop_session.assert_not_called()
+        assert set(diff.removed) == {"Cache", "Web", "Web copy"}
+        assert controller.active_session_ids == {"Other": "sid-Other"}
+        assert controller.port_in_use_by("DB") is None
+
+    def test_unknown_running_labels(self, controller):
+        controller.active_session_ids["Gone"] = "sid-Gone"
+        assert controller.port_in_use_by("Web") is None
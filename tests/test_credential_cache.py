@@ -0,0 +1,77 @@
+import os
+import stat
+import tempfile
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+
+from ssmports.aws_sessions import AWSSessions
+from ssmports.credential_cache import CredentialCache
+
+IDENTITY = {
+    "UserId": "AROA:me",
+    "Account": "123456789012",
+    "Arn": "arn:aws:sts::123456789012:assumed-role/dev/me",
+    "ResponseMetadata": {"HTTPStatusCode": 200},
+}
+
+
+class TestCredentialCache:
+    @pytest.fixture
+    def cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield CredentialCache(os.path.join(temp_dir, "credential_cache"))
+
+    @pytest.fixture
+    def credentials(self):
+        return MagicMock(access_key="ASIAEXAMPLE")
+
+    def test_permissions(self, cache, credentials):
+        cache.put_identity("dev", credentials, IDENTITY)
+        assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o700
+        for name in os.listdir(cache.path):
+            mode = os.stat(os.path.join(cache.path, name)).st_mode
+            assert stat.S_IMODE(mode) == 0o600
+
+    def test_identity_until_expiry(self, cache, credentials):
+        expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+        cache.put_identity("dev", credentials, IDENTITY, expiry)
+        assert cache.get_identity("dev", credentials) == {
+            "UserId": "AROA:me",
+            "Account": "123456789012",
+            "Arn": "arn:aws:sts::123456789012:assumed-role/dev/me",
+        }
+        # Other profiles and other access keys do not match
+        assert cache.get_identity("prod", credentials) is None
+        assert cache.get_identity("dev", MagicMock(access_key="ASIAOTHER")) is None
+
+    def test_expired_identity(self, cache, credentials):
+        expiry = datetime.now(timezone.utc) - timedelta(seconds=1)
+        cache.put_identity("dev", credentials, IDENTITY, expiry)
+        assert cache.get_identity("dev", credentials) is None
+
+    def test_attach(self, cache):
+        session = boto3.Session(region_name="eu-west-1")
+        cache.attach(session)
+        resolver = session._session.get_component("credential_provider")
+        assert resolver.get_provider("assume-role").cache is cache.cache
+
+    def test_validate_uses_cached_identity(self, cache):
+        factory = MagicMock()
+        sts = factory.create_client.return_value
+        sts.get_caller_identity.return_value = IDENTITY
+        session = MagicMock()
+        session.get_credentials.return_value = MagicMock(
+            access_key="ASIAEXAMPLE",
+            _expiry_time=datetime.now(timezone.utc) + timedelta(hours=1),
+        )
+
+        for _ in range(2):
+            # A fresh AWSSessions, like after a restart
+            aws_sessions = AWSSessions(client_factory=factory)
+            aws_sessions.credential_cache = cache
+            aws_sessions.validate(session, "dev")
+            assert aws_sessions.accounts == {"dev": "123456789012"}
+        sts.get_caller_identity.assert_called_once()
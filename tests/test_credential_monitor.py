@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.credentials import RefreshableCredentials
+
+from ssmports.aws_sessions import AWSSessions
+from ssmports.credential_monitor import CredentialMonitor
+
+NOW = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestCredentialMonitor:
+    @pytest.fixture
+    def aws_sessions(self):
+        aws_sessions = MagicMock()
+        aws_sessions.profiles.return_value = {"dev"}
+        aws_sessions.refresh_window.return_value = None
+        return aws_sessions
+
+    def test_warns_once_before_expiry(self, aws_sessions):
+        aws_sessions.credential_expiry.return_value = NOW + timedelta(minutes=10)
+        aws_sessions.fresh_credential_expiry.return_value = NOW + timedelta(minutes=10)
+        on_expiring = MagicMock()
+        monitor = CredentialMonitor(
+            aws_sessions, warn_before=900, on_expiring=on_expiring
+        )
+        assert monitor.check(NOW) == {"dev": "expiring"}
+        monitor.check(NOW + timedelta(minutes=1))
+        on_expiring.assert_called_once_with("dev", NOW + timedelta(minutes=10))
+
+    def test_expired_then_refreshed(self, aws_sessions):
+        aws_sessions.credential_expiry.return_value = NOW - timedelta(minutes=1)
+        aws_sessions.fresh_credential_expiry.return_value = NOW - timedelta(minutes=1)
+        on_expired = MagicMock()
+        on_refreshed = MagicMock()
+        monitor = CredentialMonitor(
+            aws_sessions, on_expired=on_expired, on_refreshed=on_refreshed
+        )
+        assert monitor.check(NOW) == {"dev": "expired"}
+        assert monitor.check(NOW) == {"dev": "expired"}
+        on_expired.assert_called_once_with("dev")
+        aws_sessions.refresh.assert_not_called()
+
+        # The user ran saml2aws again
+        aws_sessions.fresh_credential_expiry.return_value = NOW + timedelta(hours=1)
+        assert monitor.check(NOW) == {"dev": "valid"}
+        aws_sessions.refresh.assert_called_once_with("dev")
+        on_refreshed.assert_called_once_with("dev")
+
+    def test_failed_refresh_counts_as_expired(self, aws_sessions):
+        aws_sessions.credential_expiry.side_effect = Exception("SSO token expired")
+        aws_sessions.fresh_credential_expiry.return_value = None
+        monitor = CredentialMonitor(aws_sessions)
+        assert monitor.check(NOW) == {"dev": "expired"}
+
+    def test_credentials_without_expiry(self, aws_sessions):
+        aws_sessions.credential_expiry.return_value = None
+        assert CredentialMonitor(aws_sessions).check(NOW) == {"dev": "valid"}
+
+    def test_unused_profiles_are_forgotten(self, aws_sessions):
+        aws_sessions.credential_expiry.return_value = NOW - timedelta(minutes=1)
+        monitor = CredentialMonitor(aws_sessions)
+        monitor.check(NOW)
+        aws_sessions.profiles.return_value = set()
+        assert monitor.check(NOW) == {}
+
+
+class TestRefreshableCredentials:
+    """Assume role and SSO credentials, which botocore renews 15 minutes before they expire"""
+
+    @staticmethod
+    def monitor(expires_in, refresh):
+        def refresh_using():
+            return {
+                **refresh(),
+                "access_key": "AKIA2",
+                "secret_key": "secret",
+                "token": "token",
+            }
+
+        credentials = RefreshableCredentials.create_from_metadata(
+            {
+                "access_key": "AKIA1",
+                "secret_key": "secret",
+                "token": "token",
+                "expiry_time": (datetime.now(timezone.utc) + expires_in).isoformat(),
+            },
+            refresh_using=refresh_using,
+            method="assume-role",
+        )
+        session = MagicMock()
+        session.get_credentials.return_value = credentials
+        aws_sessions = AWSSessions()
+        aws_sessions.sessions[("dev", None)] = session
+        on_expiring = MagicMock()
+        on_refreshed = MagicMock()
+        monitor = CredentialMonitor(
+            aws_sessions,
+            warn_before=3600,
+            on_expiring=on_expiring,
+            on_refreshed=on_refreshed,
+        )
+        return monitor, on_expiring, on_refreshed
+
+    @staticmethod
+    def renewed():
+        expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+        return {"expiry_time": expiry.isoformat()}
+
+    @staticmethod
+    def failing():
+        raise Exception("The SSO session has expired")
+
+    def test_no_warning_while_botocore_renews_them(self):
+        monitor, on_expiring, on_refreshed = self.monitor(
+            timedelta(minutes=30), self.renewed
+        )
+        assert monitor.check() == {"dev": "valid"}
+        on_expiring.assert_not_called()
+
+    def test_renewed_without_restart(self):
+        monitor, on_expiring, on_refreshed = self.monitor(
+            timedelta(minutes=5), self.renewed
+        )
+        assert monitor.check() == {"dev": "valid"}
+        assert monitor.expiry["dev"] > datetime.now(timezone.utc) + timedelta(
+            minutes=55
+        )
+        on_expiring.assert_not_called()
+        on_refreshed.assert_not_called()
+
+    def test_warns_when_renewing_failed(self):
+        # Within botocore's advisory window a failed refresh keeps the old credentials
+        monitor, on_expiring, on_refreshed = self.monitor(
+            timedelta(minutes=12), self.failing
+        )
+        assert monitor.check() == {"dev": "expiring"}
+        on_expiring.assert_called_once()
+
+    def test_expired_when_renewing_failed(self):
+        monitor, on_expiring, on_refreshed = self.monitor(
+            timedelta(minutes=5), self.failing
+        )
+        assert monitor.check() == {"dev": "expired"}
+
+
+class TestGetExpiry:
+    def test_refreshable_credentials(self):
+        session = MagicMock()
+        session.get_credentials.return_value._expiry_time = NOW
+        assert AWSSessions.get_expiry(session) == NOW
+        session.get_credentials.return_value.get_frozen_credentials.assert_called_once()
+
+    def test_saml2aws_expiry(self):
+        session = MagicMock()
+        session.get_credentials.return_value = MagicMock(
+            spec=["access_key", "secret_key", "token"]
+        )
+        session._session.get_scoped_config.return_value = {
+            "x_security_token_expires": "2024-06-01T12:00:00Z"
+        }
+        assert AWSSessions.get_expiry(session) == NOW
+
+    def test_static_credentials(self):
+        session = MagicMock()
+        session.get_credentials.return_value = MagicMock(
+            spec=["access_key", "secret_key", "token"]
+        )
+        session._session.get_scoped_config.return_value = {}
+        assert AWSSessions.get_expiry(session) is None
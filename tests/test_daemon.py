@@ -0,0 +1,152 @@
+import importlib
+import os
+import queue
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ssmports.daemon import ControlServer, DaemonClient, RemoteForwarder
+from ssmports.exceptions import SSMPortForwardError
+
+
+class TestControlServer:
+    @pytest.fixture
+    def controller(self):
+        controller = MagicMock()
+        controller.connections = {"DB": {"local_port": 5432}, "Web": {"local_port": 80}}
+        controller.active_session_ids = {}
+        controller.listeners = []
+        controller.add_listener.side_effect = controller.listeners.append
+
+        def start_many(labels):
+            for label in labels:
+                controller.active_session_ids[label] = f"sid-{label}"
+                for listener in controller.listeners:
+                    listener(label, "running")
+
+        controller.start_many.side_effect = start_many
+        controller.select.side_effect = lambda labels, groups: [
+            label for label in controller.connections if label in labels
+        ]
+        controller.stop.side_effect = (
+            lambda label: controller.active_session_ids.pop(label, None) is not None
+        )
+        controller.status.side_effect = lambda: {
+            label: {
+                "session_id": controller.active_session_ids.get(label),
+                "error": None,
+            }
+            for label in controller.connections
+        }
+        return controller
+
+    @pytest.fixture
+    def socket_path(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield os.path.join(temp_dir, "ssmports.sock")
+
+    @pytest.fixture
+    def server(self, controller, socket_path):
+        server = ControlServer(controller, socket_path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+        thread.join(timeout=5)
+
+    def test_socket_is_private(self, server):
+        assert stat.S_IMODE(os.stat(server.path).st_mode) == 0o600
+
+    def test_start_status_stop(self, server):
+        client = DaemonClient(server.path)
+        assert client.call("list") == {
+            "DB": {"local_port": 5432},
+            "Web": {"local_port": 80},
+        }
+        assert client.call("start", labels=["DB"]) == {
+            "DB": {"session_id": "sid-DB", "error": None}
+        }
+        assert client.call("status")["DB"]["session_id"] == "sid-DB"
+        assert client.call("stop") == ["DB"]
+        client.close()
+
+    def test_errors(self, server):
+        client = DaemonClient(server.path)
+        with pytest.raises(SSMPortForwardError, match="Unknown method: nope"):
+            client.call("nope")
+        # The connection stays usable after an error
+        assert "DB" in client.call("list")
+
+    def test_subscribe(self, server):
+        events = queue.Queue()
+        client = DaemonClient(server.path)
+        client.subscribe(lambda label, state: events.put((label, state)))
+        # Wait until the daemon has registered the subscription
+        while not server.subscribers:
+            threading.Event().wait(0.01)
+        client.call("start", labels=["Web"])
+        assert events.get(timeout=5) == ("Web", "running")
+
+    def test_single_instance(self, server, controller):
+        with pytest.raises(SSMPortForwardError, match="already listening"):
+            ControlServer(controller, server.path)
+
+    def test_stale_socket_is_replaced(self, controller, socket_path):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        server = ControlServer(controller, socket_path)
+        server.server_close()
+        assert not os.path.exists(socket_path)
+
+    def test_reload(self, server, controller):
+        controller.reload.return_value = MagicMock(
+            added=["Cache"], removed=[], changed={"DB": ["remote_port"]}
+        )
+        forwarder = RemoteForwarder(DaemonClient(server.path))
+        assert forwarder.reload() == {
+            "added": ["Cache"],
+            "removed": [],
+            "changed": ["DB"],
+        }
+        forwarder.close()
+
+    def test_remote_forwarder(self, server, controller):
+        forwarder = RemoteForwarder(DaemonClient(server.path))
+        assert forwarder.connections() == controller.connections
+        assert forwarder.start_session(None, "DB", local_port=5432) == "sid-DB"
+        assert forwarder.running_sessions() == {"DB": "sid-DB"}
+        assert forwarder.stop_session("sid-DB")
+        assert not forwarder.stop_session("sid-unknown")
+        forwarder.close()
+
+
+class TestWithoutUnixSockets:
+    def test_frontends_import_on_windows(self, monkeypatch):
+        import ssmports
+        import ssmports.cli
+
+        # Importing again rebinds the submodules on the package, put the originals back afterwards
+        monkeypatch.setattr(ssmports, "daemon", ssmports.daemon)
+        monkeypatch.setattr(ssmports, "cli", ssmports.cli)
+        monkeypatch.delattr(socket, "AF_UNIX")
+        monkeypatch.delattr(socketserver, "UnixStreamServer")
+        with patch.dict(sys.modules):
+            for name in ("ssmports.daemon", "ssmports.cli", "gui"):
+                sys.modules.pop(name, None)
+            daemon = importlib.import_module("ssmports.daemon")
+            cli = importlib.import_module("ssmports.cli")
+            importlib.import_module("gui")
+            assert not daemon.UNIX_SOCKETS
+            assert not hasattr(daemon, "ControlServer")
+            assert not daemon.DaemonClient.available()
+            with pytest.raises(SSMPortForwardError, match="Unix domain sockets"):
+                daemon.DaemonClient().call("status")
+            assert cli.main(["daemon"]) == 1
@@ -1,7 +1,7 @@
 import pytest
 from unittest.mock import MagicMock
 
-from src.ecs_id_resolver import ECSIDResolver
+from ssmports.ecs_id_resolver import ECSIDResolver
 
 
 class TestECSIDResolver:
@@ -19,12 +19,13 @@ class TestECSIDResolver:
         mock_task_desc = {
             "tasks": [
                 {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my-cluster/12345678901234567890123456789012",
                     "containers": [
                         {
                             "name": "my-container",
                             "runtimeId": "12345678901234567890123456789012",
                         }
-                    ]
+                    ],
                 }
             ]
         }
@@ -49,12 +50,13 @@ class TestECSIDResolver:
         mock_task_desc = {
             "tasks": [
                 {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my-cluster/12345678901234567890123456789012",
                     "containers": [
                         {
                             "name": "my-container",
                             "runtimeId": "12345678901234567890123456789012",
                         }
-                    ]
+                    ],
                 }
             ]
         }
@@ -82,12 +84,13 @@ class TestECSIDResolver:
         mock_task_desc = {
             "tasks": [
                 {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my-cluster/12345678901234567890123456789012",
                     "containers": [
                         {
                             "name": "other-container",
                             "runtimeId": "12345678901234567890123456789012",
                         }
-                    ]
+                    ],
                 }
             ]
         }
@@ -111,12 +114,20 @@ class TestECSIDResolver:
         ]
         mock_task_desc1 = {
             "tasks": [
-                {"containers": [{"name": "other-container", "runtimeId": "runtime1"}]}
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/cluster1/task1",
+                    "containers": [
+                        {"name": "other-container", "runtimeId": "runtime1"}
+                    ],
+                }
             ]
         }
         mock_task_desc2 = {
             "tasks": [
-                {"containers": [{"name": "my-container", "runtimeId": "runtime2"}]}
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/cluster2/task2",
+                    "containers": [{"name": "my-container", "runtimeId": "runtime2"}],
+                }
             ]
         }
         mock_ecs_client.describe_tasks.side_effect = [mock_task_desc1, mock_task_desc2]
@@ -124,3 +135,141 @@ class TestECSIDResolver:
         result = resolver.resolve_task_name("my-container", mock_ecs_client)
         expected = "ecs:cluster2_task2_runtime2"
         assert result == expected
+
+    def test_resolve_task_name_follows_pagination(self):
+        resolver = ECSIDResolver()
+        mock_ecs_client = MagicMock()
+        mock_ecs_client.list_clusters.side_effect = [
+            {
+                "clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/cluster1"],
+                "nextToken": "clusters-page-2",
+            },
+            {"clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/cluster2"]},
+        ]
+        mock_ecs_client.list_tasks.side_effect = [
+            {"taskArns": []},
+            {
+                "taskArns": ["arn:aws:ecs:us-east-1:123456789012:task/cluster2/task1"],
+                "nextToken": "tasks-page-2",
+            },
+            {"taskArns": ["arn:aws:ecs:us-east-1:123456789012:task/cluster2/task2"]},
+        ]
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/cluster2/task2",
+                    "containers": [{"name": "my-container", "runtimeId": "runtime2"}],
+                }
+            ]
+        }
+
+        result = resolver.resolve_task_name("my-container", mock_ecs_client)
+        assert result == "ecs:cluster2_task2_runtime2"
+        mock_ecs_client.list_clusters.assert_called_with(nextToken="clusters-page-2")
+        mock_ecs_client.list_tasks.assert_called_with(
+            cluster="arn:aws:ecs:us-east-1:123456789012:cluster/cluster2",
+            nextToken="tasks-page-2",
+        )
+        mock_ecs_client.describe_tasks.assert_called_once_with(
+            cluster="arn:aws:ecs:us-east-1:123456789012:cluster/cluster2",
+            tasks=[
+                "arn:aws:ecs:us-east-1:123456789012:task/cluster2/task1",
+                "arn:aws:ecs:us-east-1:123456789012:task/cluster2/task2",
+            ],
+        )
+
+    def test_resolve_task_name_batches_describe_tasks(self):
+        resolver = ECSIDResolver()
+        mock_ecs_client = MagicMock()
+        mock_ecs_client.list_clusters.return_value = {
+            "clusterArns": ["arn:aws:ecs:us-east-1:123456789012:cluster/my-cluster"]
+        }
+        task_arns = [
+            f"arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task{i}"
+            for i in range(250)
+        ]
+        mock_ecs_client.list_tasks.return_value = {"taskArns": task_arns}
+
+        def describe_tasks(cluster, tasks):
+            return {
+                "tasks": [
+                    {
+                        "taskArn": arn,
+                        "containers": [{"name": "other-container", "runtimeId": "r"}],
+                    }
+                    for arn in tasks
+                ]
+            }
+
+        mock_ecs_client.describe_tasks.side_effect = describe_tasks
+
+        with pytest.raises(ValueError):
+            resolver.resolve_task_name("my-container", mock_ecs_client)
+
+        batch_sizes = [
+            len(call.kwargs["tasks"])
+            for call in mock_ecs_client.describe_tasks.call_args_list
+        ]
+        assert batch_sizes == [100, 100, 50]
+        assert resolver.api_calls == {
+            "list_clusters": 1,
+            "list_tasks": 1,
+            "describe_tasks": 3,
+        }
+
+    def test_validate_instance_ids(self):
+        resolver = ECSIDResolver()
+        mock_ecs_client = MagicMock()
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task1",
+                    "lastStatus": "RUNNING",
+                    "containers": [{"name": "container1", "runtimeId": "runtime1"}],
+                },
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my-cluster/task2",
+                    "lastStatus": "STOPPED",
+                    "containers": [{"name": "container2", "runtimeId": "runtime2"}],
+                },
+            ]
+        }
+
+        valid = resolver.validate_instance_ids(
+            {
+                "container1": "ecs:my-cluster_task1_runtime1",
+                "container2": "ecs:my-cluster_task2_runtime2",
+            },
+            mock_ecs_client,
+        )
+
+        assert valid == {"container1": "ecs:my-cluster_task1_runtime1"}
+        assert resolver.found_ids == valid
+        mock_ecs_client.describe_tasks.assert_called_once_with(
+            cluster="my-cluster", tasks=["task1", "task2"]
+        )
+        mock_ecs_client.list_clusters.assert_not_called()
+
+    def test_validate_instance_ids_with_underscores_in_cluster_name(self):
+        resolver = ECSIDResolver()
+        mock_ecs_client = MagicMock()
+        mock_ecs_client.describe_tasks.return_value = {
+            "tasks": [
+                {
+                    "taskArn": "arn:aws:ecs:us-east-1:123456789012:task/my_cluster/task1",
+                    "lastStatus": "RUNNING",
+                    "containers": [
+                        {"name": "container1", "runtimeId": "task1-3456789012"}
+                    ],
+                },
+            ]
+        }
+
+        valid = resolver.validate_instance_ids(
+            {"container1": "ecs:my_cluster_task1_task1-3456789012"}, mock_ecs_client
+        )
+
+        assert valid == {"container1": "ecs:my_cluster_task1_task1-3456789012"}
+        mock_ecs_client.describe_tasks.assert_called_once_with(
+            cluster="my_cluster", tasks=["task1"]
+        )
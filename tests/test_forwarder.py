@@ -1,17 +1,19 @@
 import pytest
 import threading
+import time
 from unittest.mock import MagicMock, patch
 
-from src.forwarder import SSMPortForwarder
-from src.exceptions import SSMPortForwardError
+from ssmports.forwarder import SSMPortForwarder
+from ssmports.exceptions import SSMPortForwardError
 
 
 class TestSSMPortForwarder:
-    @patch("src.forwarder.SSMSession")
+    @patch("ssmports.forwarder.SSMSession")
     def test_start_session_success(self, mock_ssm_session):
         forwarder = SSMPortForwarder()
         mock_session = MagicMock()
         mock_session.session = {"SessionId": "test-session-id"}
+        mock_session.proc.poll.return_value = None
         mock_ssm_session.return_value.__enter__.return_value = mock_session
         mock_ssm_session.return_value.__exit__.return_value = None
 
@@ -27,7 +29,7 @@ class TestSSMPortForwarder:
         assert session_id == "test-session-id"
         assert "test-session-id" in forwarder.active_sessions
 
-    @patch("src.forwarder.SSMSession")
+    @patch("ssmports.forwarder.SSMSession")
     def test_start_session_error(self, mock_ssm_session):
         forwarder = SSMPortForwarder()
         mock_ssm_session.return_value.__enter__.side_effect = Exception("Test error")
@@ -42,8 +44,8 @@ class TestSSMPortForwarder:
                 remote_port=80,
             )
 
-    # @patch("src.forwarder.SSMSession")
-    # @patch("src.forwarder.threading.Event")
+    # @patch("ssmports.forwarder.SSMSession")
+    # @patch("ssmports.forwarder.threading.Event")
     # def test_start_session_timeout(self, mock_event_class, mock_ssm_session):
     #     forwarder = SSMPortForwarder()
     #     # Mock SSMSession to not set session_id_ready
@@ -67,6 +69,172 @@ class TestSSMPortForwarder:
     #             remote_port=80,
     #         )
 
+    @patch("ssmports.forwarder.SSMSession")
+    def test_start_timeout_stops_a_late_session(self, mock_ssm_session):
+        forwarder = SSMPortForwarder()
+        states = []
+        forwarder.add_listener(lambda label, state: states.append(state))
+        release = threading.Event()
+        mock_session = MagicMock()
+        mock_session.session = {"SessionId": "late-session-id"}
+        mock_ssm_session.return_value.__enter__.side_effect = lambda: (
+            release.wait(5) and mock_session
+        )
+        mock_ssm_session.return_value.__exit__.return_value = None
+
+        with patch.object(SSMPortForwarder, "START_TIMEOUT", 0.1):
+            with pytest.raises(SSMPortForwardError, match="within timeout"):
+                forwarder.start_session(
+                    ssm_client=MagicMock(),
+                    label="test",
+                    jump_instance="i-123",
+                    target_host="example.com",
+                    local_port=8080,
+                    remote_port=80,
+                )
+        release.set()
+        deadline = time.monotonic() + 5
+        while (
+            not mock_ssm_session.return_value.__exit__.called
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+        mock_ssm_session.return_value.__exit__.assert_called_once()
+        assert forwarder.active_sessions == {}
+        assert states == []
+
+    @patch("ssmports.forwarder.SSMSession")
+    def test_reconnect_after_plugin_exit(self, mock_ssm_session):
+        forwarder = SSMPortForwarder(watch_interval=0.01, reconnect_base_delay=0.01)
+        states = []
+        reconnected = threading.Event()
+
+        def listener(label, state):
+            states.append(state)
+            if state == "running" and len(states) > 1:
+                reconnected.set()
+
+        forwarder.add_listener(listener)
+        first = MagicMock()
+        first.session = {"SessionId": "first-id"}
+        first.proc.poll.return_value = 1  # The plugin dies right away
+        first.recent_output.return_value = ["connection lost"]
+        first.resume.side_effect = Exception("Session can not be resumed")
+        second = MagicMock()
+        second.session = {"SessionId": "second-id"}
+        second.proc.poll.return_value = None
+        mock_ssm_session.return_value.__enter__.side_effect = [first, second]
+
+        session_id = forwarder.start_session(
+            ssm_client=MagicMock(),
+            label="test",
+            jump_instance="i-123",
+            target_host="example.com",
+            local_port=8080,
+            remote_port=80,
+        )
+        assert reconnected.wait(timeout=5)
+
+        assert session_id == "first-id"
+        assert forwarder.active_sessions["first-id"]["session_id"] == "second-id"
+        assert states == ["running", "reconnecting", "running"]
+        assert forwarder.stats["test"]["reconnects"] == 1
+        assert forwarder.stats["test"]["downtime"] > 0
+
+        forwarder.stop_session(session_id, wait=True)
+        assert forwarder.stats["test"]["state"] == "stopped"
+        assert "first-id" not in forwarder.active_sessions
+
+    @patch("ssmports.forwarder.SSMSession")
+    def test_resume_after_plugin_exit(self, mock_ssm_session):
+        forwarder = SSMPortForwarder(watch_interval=0.01, reconnect_base_delay=0.01)
+        resumed = threading.Event()
+        mock_session = MagicMock()
+        mock_session.session = {"SessionId": "test-session-id"}
+        mock_session.proc.poll.return_value = 1
+        mock_session.recent_output.return_value = []
+
+        def resume():
+            mock_session.proc.poll.return_value = None
+            resumed.set()
+
+        mock_session.resume.side_effect = resume
+        mock_ssm_session.return_value.__enter__.return_value = mock_session
+
+        session_id = forwarder.start_session(
+            ssm_client=MagicMock(),
+            label="test",
+            jump_instance="i-123",
+            target_host="example.com",
+            local_port=8080,
+            remote_port=80,
+        )
+        assert resumed.wait(timeout=5)
+        forwarder.stop_session(session_id, wait=True)
+
+        assert mock_ssm_session.return_value.__enter__.call_count == 1
+        assert forwarder.stats["test"]["resumes"] == 1
+        assert forwarder.stats["test"]["reconnects"] == 1
+
+    @patch("ssmports.forwarder.SSMSession")
+    def test_resumes_back_off(self, mock_ssm_session):
+        forwarder = SSMPortForwarder(watch_interval=0.01)
+        resumed = threading.Event()
+        mock_session = MagicMock()
+        mock_session.session = {"SessionId": "test-session-id"}
+        mock_session.proc.poll.return_value = 1  # Every resumed plugin dies right away
+        mock_session.recent_output.return_value = []
+        mock_session.resume.side_effect = lambda: (
+            mock_session.resume.call_count == 3 and resumed.set()
+        )
+        mock_ssm_session.return_value.__enter__.return_value = mock_session
+
+        with patch.object(forwarder, "_reconnect_delay", return_value=0.01) as delay:
+            session_id = forwarder.start_session(
+                ssm_client=MagicMock(),
+                label="test",
+                jump_instance="i-123",
+                target_host="example.com",
+                local_port=8080,
+                remote_port=80,
+            )
+            assert resumed.wait(timeout=5)
+            forwarder.stop_session(session_id, wait=True)
+        # The first resume is immediate, the next ones back off
+        assert [c.args for c in delay.call_args_list[:2]] == [(0,), (1,)]
+
+    def test_resume_backoff_starts_over_after_a_stable_session(self):
+        forwarder = SSMPortForwarder(reconnect_base_delay=1.0, stable_after=30)
+        now = time.monotonic()
+        with patch("ssmports.forwarder.random.uniform", return_value=1.0):
+            assert forwarder._resume_delay(0, now) == (0, 1)
+            assert forwarder._resume_delay(1, now) == (1.0, 2)
+            assert forwarder._resume_delay(2, now) == (2.0, 3)
+            assert forwarder._resume_delay(3, now - 60) == (0, 1)
+
+    @patch("ssmports.forwarder.SSMSession")
+    def test_no_reconnect_when_disabled(self, mock_ssm_session):
+        forwarder = SSMPortForwarder(watch_interval=0.01)
+        failed = threading.Event()
+        forwarder.add_listener(lambda label, state: state == "failed" and failed.set())
+        mock_session = MagicMock()
+        mock_session.session = {"SessionId": "test-session-id"}
+        mock_session.proc.poll.return_value = 1
+        mock_session.recent_output.return_value = []
+        mock_ssm_session.return_value.__enter__.return_value = mock_session
+
+        forwarder.start_session(
+            ssm_client=MagicMock(),
+            label="test",
+            jump_instance="i-123",
+            target_host="example.com",
+            local_port=8080,
+            remote_port=80,
+            reconnect=False,
+        )
+        assert failed.wait(timeout=5)
+        assert mock_ssm_session.return_value.__enter__.call_count == 1
+
     def test_stop_session_exists(self):
         forwarder = SSMPortForwarder()
         stop_event = threading.Event()
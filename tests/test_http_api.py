@@ -0,0 +1,208 @@
+import http.client
+import json
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from ssmports import metrics, tracing
+from ssmports.exceptions import SSMPortForwardError
+from ssmports.http_api import HttpApiServer
+
+
+class TestHttpApiServer:
+    @pytest.fixture
+    def controller(self):
+        controller = MagicMock()
+        controller.connections = {
+            "DB one": {"local_port": 5432, "group": "data"},
+            "Web": {"local_port": 80},
+        }
+        controller.states = {label: "stopped" for label in controller.connections}
+        controller.listeners = []
+        controller.add_listener.side_effect = controller.listeners.append
+
+        def set_state(label, state):
+            controller.states[label] = state
+            for listener in controller.listeners:
+                listener(label, state)
+
+        def select(labels=(), groups=()):
+            unknown = [label for label in labels if label not in controller.connections]
+            if unknown:
+                raise SSMPortForwardError(f"Unknown connections: {', '.join(unknown)}")
+            return [
+                label
+                for label, connection in controller.connections.items()
+                if label in labels or connection.get("group") in groups
+            ]
+
+        controller.set_state = set_state
+        controller.select.side_effect = select
+        controller.start_many.side_effect = lambda labels: [
+            set_state(label, "running") for label in labels
+        ]
+        controller.stop.side_effect = lambda label: set_state(label, "stopped")
+        controller.status.side_effect = lambda: {
+            label: {"state": state} for label, state in controller.states.items()
+        }
+        return controller
+
+    @pytest.fixture
+    def server(self, controller):
+        server = HttpApiServer(controller, port=0)
+        server.start()
+        yield server
+        server.stop()
+
+    def request(self, server, method, path, headers=None):
+        if headers is None:
+            headers = {"X-Ssmports": "1"} if method == "POST" else {}
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request(method, path, headers=headers)
+        response = connection.getresponse()
+        body = json.loads(response.read())
+        connection.close()
+        return response.status, body
+
+    def test_status(self, server):
+        assert self.request(server, "GET", "/connections") == (
+            200,
+            {"DB one": {"state": "stopped"}, "Web": {"state": "stopped"}},
+        )
+        assert self.request(server, "GET", "/connections/DB%20one") == (
+            200,
+            {"state": "stopped"},
+        )
+        assert self.request(server, "GET", "/connections/Nope")[0] == 404
+        assert self.request(server, "GET", "/nope")[0] == 404
+
+    def test_start_and_stop(self, server, controller):
+        status, body = self.request(server, "POST", "/groups/data/start")
+        assert (status, body) == (200, {"DB one": {"state": "running"}})
+        controller.start_many.assert_called_once_with(["DB one"])
+        status, body = self.request(server, "POST", "/connections/DB%20one/stop")
+        assert (status, body) == (200, {"DB one": {"state": "stopped"}})
+        assert self.request(server, "POST", "/connections/Nope/start")[0] == 400
+
+    def test_failed_start(self, server, controller):
+        controller.start_many.side_effect = None
+        assert self.request(server, "POST", "/connections/Web/start")[0] == 502
+
+    def test_wait_for_state(self, server, controller):
+        timer = threading.Timer(0.2, controller.set_state, ("Web", "running"))
+        timer.start()
+        status, body = self.request(
+            server, "GET", "/connections/Web?wait=running&timeout=5"
+        )
+        assert (status, body) == (200, {"state": "running"})
+        status, _ = self.request(
+            server, "GET", "/connections/DB%20one?wait=running&timeout=0.1"
+        )
+        assert status == 408
+
+    def test_metrics(self, server):
+        metrics.TUNNEL_UP.set(1, label="Web")
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request("GET", "/metrics")
+        response = connection.getresponse()
+        body = response.read().decode()
+        connection.close()
+        assert response.status == 200
+        assert response.getheader("Content-Type").startswith(
+            "text/plain; version=0.0.4"
+        )
+        assert "# TYPE ssmports_start_session_seconds histogram" in body
+        assert 'ssmports_tunnel_up{label="Web"} 1' in body
+
+    def test_metrics_only(self, controller):
+        server = HttpApiServer(controller, port=0, metrics_only=True)
+        server.start()
+        try:
+            connection = http.client.HTTPConnection(
+                "127.0.0.1", server.server_address[1]
+            )
+            connection.request("GET", "/metrics")
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            assert response.status == 200
+            assert self.request(server, "GET", "/connections")[0] == 404
+            assert self.request(server, "POST", "/connections/Web/start")[0] == 404
+            controller.start_many.assert_not_called()
+        finally:
+            server.stop()
+
+    def test_trace(self, server):
+        with tracing.span("connection.start", label="Web"):
+            pass
+        status, body = self.request(server, "GET", "/trace")
+        assert status == 200
+        assert any(event["name"] == "connection.start" for event in body["traceEvents"])
+
+    def test_rejects_other_hosts(self, server):
+        status, _ = self.request(
+            server, "GET", "/connections", headers={"Host": "evil.example.com"}
+        )
+        assert status == 403
+
+    def test_rejects_cross_site_posts(self, server, controller):
+        for headers in (
+            {"Origin": "https://evil.example.com", "X-Ssmports": "1"},
+            {"Content-Type": "text/plain"},
+            {},
+        ):
+            assert self.request(
+                server, "POST", "/connections/Web/start", headers=headers
+            ) == (403, {"error": "Cross-site requests are not allowed"})
+        controller.start_many.assert_not_called()
+        status, _ = self.request(
+            server,
+            "POST",
+            "/connections/Web/start",
+            headers={
+                "Origin": "http://[::1]",
+                "Content-Type": "application/json",
+            },
+        )
+        assert status == 200
+
+    def test_post_body_on_a_kept_alive_connection(self, server, controller):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request(
+            "POST",
+            "/connections/Web/start",
+            body=json.dumps({"x": 1}),
+            headers={"Content-Type": "application/json"},
+        )
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 200
+        connection.request("GET", "/connections")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read())["Web"] == {"state": "running"}
+        connection.close()
+
+    def test_events(self, server, controller):
+        connection = http.client.HTTPConnection(
+            "127.0.0.1", server.server_address[1], timeout=5
+        )
+        connection.request("GET", "/events")
+        response = connection.getresponse()
+        assert response.getheader("Content-Type") == "text/event-stream"
+
+        def read_event():
+            lines = []
+            while (line := response.fp.readline().decode().strip()) or not lines:
+                if line:
+                    lines.append(line)
+            assert lines[0] == "event: state"
+            return json.loads(lines[1].removeprefix("data: "))
+
+        # The current state comes first
+        assert [read_event()["label"] for _ in range(2)] == ["DB one", "Web"]
+        controller.set_state("Web", "reconnecting")
+        event = read_event()
+        assert (event["label"], event["state"]) == ("Web", "reconnecting")
+        connection.close()
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from ssmports.id_cache import InstanceIDCache
+
+
+class TestInstanceIDCache:
+    @pytest.fixture
+    def cache_path(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            yield os.path.join(temp_dir, "cache", "ecs_id_cache.json")
+
+    def test_put_save_and_load(self, cache_path):
+        cache = InstanceIDCache(cache_path, ttl=60)
+        cache.put("profile", "eu-west-1", "my-container", "ecs:cluster_task_runtime")
+        cache.save()
+
+        reloaded = InstanceIDCache(cache_path, ttl=60)
+        assert (
+            reloaded.get("profile", "eu-west-1", "my-container")
+            == "ecs:cluster_task_runtime"
+        )
+        assert reloaded.get("other-profile", "eu-west-1", "my-container") is None
+
+    def test_expired_entries_are_ignored(self, cache_path):
+        cache = InstanceIDCache(cache_path, ttl=60)
+        with patch("ssmports.id_cache.time.time", return_value=1000):
+            cache.put(None, None, "my-container", "ecs:cluster_task_runtime")
+        with patch("ssmports.id_cache.time.time", return_value=1061):
+            assert cache.get(None, None, "my-container") is None
+
+    def test_discard(self, cache_path):
+        cache = InstanceIDCache(cache_path, ttl=60)
+        cache.put(None, None, "my-container", "ecs:cluster_task_runtime")
+        cache.discard(None, None, "my-container")
+        assert cache.get(None, None, "my-container") is None
+
+    def test_unreadable_cache_is_ignored(self, cache_path):
+        os.makedirs(os.path.dirname(cache_path))
+        with open(cache_path, "w") as f:
+            f.write("{ invalid json")
+        cache = InstanceIDCache(cache_path, ttl=60)
+        assert cache.entries == {}
+
+    def test_save_skips_when_unchanged(self, cache_path):
+        cache = InstanceIDCache(cache_path, ttl=60)
+        cache.save()
+        assert not os.path.exists(cache_path)
+
+        cache.put(None, None, "my-container", "ecs:cluster_task_runtime")
+        cache.save()
+        with open(cache_path) as f:
+            assert "||my-container" in json.load(f)
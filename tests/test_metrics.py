@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from ssmports import metrics
+
+
+class TestRegistry:
+    @pytest.fixture
+    def registry(self):
+        return metrics.Registry()
+
+    def test_counter_and_gauge(self, registry):
+        calls = registry.counter("calls_total", "API calls", ["service"])
+        up = registry.gauge("up", "Tunnel is up")
+        calls.inc(service="ssm")
+        calls.inc(2, service="ssm")
+        calls.inc(service='e"cs')
+        up.set(1)
+        assert registry.render() == (
+            "# HELP calls_total API calls\n"
+            "# TYPE calls_total counter\n"
+            'calls_total{service="e\\"cs"} 1\n'
+            'calls_total{service="ssm"} 3\n'
+            "# HELP up Tunnel is up\n"
+            "# TYPE up gauge\n"
+            "up 1\n"
+        )
+
+    def test_histogram(self, registry):
+        latency = registry.histogram(
+            "latency_seconds", "Latency", ["label"], buckets=(0.1, 1)
+        )
+        latency.observe(0.05, label="DB")
+        latency.observe(0.5, label="DB")
+        latency.observe(5, label="DB")
+        lines = registry.render().splitlines()
+        assert lines[2:] == [
+            'latency_seconds_bucket{label="DB",le="0.1"} 1',
+            'latency_seconds_bucket{label="DB",le="1"} 2',
+            'latency_seconds_bucket{label="DB",le="+Inf"} 3',
+            'latency_seconds_sum{label="DB"} 5.55',
+            'latency_seconds_count{label="DB"} 3',
+        ]
+
+    def test_labels_must_match(self, registry):
+        calls = registry.counter("calls_total", "API calls", ["service"])
+        with pytest.raises(ValueError, match="expects labels"):
+            calls.inc(region="eu-west-1")
+
+    def test_metrics_are_registered_once(self, registry):
+        first = registry.counter("calls_total", "API calls")
+        assert registry.counter("calls_total", "API calls") is first
+
+    def test_collectors_run_before_render(self, registry):
+        processes = registry.gauge("processes", "Processes")
+        registry.add_collector(lambda: processes.set(4))
+        assert "processes 4" in registry.render()
+
+
+class TestPluginProcesses:
+    @pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs /proc")
+    def test_rss_of_tracked_plugins(self):
+        proc = subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(30)"],
+        )
+        try:
+            metrics.track_plugin(proc.pid, "DB")
+            output = metrics.REGISTRY.render()
+            assert f'ssmports_plugin_rss_bytes{{label="DB",pid="{proc.pid}"}}' in output
+            assert metrics.PLUGIN_PROCESSES.get() >= 1
+        finally:
+            metrics.untrack_plugin(proc.pid)
+            proc.kill()
+            proc.wait()
+        metrics.REGISTRY.render()
+        assert metrics.PLUGIN_RSS.get(label="DB", pid=proc.pid) is None
+
+    def test_read_rss_of_missing_process(self):
+        assert metrics.read_rss(-1) is None
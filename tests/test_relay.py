@@ -0,0 +1,147 @@
+import socket
+import socketserver
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ssmports.exceptions import SSMPortForwardError
+from ssmports.forwarder import SSMPortForwarder
+from ssmports.relay import TunnelRelay, free_port
+
+
+class _EchoHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while data := self.request.recv(65536):
+            self.request.sendall(data)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.01)
+
+
+class TestTunnelRelay:
+    @pytest.fixture
+    def echo_port(self):
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _EchoHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield server.server_address[1]
+        server.shutdown()
+        server.server_close()
+
+    @pytest.fixture
+    def relay(self):
+        relay = TunnelRelay()
+        yield relay
+        relay.close()
+
+    def test_relays_and_counts(self, relay, echo_port):
+        port = free_port()
+        relay.add("DB", port, echo_port)
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as client:
+            client.sendall(b"hello")
+            assert client.recv(5) == b"hello"
+            stats = relay.stats["DB"]
+            assert stats["active_connections"] == 1
+            client.sendall(b"world!")
+            assert client.recv(6) == b"world!"
+        wait_until(lambda: relay.stats["DB"]["active_connections"] == 0)
+        stats = relay.stats["DB"]
+        assert (stats["bytes_in"], stats["bytes_out"]) == (11, 11)
+        assert stats["connections"] == 1
+        assert stats["connect_time"] >= 0
+        assert stats["first_byte_time"] >= stats["connect_time"]
+        relay.remove("DB")
+
+    def test_many_connections(self, relay, echo_port):
+        port = free_port()
+        relay.add("DB", port, echo_port)
+        clients = [
+            socket.create_connection(("127.0.0.1", port), timeout=5) for _ in range(50)
+        ]
+        for i, client in enumerate(clients):
+            client.sendall(b"%03d" % i)
+        for i, client in enumerate(clients):
+            assert client.recv(3) == b"%03d" % i
+        assert relay.stats["DB"]["active_connections"] == 50
+        relay.remove("DB")
+        # Removing the relay closes the open connections
+        for client in clients:
+            assert client.recv(3) == b""
+            client.close()
+
+    def test_close(self, echo_port):
+        relay = TunnelRelay()
+        port = free_port()
+        relay.add("DB", port, echo_port)
+        thread = relay.thread
+        relay.close()
+        assert not thread.is_alive()
+        assert relay.loop.is_closed()
+        with pytest.raises(OSError):
+            socket.create_connection(("127.0.0.1", port), timeout=1)
+        # Tunnels that stop later find their relay already gone
+        relay.remove("DB")
+
+    def test_port_in_use(self, relay, echo_port):
+        with pytest.raises(SSMPortForwardError, match="Could not listen"):
+            relay.add("DB", echo_port, free_port())
+
+    def test_tunnel_not_reachable(self, relay):
+        port = free_port()
+        relay.add("DB", port, free_port())
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as client:
+            assert client.recv(1) == b""
+        wait_until(lambda: relay.stats["DB"]["failed_connections"] == 1)
+        relay.remove("DB")
+
+
+class TestRelayedForwarder:
+    @patch("ssmports.forwarder.SSMSession")
+    def test_plugin_gets_an_internal_port(self, mock_ssm_session):
+        mock_session = MagicMock()
+        mock_session.session = {"SessionId": "s-1"}
+        mock_session.proc.poll.return_value = None
+        mock_ssm_session.return_value.__enter__.return_value = mock_session
+        forwarder = SSMPortForwarder()
+        local_port = free_port()
+
+        forwarder.start_session(
+            MagicMock(), "DB", local_port=local_port, remote_port=5432, relay=True
+        )
+        plugin_port = int(
+            mock_ssm_session.call_args.kwargs["Parameters"]["localPortNumber"][0]
+        )
+        assert plugin_port != local_port
+        assert forwarder.relay.stats["DB"]["target_port"] == plugin_port
+        with socket.create_connection(("127.0.0.1", local_port), timeout=5):
+            pass
+
+        forwarder.stop_session("s-1", wait=True)
+        assert "DB" not in forwarder.relay.servers
+        with pytest.raises(OSError):
+            socket.create_connection(("127.0.0.1", local_port), timeout=1)
+
+    @patch("ssmports.forwarder.SSMSession")
+    def test_stop_all_closes_the_relay(self, mock_ssm_session):
+        mock_session = MagicMock()
+        mock_session.session = {"SessionId": "s-1"}
+        mock_session.proc.poll.return_value = None
+        mock_ssm_session.return_value.__enter__.return_value = mock_session
+        forwarder = SSMPortForwarder()
+        local_port = free_port()
+        forwarder.start_session(
+            MagicMock(), "DB", local_port=local_port, remote_port=5432, relay=True
+        )
+        relay = forwarder.relay
+
+        forwarder.stop_all()
+        assert forwarder.relay is None
+        assert relay.thread is None
+        with pytest.raises(OSError):
+            socket.create_connection(("127.0.0.1", local_port), timeout=1)
@@ -0,0 +1,76 @@
+import threading
+import time
+
+from ssmports.rate_limiter import TokenBucket
+from ssmports.scheduler import StartScheduler
+
+
+class TestTokenBucket:
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() == 0
+        assert bucket.try_acquire() > 0
+        assert bucket.acquire(timeout=1)
+
+    def test_acquire_timeout(self):
+        bucket = TokenBucket(rate=0.1, capacity=1)
+        assert bucket.acquire()
+        assert not bucket.acquire(timeout=0.05)
+
+
+class TestStartScheduler:
+    def test_bounded_concurrency(self):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def start(label):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+
+        scheduler = StartScheduler(start, max_concurrency=3, rate=1000)
+        for i in range(12):
+            scheduler.submit(f"conn{i}", scope=("profile", "eu-west-1"))
+        scheduler.join()
+        assert peak == 3
+
+    def test_priority_order(self):
+        started = []
+        gate = threading.Event()
+
+        def start(label):
+            # Hold the only worker until everything is queued
+            gate.wait()
+            started.append(label)
+
+        scheduler = StartScheduler(start, max_concurrency=1, rate=1000)
+        scheduler.submit("blocker", priority=(-1, ""))
+        scheduler.submit("group-b", priority=(1, "b"))
+        scheduler.submit("autostart", priority=(0, ""))
+        scheduler.submit("group-a", priority=(1, "a"))
+        gate.set()
+        scheduler.join()
+        assert started == ["blocker", "autostart", "group-a", "group-b"]
+
+    def test_cancel_and_duplicates(self):
+        started = []
+        gate = threading.Event()
+
+        def start(label):
+            gate.wait()
+            started.append(label)
+
+        scheduler = StartScheduler(start, max_concurrency=1)
+        scheduler.submit("first")
+        assert scheduler.submit("second")
+        assert not scheduler.submit("second")
+        assert scheduler.cancel("second")
+        gate.set()
+        scheduler.join()
+        assert started == ["first"]
@@ -4,19 +4,21 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from src.session import SSMSession
-from src.exceptions import SSMPortForwardError
+from ssmports import metrics
+from ssmports.session import SSMSession
+from ssmports.exceptions import SSMPortForwardError
 
 
 class TestSSMSession:
-    @patch("src.session.subprocess.Popen")
-    @patch("src.session.socket.socket")
+    @patch("ssmports.session.subprocess.Popen")
+    @patch("ssmports.session.socket.socket")
     def test_enter_success_no_check(self, mock_socket, mock_popen):
         mock_ssm = MagicMock()
         mock_ssm.start_session.return_value = {"SessionId": "test-id"}
         mock_ssm.meta.region_name = "us-east-1"
         mock_ssm.meta.endpoint_url = "https://ssm.us-east-1.amazonaws.com"
         mock_proc = MagicMock()
+        mock_proc.stdout.readline.return_value = b""
         mock_popen.return_value = mock_proc
 
         session = SSMSession(
@@ -37,7 +39,7 @@ class TestSSMSession:
         mock_proc.terminate.assert_called_once()
         mock_ssm.terminate_session.assert_called_once_with(SessionId="test-id")
 
-    @patch("src.session.subprocess.Popen")
+    @patch("ssmports.session.subprocess.Popen")
     def test_enter_plugin_not_found(self, mock_popen):
         mock_ssm = MagicMock()
         mock_ssm.start_session.return_value = {"SessionId": "test-id"}
@@ -58,14 +60,15 @@ class TestSSMSession:
             with session:
                 pass
 
-    @patch("src.session.subprocess.Popen")
-    @patch("src.session.socket.socket")
+    @patch("ssmports.session.subprocess.Popen")
+    @patch("ssmports.session.socket.socket")
     def test_enter_connection_check_success(self, mock_socket_class, mock_popen):
         mock_ssm = MagicMock()
         mock_ssm.start_session.return_value = {"SessionId": "test-id"}
         mock_ssm.meta.region_name = "us-east-1"
         mock_ssm.meta.endpoint_url = "https://ssm.us-east-1.amazonaws.com"
         mock_proc = MagicMock()
+        mock_proc.stdout.readline.return_value = b""
         mock_proc.poll.return_value = None
         mock_popen.return_value = mock_proc
         mock_sock = MagicMock()
@@ -75,6 +78,7 @@ class TestSSMSession:
         session = SSMSession(
             mock_ssm,
             logger=MagicMock(),
+            readiness="probe",
             Target="i-123",
             Parameters={"localPortNumber": ["8080"]},
         )
@@ -83,9 +87,9 @@ class TestSSMSession:
 
         mock_sock.connect_ex.assert_called_with(("127.0.0.1", 8080))
 
-    @patch("src.session.subprocess.Popen")
-    @patch("src.session.socket.socket")
-    @patch("src.session.time.perf_counter")
+    @patch("ssmports.session.subprocess.Popen")
+    @patch("ssmports.session.socket.socket")
+    @patch("ssmports.session.time.perf_counter")
     def test_enter_connection_check_timeout(
         self, mock_perf_counter, mock_socket_class, mock_popen
     ):
@@ -94,6 +98,7 @@ class TestSSMSession:
         mock_ssm.meta.region_name = "us-east-1"
         mock_ssm.meta.endpoint_url = "https://ssm.us-east-1.amazonaws.com"
         mock_proc = MagicMock()
+        mock_proc.stdout.readline.return_value = b""
         mock_proc.poll.return_value = None
         mock_popen.return_value = mock_proc
         mock_sock = MagicMock()
@@ -113,6 +118,7 @@ class TestSSMSession:
         session = SSMSession(
             mock_ssm,
             logger=MagicMock(),
+            readiness="probe",
             timeout=60,
             Target="i-123",
             Parameters={"localPortNumber": ["8080"]},
@@ -121,8 +127,8 @@ class TestSSMSession:
             with session:
                 pass
 
-    @patch("src.session.subprocess.Popen")
-    @patch("src.session.socket.socket")
+    @patch("ssmports.session.subprocess.Popen")
+    @patch("ssmports.session.socket.socket")
     def test_enter_process_dies_during_check(self, mock_socket_class, mock_popen):
         mock_ssm = MagicMock()
         mock_ssm.start_session.return_value = {"SessionId": "test-id"}
@@ -130,7 +136,7 @@ class TestSSMSession:
         mock_ssm.meta.endpoint_url = "https://ssm.us-east-1.amazonaws.com"
         mock_proc = MagicMock()
         mock_proc.poll.side_effect = [None, 1]  # Dies
-        mock_proc.communicate.return_value = (b"Error output", None)
+        mock_proc.stdout.readline.side_effect = [b"Error output\n", b""]
         mock_popen.return_value = mock_proc
         mock_sock = MagicMock()
         mock_sock.connect_ex.return_value = 1
@@ -139,6 +145,7 @@ class TestSSMSession:
         session = SSMSession(
             mock_ssm,
             logger=MagicMock(),
+            readiness="probe",
             Target="i-123",
             Parameters={"localPortNumber": ["8080"]},
         )
@@ -148,7 +155,107 @@ class TestSSMSession:
             with session:
                 pass
 
-    @patch("src.session.subprocess.Popen")
+    @patch("ssmports.session.subprocess.Popen")
+    @patch("ssmports.session.socket.socket")
+    def test_enter_output_ready(self, mock_socket_class, mock_popen):
+        mock_ssm = MagicMock()
+        mock_ssm.start_session.return_value = {"SessionId": "test-id"}
+        mock_proc = MagicMock()
+        mock_proc.stdout.readline.side_effect = [
+            b"Starting session with SessionId: test-id\n",
+            b"Port 8080 opened for sessionId test-id.\n",
+            b"Waiting for connections...\n",
+            b"",
+        ]
+        mock_popen.return_value = mock_proc
+
+        session = SSMSession(
+            mock_ssm,
+            logger=MagicMock(),
+            Target="i-123",
+            Parameters={"localPortNumber": ["8080"]},
+        )
+        with session:
+            assert session.ready_time is not None
+
+        assert session.probe_count == 0
+        mock_socket_class.assert_not_called()
+
+    @patch("ssmports.session.subprocess.Popen")
+    def test_metrics(self, mock_popen):
+        mock_ssm = MagicMock()
+        mock_ssm.start_session.return_value = {"SessionId": "test-id"}
+        mock_ssm.terminate_session.side_effect = RuntimeError("boom")
+        mock_proc = MagicMock()
+        mock_proc.stdout.readline.side_effect = [b"Waiting for connections...\n", b""]
+        mock_popen.return_value = mock_proc
+
+        session = SSMSession(
+            mock_ssm,
+            logger=MagicMock(),
+            label="metrics-test",
+            Target="i-123",
+            Parameters={"localPortNumber": ["8080"]},
+        )
+        with pytest.raises(RuntimeError):
+            with session:
+                assert metrics.plugin_processes[mock_proc.pid] == "metrics-test"
+
+        assert mock_proc.pid not in metrics.plugin_processes
+        for histogram in (
+            metrics.START_SESSION_SECONDS,
+            metrics.PLUGIN_SPAWN_SECONDS,
+            metrics.READINESS_SECONDS,
+        ):
+            counts, _ = histogram.get(label="metrics-test")
+            assert counts[-1] == 1
+        assert metrics.TERMINATE_FAILURES.get(label="metrics-test") == 1
+
+    @patch("ssmports.session.subprocess.Popen")
+    def test_enter_output_error_marker(self, mock_popen):
+        mock_ssm = MagicMock()
+        mock_ssm.start_session.return_value = {"SessionId": "test-id"}
+        mock_proc = MagicMock()
+        mock_proc.stdout.readline.side_effect = [
+            b"Cannot perform start session: EOF\n",
+            b"",
+        ]
+        mock_popen.return_value = mock_proc
+
+        session = SSMSession(
+            mock_ssm,
+            logger=MagicMock(),
+            Target="i-123",
+            Parameters={"localPortNumber": ["8080"]},
+        )
+        with pytest.raises(
+            SSMPortForwardError, match="Cannot perform start session: EOF"
+        ):
+            with session:
+                pass
+        mock_ssm.terminate_session.assert_called_once_with(SessionId="test-id")
+
+    @patch("ssmports.session.subprocess.Popen")
+    def test_enter_output_process_exits(self, mock_popen):
+        mock_ssm = MagicMock()
+        mock_ssm.start_session.return_value = {"SessionId": "test-id"}
+        mock_proc = MagicMock()
+        mock_proc.stdout.readline.side_effect = [b"Error output\n", b""]
+        mock_popen.return_value = mock_proc
+
+        session = SSMSession(
+            mock_ssm,
+            logger=MagicMock(),
+            Target="i-123",
+            Parameters={"localPortNumber": ["8080"]},
+        )
+        with pytest.raises(
+            SSMPortForwardError, match="session-manager-plugin exited: Error output"
+        ):
+            with session:
+                pass
+
+    @patch("ssmports.session.subprocess.Popen")
     def test_exit_terminate_success(self, mock_popen):
         mock_ssm = MagicMock()
         mock_proc = MagicMock()
@@ -165,7 +272,7 @@ class TestSSMSession:
         mock_proc.wait.assert_called_once_with(timeout=5)
         mock_ssm.terminate_session.assert_called_once_with(SessionId="test-id")
 
-    @patch("src.session.subprocess.Popen")
+    @patch("ssmports.session.subprocess.Popen")
     def test_exit_kill_on_timeout(self, mock_popen):
         mock_ssm = MagicMock()
         mock_proc = MagicMock()
@@ -182,6 +289,64 @@ class TestSSMSession:
         mock_proc.kill.assert_called_once()
         mock_ssm.terminate_session.assert_called_once_with(SessionId="test-id")
 
+    @patch("ssmports.session.subprocess.Popen")
+    def test_output_is_drained_after_ready(self, mock_popen):
+        mock_ssm = MagicMock()
+        mock_ssm.start_session.return_value = {"SessionId": "test-id"}
+        mock_proc = MagicMock()
+        mock_proc.stdout.readline.side_effect = [
+            b"Waiting for connections...\n",
+            *[f"Connection accepted for session {i}\n".encode() for i in range(500)],
+            b"",
+        ]
+        mock_popen.return_value = mock_proc
+
+        session = SSMSession(
+            mock_ssm,
+            logger=MagicMock(),
+            output_lines=10,
+            Target="i-123",
+            Parameters={"localPortNumber": ["8080"]},
+        )
+        with session:
+            session.output_pump.join(timeout=5)
+            assert session.output_pump.total_lines == 501
+            assert session.recent_output(2) == [
+                "Connection accepted for session 498",
+                "Connection accepted for session 499",
+            ]
+            assert len(session.recent_output()) == 10
+
+    @patch("ssmports.session.subprocess.Popen")
+    def test_resume(self, mock_popen):
+        mock_ssm = MagicMock()
+        mock_ssm.resume_session.return_value = {
+            "SessionId": "test-id",
+            "TokenValue": "new-token",
+            "StreamUrl": "wss://new-stream",
+            "ResponseMetadata": {},
+        }
+        old_proc = MagicMock()
+        new_proc = MagicMock()
+        new_proc.stdout.readline.return_value = b""
+        mock_popen.return_value = new_proc
+
+        session = SSMSession(mock_ssm, logger=MagicMock(), check_connection=False)
+        session.session = {"SessionId": "test-id", "TokenValue": "old-token"}
+        session.proc = old_proc
+        session.resume()
+
+        old_proc.terminate.assert_called_once()
+        mock_ssm.resume_session.assert_called_once_with(SessionId="test-id")
+        args, _ = mock_popen.call_args
+        assert json.loads(args[0][1]) == {
+            "SessionId": "test-id",
+            "TokenValue": "new-token",
+            "StreamUrl": "wss://new-stream",
+        }
+        assert session.proc is new_proc
+        mock_ssm.terminate_session.assert_not_called()
+
     def test_log_with_label(self, capsys):
         mock_ssm = MagicMock()
         mock_logger = MagicMock()
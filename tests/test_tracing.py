@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ssmports import tracing
+from ssmports.forwarder import SSMPortForwarder
+
+
+class TestTracer:
+    @pytest.fixture
+    def tracer(self):
+        return tracing.Tracer()
+
+    def test_nested_spans(self, tracer):
+        with tracer.span("connection.start", label="DB", profile=None) as root:
+            with tracer.span("ssm.start_session", target="i-123") as child:
+                assert tracing.current_span() is child
+            root.set(session_id="s-1")
+        assert tracing.current_span() is None
+
+        assert [span.name for span in tracer.finished_spans()] == [
+            "ssm.start_session",
+            "connection.start",
+        ]
+        assert child.trace_id == root.trace_id
+        assert child.parent_id == root.span_id
+        assert root.parent_id is None
+        assert root.attributes == {"label": "DB", "session_id": "s-1"}
+        assert root.duration >= child.duration >= 0
+
+    def test_error_is_recorded(self, tracer):
+        with pytest.raises(ValueError):
+            with tracer.span("ecs.resolve"):
+                raise ValueError("Task name 'web' not found")
+        assert tracer.finished_spans()[0].error == "Task name 'web' not found"
+
+    def test_separate_traces(self, tracer):
+        with tracer.span("connection.start"):
+            pass
+        with tracer.span("connection.start"):
+            pass
+        first, second = tracer.finished_spans()
+        assert first.trace_id != second.trace_id
+
+    def test_max_spans(self):
+        tracer = tracing.Tracer(max_spans=2)
+        for name in ("a", "b", "c"):
+            with tracer.span(name):
+                pass
+        assert [span.name for span in tracer.finished_spans()] == ["b", "c"]
+
+    def test_formats(self, tracer):
+        with tracer.span("connection.start", label="DB"):
+            with tracer.span("plugin.exec"):
+                pass
+        lines = [json.loads(line) for line in tracer.json_lines().splitlines()]
+        assert [line["name"] for line in lines] == ["plugin.exec", "connection.start"]
+        assert lines[1]["attributes"] == {"label": "DB"}
+
+        events = tracer.chrome_trace()["traceEvents"]
+        complete = [event for event in events if event["ph"] == "X"]
+        assert [event["name"] for event in complete] == [
+            "plugin.exec",
+            "connection.start",
+        ]
+        assert complete[1]["args"]["label"] == "DB"
+        assert complete[1]["dur"] >= complete[0]["dur"]
+        assert any(event["name"] == "thread_name" for event in events)
+
+    def test_export(self, tracer):
+        with tracer.span("connection.start"):
+            pass
+        with tempfile.TemporaryDirectory() as temp_dir:
+            jsonl = os.path.join(temp_dir, "trace.jsonl")
+            chrome = os.path.join(temp_dir, "trace.json")
+            tracer.export(jsonl)
+            tracer.export(chrome)
+            with open(jsonl) as f:
+                assert json.loads(f.readline())["name"] == "connection.start"
+            with open(chrome) as f:
+                assert "traceEvents" in json.load(f)
+
+    @patch("ssmports.forwarder.SSMSession")
+    def test_forwarder_threads_continue_the_trace(self, mock_ssm_session):
+        parents = []
+
+        def create_session(*args, **kwargs):
+            parents.append(tracing.current_span())
+            session = MagicMock()
+            session.__enter__.return_value.session = {"SessionId": "s-1"}
+            session.__enter__.return_value.proc.poll.return_value = None
+            return session
+
+        mock_ssm_session.side_effect = create_session
+        forwarder = SSMPortForwarder()
+        with tracing.span("connection.start", label="DB") as root:
+            forwarder.start_session(MagicMock(), "DB", local_port=5432)
+        forwarder.stop_session("s-1", wait=True)
+        assert parents == [root]